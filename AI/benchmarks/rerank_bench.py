@@ -0,0 +1,126 @@
+# rerank_bench.py (LLM reranker vs lexical reranker: 지연시간 + 순위 겹침 비교)
+#
+# 실행 (AI/ 디렉터리, .env에 watsonx 자격 증명 필요):
+#   uv run python benchmarks/rerank_bench.py
+#   uv run python benchmarks/rerank_bench.py --limit 30 --top-n 5
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+
+AI_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_DIR))
+
+from src.mediguide_rag.rag_pipeline import (  # noqa: E402
+    CANDIDATE_K,
+    FINAL_K,
+    INDEX_ROOT,
+    LEXICAL_RERANK_WEIGHT,
+    LexicalReranker,
+    LLMReranker,
+    _build_embeddings,
+    _build_rerank_llm,
+    _build_vectorstore,
+    _doc_key,
+    _index_dirs,
+    _retrieve_candidates_with_scores,
+    read_current,
+)
+
+WORKBOOKS = [
+    AI_DIR / "test-data.xlsx",
+    AI_DIR / "src" / "mediguide_rag" / "test-data2.xlsx",
+]
+
+
+def load_queries(limit: int) -> List[str]:
+    """테스트 워크북에서 사용자 질문 형태의 질의를 만든다."""
+    queries: List[str] = []
+    for path in WORKBOOKS:
+        if not path.exists():
+            continue
+        df = pd.read_excel(path)
+        for row in df.itertuples(index=False):
+            rec = row._asdict()
+            title = rec.get("title")
+            if pd.notna(title) and title:
+                queries.append(f"{title} 판례 알려줘")
+                continue
+            vals = [str(v) for v in rec.values() if pd.notna(v)]
+            # test-data.xlsx: (Case, 진료과목, 시술명, 증상, ...) → "시술명 후 증상 사례"
+            if len(vals) >= 4:
+                queries.append(f"{vals[2]} 후 {vals[3]} 사례 있어?")
+    return queries[:limit]
+
+
+def pct(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(q * (len(s) - 1))))]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--limit", type=int, default=50)
+    ap.add_argument("--top-n", type=int, default=FINAL_K)
+    args = ap.parse_args()
+
+    queries = load_queries(args.limit)
+    print(f"🔹 queries={len(queries)} candidate_k={CANDIDATE_K} top_n={args.top_n}")
+
+    chroma_dir, _, numpy_dir = _index_dirs(read_current(INDEX_ROOT))
+    vectorstore = _build_vectorstore(_build_embeddings(), chroma_dir, numpy_dir)
+    llm_reranker = LLMReranker(_build_rerank_llm())
+    lexical_reranker = LexicalReranker(weight=LEXICAL_RERANK_WEIGHT)
+
+    llm_ms: List[float] = []
+    lex_ms: List[float] = []
+    overlaps: List[float] = []
+    top1_agree = 0
+    llm_failures = 0
+
+    for q in queries:
+        pairs = _retrieve_candidates_with_scores(vectorstore, q, k=CANDIDATE_K)
+        docs = [d for d, _ in pairs]
+        scores = [s for _, s in pairs]
+        if not docs:
+            continue
+
+        t0 = time.perf_counter()
+        a = llm_reranker.rerank_indices(q, docs, scores, args.top_n)
+        llm_ms.append((time.perf_counter() - t0) * 1000)
+        if not a:
+            llm_failures += 1
+            a = list(range(min(args.top_n, len(docs))))
+
+        t0 = time.perf_counter()
+        b = lexical_reranker.rerank_indices(q, docs, scores, args.top_n)
+        lex_ms.append((time.perf_counter() - t0) * 1000)
+
+        ka = {_doc_key(docs[i]) for i in a}
+        kb = {_doc_key(docs[i]) for i in b}
+        overlaps.append(len(ka & kb) / max(1, min(len(ka), len(kb))))
+        top1_agree += int(a[0] == b[0])
+
+    n = len(overlaps)
+    if n == 0:
+        print("❌ 비교할 결과가 없습니다. (인덱스/자격 증명 확인)")
+        return
+
+    print("\n| reranker | p50 ms | p95 ms | mean ms |")
+    print("|---|---|---|---|")
+    for name, ms in (("llm", llm_ms), ("lexical", lex_ms)):
+        print(f"| {name} | {pct(ms, 0.5):.1f} | {pct(ms, 0.95):.1f} | {statistics.mean(ms):.1f} |")
+
+    print(f"\noverlap@{args.top_n} (mean): {statistics.mean(overlaps):.3f}")
+    print(f"top-1 agreement: {top1_agree / n:.3f}")
+    print(f"LLM parse fallback: {llm_failures}/{n}")
+
+
+if __name__ == "__main__":
+    main()
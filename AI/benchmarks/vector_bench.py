@@ -0,0 +1,137 @@
+# vector_bench.py (Chroma HNSW vs numpy exact index: recall@k + 검색 지연시간 비교)
+#
+# 실행 (AI/ 디렉터리, .env에 watsonx 자격 증명 필요 - 질의 임베딩에만 사용):
+#   uv run python benchmarks/vector_bench.py
+#   uv run python benchmarks/vector_bench.py --limit 100 --k 20 --dtype float16
+#
+# 모든 백엔드에 같은 질의 벡터를 넣고 검색 시간만 잰다 (원격 임베딩 시간 제외).
+# numpy float32 결과가 정확(exact) top-k 이므로 recall@k = |backend ∩ numpy float32| / k.
+# --dtype float16|both 이면 float16 인덱스(메모리 절반)의 정밀도/지연시간 trade-off도 같은 기준으로 비교.
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+AI_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_DIR))
+
+from langchain_chroma import Chroma  # noqa: E402
+
+from rerank_bench import load_queries, pct  # noqa: E402
+from src.mediguide_rag.numpy_index import NumpyVectorStore  # noqa: E402
+from src.mediguide_rag.rag_pipeline import (  # noqa: E402
+    CANDIDATE_K,
+    COLLECTION_NAME,
+    INDEX_ROOT,
+    MAX_DISTANCE_THRESHOLD,
+    _build_embeddings,
+    _chroma_fingerprint,
+    _index_dirs,
+    read_current,
+)
+
+Pairs = List[Tuple[object, float]]
+
+
+def _timed(search: Callable[[List[float]], Pairs], vec: List[float], repeat: int, out: List[float]) -> Pairs:
+    result: Pairs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = search(vec)
+        out.append((time.perf_counter() - t0) * 1000)
+    return result
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--limit", type=int, default=50)
+    ap.add_argument("--k", type=int, default=CANDIDATE_K)
+    ap.add_argument("--dtype", choices=["float32", "float16", "both"], default="both",
+                    help="비교할 numpy 인덱스 dtype (float32 exact 기준은 항상 포함)")
+    ap.add_argument("--repeat", type=int, default=5, help="질의당 반복 횟수 (지연시간 안정화)")
+    args = ap.parse_args()
+
+    queries = load_queries(args.limit)
+    embeddings = _build_embeddings()
+    chroma_dir, _, _ = _index_dirs(read_current(INDEX_ROOT))
+    chroma = Chroma(
+        persist_directory=chroma_dir,
+        embedding_function=embeddings,
+        collection_name=COLLECTION_NAME,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dtypes = ["float32"] + (["float16"] if args.dtype in ("float16", "both") else [])
+        stores: Dict[str, NumpyVectorStore] = {}
+        for dtype in dtypes:
+            t0 = time.perf_counter()
+            stores[dtype] = NumpyVectorStore(
+                str(Path(tmp) / dtype),
+                embeddings,
+                source=chroma,
+                source_version=lambda: _chroma_fingerprint(chroma),
+                dtype=dtype,
+            )
+            build_ms = (time.perf_counter() - t0) * 1000
+            print(
+                f"🔹 numpy {dtype}: docs={stores[dtype].count()} space={stores[dtype].meta.get('space')} "
+                f"export+load={build_ms:.0f}ms"
+            )
+        print(f"🔹 queries={len(queries)} k={args.k} repeat={args.repeat}")
+
+        backends: Dict[str, Callable[[List[float]], Pairs]] = {
+            "chroma": lambda v: chroma.similarity_search_by_vector_with_relevance_scores(v, k=args.k),
+        }
+        for dtype, store in stores.items():
+            backends[f"numpy ({dtype})"] = (
+                lambda v, s=store: s.similarity_search_with_score_by_vector(v, k=args.k)
+            )
+
+        vectors = [embeddings.embed_query(q) for q in queries]
+
+        latency: Dict[str, List[float]] = {name: [] for name in backends}
+        recalls: Dict[str, List[float]] = {name: [] for name in backends}
+        top1_agree = {name: 0 for name in backends}
+        gate_agree = {name: 0 for name in backends}
+        max_dist_diff = {name: 0.0 for name in backends}
+        n = 0
+
+        for vec in vectors:
+            results = {name: _timed(fn, vec, args.repeat, latency[name]) for name, fn in backends.items()}
+            exact = results["numpy (float32)"]
+            if not exact:
+                continue
+            n += 1
+            ids_exact = [d.id for d, _ in exact]
+            dist_exact = {d.id: s for d, s in exact}
+            # retrieve()의 거리 gate(top-1 <= MAX_DISTANCE_THRESHOLD) 판정이 같은지
+            gate_exact = exact[0][1] <= MAX_DISTANCE_THRESHOLD
+            for name, pairs in results.items():
+                ids = [d.id for d, _ in pairs]
+                recalls[name].append(len(set(ids) & set(ids_exact)) / len(ids_exact))
+                top1_agree[name] += int(bool(ids) and ids[0] == ids_exact[0])
+                gate_agree[name] += int((bool(pairs) and pairs[0][1] <= MAX_DISTANCE_THRESHOLD) == gate_exact)
+                for d, s in pairs:
+                    if d.id in dist_exact:
+                        max_dist_diff[name] = max(max_dist_diff[name], abs(dist_exact[d.id] - s))
+
+    if n == 0:
+        print("❌ 비교할 결과가 없습니다. (인덱스/자격 증명 확인)")
+        return
+
+    print(f"\n기준: numpy (float32) exact top-{args.k}, gate = top-1 distance <= {MAX_DISTANCE_THRESHOLD}")
+    print("| backend | p50 ms | p95 ms | mean ms | recall@k | top-1 agree | gate agree | max abs dist diff |")
+    print("|---|---|---|---|---|---|---|---|")
+    for name, ms in latency.items():
+        print(
+            f"| {name} | {pct(ms, 0.5):.2f} | {pct(ms, 0.95):.2f} | {statistics.mean(ms):.2f} "
+            f"| {statistics.mean(recalls[name]):.3f} | {top1_agree[name] / n:.3f} "
+            f"| {gate_agree[name] / n:.3f} | {max_dist_diff[name]:.6f} |"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
 # main.py (완성형 리팩토링 v2: answer_with_sources 강제, 세션 전달 확실화, DOC 반복/증식 방지, 스키마 통일)
 import os
-import re
+import asyncio
+import json
 import time
 import uuid
-from typing import Any, Dict, List, Optional
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from langchain_core.messages import AIMessage, HumanMessage
 
@@ -14,25 +17,32 @@ from langchain_core.messages import AIMessage, HumanMessage
 # -------------------------------------------------------------------------
 # [Import] rag_pipeline.py에서 필요한 체인/유틸 가져오기
 #  - 이 main.py는 answer_with_sources()가 "필수"입니다. (근거 불일치/중복검색 방지)
+#  - AdmissionRejected/metrics도 rag_pipeline 모듈에서 가져옴: 경로가 섞이면 같은 모듈이 두 번 로드되어
+#    AdmissionController/metrics 레지스트리가 둘이 되므로 (except가 못 잡거나 /metrics가 비게 됨)
 # -------------------------------------------------------------------------
 try:
-    from rag_pipeline import (
-        get_rag_chain,
-        get_writing_chain,
-        get_router_chain,
+    from src.mediguide_rag.rag_pipeline import (
+        AdmissionRejected,
+        RagEngine,
+        set_engine,
         get_session_history,
+        metrics,
         store,
         answer_with_sources,  # ✅ 필수
+        WRITER_LLM_ID,
     )
 except Exception as e:
     try:
-        from src.mediguide_rag.rag_pipeline import (
-            get_rag_chain,
-            get_writing_chain,
-            get_router_chain,
+        # src/mediguide_rag 디렉터리에서 직접 실행하는 경우
+        from rag_pipeline import (
+            AdmissionRejected,
+            RagEngine,
+            set_engine,
             get_session_history,
+            metrics,
             store,
             answer_with_sources,  # ✅ 필수
+            WRITER_LLM_ID,
         )
     except Exception as e2:
         raise RuntimeError(
@@ -44,10 +54,63 @@ except Exception as e:
         )
 
 
+# -------------------------------------------------------------------------
+# [Warm] 추천 질문 칩 + 상위 질의: startup에서 답변을 미리 계산해 캐시 채움
+#  - WARM_QUERIES: "|"로 구분된 질의 목록
+#  - WARM_QUERIES_FILE: 한 줄에 하나 (로그에서 뽑은 상위 질의 등)
+# -------------------------------------------------------------------------
+SUGGESTED_QUESTIONS = [
+    "백내장 수술 부작용 판례 알려줘",
+    "지금 상담 내용으로 내용증명서 써줘",
+    "의료분쟁조정 신청 방법이 뭐야?",
+    "설명 의무 위반이 인정된 사례 있어?",
+]
+
+WARM_ON_STARTUP = os.getenv("WARM_ON_STARTUP", "1") == "1"
+WARM_QUERIES = [q.strip() for q in os.getenv("WARM_QUERIES", "").split("|") if q.strip()]
+WARM_QUERIES_FILE = os.getenv("WARM_QUERIES_FILE", "")
+
+
+def _load_warm_queries() -> List[str]:
+    queries = SUGGESTED_QUESTIONS + WARM_QUERIES
+    if WARM_QUERIES_FILE:
+        try:
+            with open(WARM_QUERIES_FILE, encoding="utf-8") as f:
+                queries += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        except OSError as e:
+            print(f"⚠️ WARM_QUERIES_FILE 읽기 실패: {e}")
+    return queries
+
+
+# -------------------------------------------------------------------------
+# [Lifespan] RAG 엔진은 프로세스 당 1회만 생성 → 요청마다 주입
+# -------------------------------------------------------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("🚀 AI 엔진 로딩 중...")
+    engine = RagEngine()
+    engine.warmup()
+    set_engine(engine)
+    app.state.engine = engine
+    # ingest.py가 새 스냅샷을 게시(CURRENT 교체)하면 재시작 없이 전환
+    engine.start_index_watcher()
+    if WARM_ON_STARTUP:
+        # 백그라운드 실행: 서버는 바로 요청을 받고, warm 도중 요청은 평소처럼 처리
+        engine.start_warmer(_load_warm_queries())
+    print("✅ 로딩 완료! 서버가 준비되었습니다.")
+    try:
+        yield
+    finally:
+        print("🛑 AI 엔진 종료 중...")
+        set_engine(None)
+        engine.shutdown()
+        store.close()
+
+
 # -------------------------------------------------------------------------
 # [Setup] FastAPI 앱 초기화
 # -------------------------------------------------------------------------
-app = FastAPI(title="MediGuide AI Server", version="1.1.0")
+app = FastAPI(title="MediGuide AI Server", version="1.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -57,14 +120,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# -------------------------------------------------------------------------
-# [Loading] AI 모델 체인 로드
-# -------------------------------------------------------------------------
-print("🚀 AI 모델 체인 로딩 중...")
-rag_chain = get_rag_chain()
-writing_chain = get_writing_chain()
-router_chain = get_router_chain()
-print("✅ 로딩 완료! 서버가 준비되었습니다.")
+
+def get_engine(request: Request) -> RagEngine:
+    """startup에서 만든 엔진을 엔드포인트에 주입 (Depends)"""
+    return request.app.state.engine
 
 
 # -------------------------------------------------------------------------
@@ -72,6 +131,8 @@ print("✅ 로딩 완료! 서버가 준비되었습니다.")
 # -------------------------------------------------------------------------
 MAX_QUERY_CHARS = 2500  # 프론트에서도 제한 권장
 
+DOC_DONE_ANSWER = "요청하신 사항을 반영하여 문서를 작성했습니다. 아래 내용을 확인해주세요."
+
 class Question(BaseModel):
     query: str = Field(..., description="User input")
     session_id: str = Field("default_user", description="Session identifier")
@@ -93,6 +154,7 @@ class ChatResponse(BaseModel):
     mode: Optional[str] = None  # "SOLUTION" | "INTERVIEW"
     sources: List[SourceItem] = []
     latency_ms: int
+    cached: bool = False  # semantic answer cache hit 여부
 
 
 # -------------------------------------------------------------------------
@@ -143,72 +205,153 @@ def _build_sources_from_docs(docs: List[Any], preview_chars: int = 220) -> List[
         )
     return sources
 
-_DOC_LIKE_PATTERNS = [
-    r"^제목:\s*의료과실",
-    r"\b신청인\b",
-    r"\b피신청인\b",
-    r"\b의료분쟁\s*조정신청서\b",
-    r"\b손해배상\s*청구\b",
-    r"\b증거\s*자료\b",
-    r"\b요청\s*사항\b",
-    r"\[작성일\]",
-    r"문서 작성을 위해 아래 정보가 추가로 필요합니다",
-]
-
-def _is_doc_like_ai_message(text: str) -> bool:
-    """
-    Writer가 만든 '문서 본문'이 히스토리에 누적되면,
-    다음 문서 요청에서 반복/증식 문제가 생김 → Writer 입력에서 제외.
-    """
-    t = (text or "").strip()
-    if len(t) < 200:
-        return False
-    for p in _DOC_LIKE_PATTERNS:
-        if re.search(p, t, flags=re.IGNORECASE | re.MULTILINE):
-            return True
-    # 너무 긴 텍스트는 문서일 확률 높음
-    if len(t) > 2500:
-        return True
-    return False
-
-def _history_to_text_for_writer(session_id: str, max_turns: int = 14) -> str:
+async def _history_to_text_for_writer(session_id: str, max_turns: int = 14) -> str:
     """
     Writer에 넣을 히스토리를 "상담 중심"으로 정리.
-    - AI 문서 결과(DOC-like)는 제외
+    - AI 문서 결과(DOC-like)는 제외 (append 시점에 태깅된 결과 사용)
     - 최근 max_turns 턴만 사용
+    - 세션별로 블록을 캐시해 두고 새로 추가된 메시지만 처리
     """
-    history = get_session_history(session_id)
-    if not history.messages:
-        return "이전 대화 기록 없음."
+    state = store.state(session_id)
+    transcript = state.transcript
+    transcript.update(await state.history.aget_messages())
+    store.refresh_aux_bytes(session_id)
+    text = transcript.render(max_turns)
+    return text if text else "이전 대화 기록 없음."
+
+async def _build_writer_context(session_id: str, query: str) -> str:
+    history_text = await _history_to_text_for_writer(session_id=session_id, max_turns=14)
+
+    # ✅ “🔴 현재 상태” 같은 반복 토큰을 매번 누적하지 않도록, 입력 구조를 고정
+    return (
+        f"[상담 요약/대화 내역]\n{history_text}\n\n"
+        f"[의뢰인의 현재 요청(최우선)]\n{query}\n"
+    )
 
-    # 최근 N개만
-    msgs = history.messages[-max_turns:] if len(history.messages) > max_turns else history.messages
+async def _try_revise_document(
+    engine: RagEngine, session_id: str, query: str, request_id: str
+) -> Optional[Dict[str, Any]]:
+    """
+    직전 문서에 대한 부분 수정 요청이면 해당 섹션만 다시 써서 반환, 아니면 None(writer 전체 재생성).
+    """
+    try:
+        revised = await engine.arevise_document(session_id, query)
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        print(f"⚠️ [{request_id}] 문서 부분 수정 실패 → 전체 재작성: {e}")
+        return None
+    if revised:
+        print(
+            f"✂️ [{request_id}] 문서 부분 수정 sections={revised['sections']} "
+            f"({revised['timings']['revise_ms']}ms)"
+        )
+    return revised
 
-    lines: List[str] = []
-    turn_idx = 0
-    for msg in msgs:
-        role = "의뢰인" if msg.type == "human" else "변호사"
+def _ensure_session(session_id: str) -> None:
+    _ = get_session_history(session_id)
 
-        # ✅ AI 문서 결과는 제외 (반복/증식 방지)
-        if msg.type != "human" and _is_doc_like_ai_message(msg.content):
-            continue
 
-        turn_idx += 1
-        lines.append(f"### Turn {turn_idx} ({role})\n{msg.content}\n")
+# -------------------------------------------------------------------------
+# Request-scoped cancellation + 세션 단위 직렬화
+#  - 같은 session_id의 턴은 세션 lock으로 한 번에 하나만 실행 (history/문진 턴 경쟁 방지)
+#  - SESSION_CONCURRENCY_POLICY: 진행 중인 요청이 있을 때 새 요청 처리 방식
+#      supersede(기본): 이전 요청 취소 → 정리가 끝나면 새 요청 실행
+#      queue: 이전 요청이 끝날 때까지 대기 후 순서대로 실행
+#      reject: 409로 즉시 거절
+#  - 클라이언트 연결이 끊기면 진행 중인 router/rerank/answer/writer 호출을 취소
+#  - 취소되면 세션 슬롯(_inflight)이 즉시 비워지고, 취소 사유별로 metrics 집계
+# -------------------------------------------------------------------------
+DISCONNECT_POLL_SEC = float(os.getenv("DISCONNECT_POLL_SEC", "0.5"))
+SESSION_CONCURRENCY_POLICY = os.getenv("SESSION_CONCURRENCY_POLICY", "supersede").strip().lower()
+if SESSION_CONCURRENCY_POLICY not in ("supersede", "queue", "reject"):
+    raise RuntimeError(
+        f"알 수 없는 SESSION_CONCURRENCY_POLICY={SESSION_CONCURRENCY_POLICY} (supersede|queue|reject)"
+    )
 
-    return "\n".join(lines) if lines else "이전 대화 기록 없음."
+SESSION_BUSY_DETAIL = "같은 세션의 이전 요청을 처리 중입니다."
 
-def _ensure_session(session_id: str) -> None:
-    _ = get_session_history(session_id)
+_inflight: Dict[str, asyncio.Task] = {}
+
+def _cancel_inflight(task: asyncio.Task, reason: str) -> None:
+    if task.done():
+        return
+    task.cancel(msg=reason)
+    metrics.inc("chat_cancelled_total", reason=reason)
+
+def _cancel_reason(e: BaseException) -> str:
+    return str(e.args[0]) if e.args else "unknown"
+
+def _register_inflight(session_id: str, task: asyncio.Task) -> None:
+    prev = _inflight.get(session_id)
+    if prev is not None and prev is not task and SESSION_CONCURRENCY_POLICY == "supersede":
+        _cancel_inflight(prev, "superseded")
+    _inflight[session_id] = task
+
+    def _release(t: asyncio.Task) -> None:
+        if _inflight.get(session_id) is t:
+            del _inflight[session_id]
+
+    task.add_done_callback(_release)
+
+# session_id -> [lock, 참조 수] (참조가 없어지면 제거 → 세션 수만큼 쌓이지 않음)
+_session_locks: Dict[str, List[Any]] = {}
+
+def _session_busy(session_id: str) -> bool:
+    entry = _session_locks.get(session_id)
+    return entry is not None and entry[0].locked()
+
+def _reject_if_busy(session_id: str) -> None:
+    if SESSION_CONCURRENCY_POLICY == "reject" and _session_busy(session_id):
+        metrics.inc("session_turns_total", result="rejected")
+        raise HTTPException(status_code=409, detail=SESSION_BUSY_DETAIL)
+
+@asynccontextmanager
+async def _session_turn(session_id: str) -> AsyncIterator[None]:
+    """
+    세션 턴 1개 구간. reject 정책이면 이미 실행 중일 때 409,
+    그 외에는 lock 대기 (supersede는 이전 요청이 이미 취소 중이므로 금방 풀림).
+    """
+    _reject_if_busy(session_id)
+
+    entry = _session_locks.setdefault(session_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        queued = entry[0].locked()
+        async with entry[0]:
+            metrics.inc("session_turns_total", result="queued" if queued else "immediate")
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0 and _session_locks.get(session_id) is entry:
+            del _session_locks[session_id]
+
+def _admission_http_error(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=f"AI 모델 요청이 많습니다. {e.retry_after}초 후 다시 시도해주세요.",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+async def _cancel_on_disconnect(http_request: Request, task: asyncio.Task) -> None:
+    while not task.done():
+        if await http_request.is_disconnected():
+            _cancel_inflight(task, "disconnect")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SEC)
 
 
 # -------------------------------------------------------------------------
 # [API] 통합 채팅 엔드포인트
+#  - router: 규칙 분류기 fast path, 애매할 때만 LLM 라우터
+#  - router/writer/RAG 모두 ainvoke → 이벤트 루프를 막지 않음 (/history 등 동시 처리)
 #  - CHAT: answer_with_sources()만 사용 (중복검색/근거 불일치 제거)
 #  - DOC: writer 입력에서 문서 결과 제거 + 세션 저장 안정화
 # -------------------------------------------------------------------------
 @app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: Question):
+async def chat_endpoint(
+    request: Question, http_request: Request, engine: RagEngine = Depends(get_engine)
+):
     request_id = str(uuid.uuid4())
     t0 = time.perf_counter()
 
@@ -217,15 +360,75 @@ async def chat_endpoint(request: Question):
 
     print(f"\n📩 [{request_id}] Session={session_id} | Query={query}")
 
+    _reject_if_busy(session_id)
+
+    task = asyncio.create_task(_handle_chat(engine, query, session_id, request_id, t0))
+    _register_inflight(session_id, task)
+    watcher = asyncio.create_task(_cancel_on_disconnect(http_request, task))
+    try:
+        return await task
+    except asyncio.CancelledError as e:
+        if task.cancelled():
+            reason = _cancel_reason(e)
+            print(f"🛑 [{request_id}] 요청 취소 ({reason})")
+            if reason == "superseded":
+                raise HTTPException(status_code=409, detail="같은 세션의 새 요청으로 대체되었습니다.")
+            raise HTTPException(status_code=499, detail="클라이언트 연결이 끊어졌습니다.")
+        raise
+    finally:
+        watcher.cancel()
+        if not task.done():
+            _cancel_inflight(task, "handler_cancelled")
+
+
+async def _handle_chat(
+    engine: RagEngine, query: str, session_id: str, request_id: str, t0: float
+) -> Dict[str, Any]:
+    async with _session_turn(session_id):
+        try:
+            return await _handle_chat_turn(engine, query, session_id, request_id, t0)
+        except AdmissionRejected as e:
+            print(f"🚦 [{request_id}] LLM 포화 ({e.model_id}) → 429 retry_after={e.retry_after}s")
+            raise _admission_http_error(e)
+
+
+async def _handle_chat_turn(
+    engine: RagEngine, query: str, session_id: str, request_id: str, t0: float
+) -> Dict[str, Any]:
+
     # 세션 히스토리 항상 준비
     _ensure_session(session_id)
 
+    # 0) 첫 턴 semantic answer cache (hit면 router/검색/rerank/생성 LLM 모두 생략)
+    try:
+        cached = await engine.acached_answer(query, session_id)
+    except Exception as e:
+        print(f"⚠️ [{request_id}] answer cache 조회 실패: {e}")
+        cached = None
+    if cached:
+        latency_ms = int((time.perf_counter() - t0) * 1000)
+        print(
+            f"⚡ [{request_id}] answer cache hit mode={cached['mode']} "
+            f"sim={cached['similarity']:.3f} total={latency_ms}ms"
+        )
+        return {
+            "request_id": request_id,
+            "session_id": session_id,
+            "type": "chat",
+            "answer": cached["answer"],
+            "document_content": None,
+            "mode": cached["mode"],
+            "sources": _build_sources_from_docs(cached.get("docs", [])),
+            "latency_ms": latency_ms,
+            "cached": True,
+        }
+
     # 1) Router
     try:
-        t_router0 = time.perf_counter()
-        intent = router_chain.invoke({"question": query}).strip().upper()
-        t_router1 = time.perf_counter()
-        print(f"🤖 [{request_id}] Router={intent} ({int((t_router1-t_router0)*1000)}ms)")
+        # 라우터와 후보 검색을 동시에 시작 (CHAT이면 검색 결과를 이어서 사용)
+        route, prefetch = await engine.aroute_speculative(query, session_id)
+        intent = route["intent"]
+        print(f"🤖 [{request_id}] Router={intent} via={route['source']} ({route['router_ms']}ms)")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Router 오류: {str(e)}")
 
@@ -236,22 +439,21 @@ async def chat_endpoint(request: Question):
         print(f"📝 [{request_id}] 문서 작성 모드 진입")
 
         try:
-            history_text = _history_to_text_for_writer(session_id=session_id, max_turns=14)
-
-            # ✅ “🔴 현재 상태” 같은 반복 토큰을 매번 누적하지 않도록, 입력 구조를 고정
-            full_context = (
-                f"[상담 요약/대화 내역]\n{history_text}\n\n"
-                f"[의뢰인의 현재 요청(최우선)]\n{query}\n"
-            )
-
             t_doc0 = time.perf_counter()
-            document_content = writing_chain.invoke({"chat_history": full_context})
+            revised = await _try_revise_document(engine, session_id, query, request_id)
+            if revised:
+                document_content = revised["document"]
+            else:
+                full_context = await _build_writer_context(session_id, query)
+                async with engine.admission.slot(WRITER_LLM_ID):
+                    document_content = await engine.writing_chain.ainvoke({"chat_history": full_context})
             t_doc1 = time.perf_counter()
 
             # ✅ 메모리 저장: 항상 저장되도록
             hist = get_session_history(session_id)
-            hist.add_message(HumanMessage(content=query))
-            hist.add_message(AIMessage(content=document_content))
+            await hist.aadd_messages(
+                [HumanMessage(content=query), AIMessage(content=document_content)]
+            )
 
             latency_ms = int((time.perf_counter() - t0) * 1000)
             print(
@@ -263,14 +465,14 @@ async def chat_endpoint(request: Question):
                 "request_id": request_id,
                 "session_id": session_id,
                 "type": "document",
-                "answer": "요청하신 사항을 반영하여 문서를 작성했습니다. 아래 내용을 확인해주세요.",
+                "answer": DOC_DONE_ANSWER,
                 "document_content": document_content,
                 "mode": None,
                 "sources": [],
                 "latency_ms": latency_ms,
             }
 
-        except HTTPException:
+        except (HTTPException, AdmissionRejected):
             raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"DOC 처리 중 오류: {str(e)}")
@@ -283,7 +485,9 @@ async def chat_endpoint(request: Question):
     try:
         # ✅ 단일 진실 소스: rag_pipeline에서 최종 mode/docs를 함께 반환
         t_rag0 = time.perf_counter()
-        out = answer_with_sources(query, session_id=session_id)
+        out = await engine.aanswer_with_sources(
+            query, session_id=session_id, prefetched=prefetch
+        )
         t_rag1 = time.perf_counter()
 
         answer = (out or {}).get("answer", "") or ""
@@ -304,9 +508,11 @@ async def chat_endpoint(request: Question):
         _ensure_session(session_id)
 
         latency_ms = int((time.perf_counter() - t0) * 1000)
+        timings = {"router_ms": route["router_ms"], **((out or {}).get("timings", {}) or {})}
         print(
             f"✅ [{request_id}] RAG 완료 mode={mode} "
-            f"rag={int((t_rag1-t_rag0)*1000)}ms total={latency_ms}ms sources={len(sources)}"
+            f"rag={int((t_rag1-t_rag0)*1000)}ms total={latency_ms}ms sources={len(sources)} "
+            f"stages={timings}"
         )
 
         return {
@@ -320,25 +526,239 @@ async def chat_endpoint(request: Question):
             "latency_ms": latency_ms,
         }
 
-    except HTTPException:
+    except (HTTPException, AdmissionRejected):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"CHAT 처리 중 오류: {str(e)}")
 
 
+# -------------------------------------------------------------------------
+# [API] 스트리밍 채팅 (SSE: POST /chat/stream, WebSocket: /ws/chat)
+#  - meta(intent/type/mode/sources) → token(delta)... → done(latency_ms) 순서
+#  - CHAT은 검색/rerank가 끝나는 즉시 meta(sources)를 먼저 보냄
+# -------------------------------------------------------------------------
+async def _chat_events(
+    engine: RagEngine, query: str, session_id: str, request_id: str
+) -> AsyncIterator[Dict[str, Any]]:
+    """세션 lock으로 턴을 직렬화하고, 409/429는 error 이벤트(status 포함)로 변환"""
+    base = {"request_id": request_id, "session_id": session_id}
+    try:
+        async with _session_turn(session_id):
+            async for ev in _chat_turn_events(engine, query, session_id, request_id):
+                yield ev
+    except HTTPException as e:
+        yield {"event": "error", **base, "status": e.status_code, "detail": e.detail}
+    except AdmissionRejected as e:
+        print(f"🚦 [{request_id}] (stream) LLM 포화 ({e.model_id}) retry_after={e.retry_after}s")
+        yield {
+            "event": "error",
+            **base,
+            "status": 429,
+            "retry_after": e.retry_after,
+            "detail": _admission_http_error(e).detail,
+        }
+
+
+async def _chat_turn_events(
+    engine: RagEngine, query: str, session_id: str, request_id: str
+) -> AsyncIterator[Dict[str, Any]]:
+    t0 = time.perf_counter()
+    base = {"request_id": request_id, "session_id": session_id}
+
+    print(f"\n📩 [{request_id}] (stream) Session={session_id} | Query={query}")
+    _ensure_session(session_id)
+
+    try:
+        cached = await engine.acached_answer(query, session_id)
+    except Exception as e:
+        print(f"⚠️ [{request_id}] answer cache 조회 실패: {e}")
+        cached = None
+    if cached:
+        yield {
+            "event": "meta",
+            **base,
+            "intent": "CHAT",
+            "type": "chat",
+            "mode": cached["mode"],
+            "sources": _build_sources_from_docs(cached.get("docs", [])),
+            "cached": True,
+        }
+        yield {"event": "token", "delta": cached["answer"]}
+        yield {
+            "event": "done",
+            **base,
+            "type": "chat",
+            "mode": cached["mode"],
+            "latency_ms": int((time.perf_counter() - t0) * 1000),
+            "cached": True,
+        }
+        return
+
+    try:
+        route, prefetch = await engine.aroute_speculative(query, session_id)
+        intent = route["intent"]
+    except Exception as e:
+        yield {"event": "error", **base, "detail": f"Router 오류: {str(e)}"}
+        return
+
+    # [Case A] DOC: 작성 시작 전에 meta 전송 → writer 토큰 스트리밍 → 완료 시 세션 저장
+    if "DOC" in intent:
+        yield {
+            "event": "meta",
+            **base,
+            "intent": "DOC",
+            "type": "document",
+            "answer": DOC_DONE_ANSWER,
+            "mode": None,
+            "sources": [],
+        }
+        try:
+            # 부분 수정은 섹션 몇 개만 새로 쓰므로 완성본을 한 번에 전송
+            revised = await _try_revise_document(engine, session_id, query, request_id)
+            if revised:
+                document_content = revised["document"]
+                yield {"event": "token", "delta": document_content}
+            else:
+                full_context = await _build_writer_context(session_id, query)
+                parts: List[str] = []
+                async with engine.admission.slot(WRITER_LLM_ID):
+                    async for delta in engine.writing_chain.astream({"chat_history": full_context}):
+                        if not delta:
+                            continue
+                        parts.append(delta)
+                        yield {"event": "token", "delta": delta}
+                document_content = "".join(parts)
+
+            hist = get_session_history(session_id)
+            await hist.aadd_messages(
+                [HumanMessage(content=query), AIMessage(content=document_content)]
+            )
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            yield {"event": "error", **base, "detail": f"DOC 처리 중 오류: {str(e)}"}
+            return
+
+        latency_ms = int((time.perf_counter() - t0) * 1000)
+        print(f"✅ [{request_id}] (stream) DOC 생성 완료 total={latency_ms}ms")
+        yield {"event": "done", **base, "type": "document", "latency_ms": latency_ms}
+        return
+
+    # [Case B] CHAT (RAG)
+    try:
+        async for ev in engine.astream_answer(query, session_id=session_id, prefetched=prefetch):
+            if ev["event"] == "retrieval":
+                yield {
+                    "event": "meta",
+                    **base,
+                    "intent": "CHAT",
+                    "type": "chat",
+                    "mode": ev.get("mode"),
+                    "sources": _build_sources_from_docs(ev.get("docs", [])),
+                }
+            elif ev["event"] == "token":
+                yield ev
+            elif ev["event"] == "answer":
+                latency_ms = int((time.perf_counter() - t0) * 1000)
+                timings = ev.get("timings", {}) or {}
+                print(
+                    f"✅ [{request_id}] (stream) RAG 완료 mode={ev.get('mode')} "
+                    f"total={latency_ms}ms stages={timings}"
+                )
+                yield {
+                    "event": "done",
+                    **base,
+                    "type": "chat",
+                    "mode": ev.get("mode"),
+                    "latency_ms": latency_ms,
+                    "timings": timings,
+                }
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        yield {"event": "error", **base, "detail": f"CHAT 처리 중 오류: {str(e)}"}
+
+
+def _sse(ev: Dict[str, Any]) -> str:
+    payload = {k: v for k, v in ev.items() if k != "event"}
+    return f"event: {ev['event']}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: Question, engine: RagEngine = Depends(get_engine)):
+    request_id = str(uuid.uuid4())
+    session_id = _sanitize_session_id(request.session_id)
+    query = _sanitize_query(request.query)
+    _reject_if_busy(session_id)
+
+    async def body():
+        task = asyncio.current_task()
+        _register_inflight(session_id, task)
+        try:
+            async for ev in _chat_events(engine, query, session_id, request_id):
+                yield _sse(ev)
+        except asyncio.CancelledError as e:
+            # supersede 취소는 _cancel_inflight에서 이미 집계됨. 그 외는 연결 종료로 인한 취소.
+            if _cancel_reason(e) != "superseded":
+                metrics.inc("chat_cancelled_total", reason="disconnect")
+            print(f"🛑 [{request_id}] (stream) 요청 취소 ({_cancel_reason(e)})")
+            raise
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    한 연결에서 여러 질문 처리. 클라이언트 → {"query", "session_id"}, 서버 → 이벤트 JSON.
+    """
+    await websocket.accept()
+    engine: RagEngine = websocket.app.state.engine
+
+    async def run(query: str, session_id: str, request_id: str) -> None:
+        try:
+            async for ev in _chat_events(engine, query, session_id, request_id):
+                await websocket.send_json(ev)
+        except asyncio.CancelledError as e:
+            if _cancel_reason(e) == "superseded":
+                await websocket.send_json(
+                    {"event": "cancelled", "request_id": request_id, "session_id": session_id, "reason": "superseded"}
+                )
+            raise
+
+    # 스트리밍은 백그라운드 task로 돌리고 수신 루프는 계속 → 새 요청(supersede)/연결 종료를 즉시 감지
+    tasks: List[asyncio.Task] = []
+    try:
+        while True:
+            data = await websocket.receive_json()
+            request_id = str(uuid.uuid4())
+            session_id = _sanitize_session_id((data or {}).get("session_id", "default_user"))
+            try:
+                query = _sanitize_query((data or {}).get("query", ""))
+            except HTTPException as e:
+                await websocket.send_json(
+                    {"event": "error", "request_id": request_id, "session_id": session_id, "detail": e.detail}
+                )
+                continue
+
+            task = asyncio.create_task(run(query, session_id, request_id))
+            _register_inflight(session_id, task)
+            tasks = [t for t in tasks if not t.done()] + [task]
+    except WebSocketDisconnect:
+        for t in tasks:
+            _cancel_inflight(t, "disconnect")
+
+
 # -------------------------------------------------------------------------
 # [API] 추천 질문 (Chips)
 # -------------------------------------------------------------------------
 @app.get("/suggested_questions")
 def get_suggestions():
-    return {
-        "questions": [
-            "백내장 수술 부작용 판례 알려줘",
-            "지금 상담 내용으로 내용증명서 써줘",
-            "의료분쟁조정 신청 방법이 뭐야?",
-            "설명 의무 위반이 인정된 사례 있어?",
-        ]
-    }
+    return {"questions": SUGGESTED_QUESTIONS}
 
 
 # -------------------------------------------------------------------------
@@ -347,9 +767,11 @@ def get_suggestions():
 @app.get("/history/{session_id}")
 async def get_history(session_id: str, limit: int = Query(50, ge=1, le=200)):
     session_id = _sanitize_session_id(session_id)
-    hist = get_session_history(session_id)
+    # 조회만으로 빈 세션을 만들지 않음 (없는/만료된 세션은 빈 내역)
+    # SQLite backend면 캐시에 없어도 backend에 기록이 있으면 read-through
+    hist = get_session_history(session_id) if await store.aexists(session_id) else None
 
-    messages = hist.messages[-limit:] if hist.messages else []
+    messages = (await hist.aget_messages())[-limit:] if hist is not None else []
     return {
         "session_id": session_id,
         "count": len(messages),
@@ -360,6 +782,43 @@ async def get_history(session_id: str, limit: int = Query(50, ge=1, le=200)):
     }
 
 
+# -------------------------------------------------------------------------
+# [API] 운영 지표 (취소/캐시/세션 등 프로세스 내 카운터)
+# -------------------------------------------------------------------------
+@app.get("/metrics")
+def get_metrics(engine: RagEngine = Depends(get_engine)):
+    return {
+        **metrics.snapshot(),
+        "inflight_requests": len(_inflight),
+        "caches": engine.cache_stats(),
+        "sessions": store.stats(),
+        "llm_admission": engine.admission.stats(),
+        "index": engine.index_stats(),
+    }
+
+
+# -------------------------------------------------------------------------
+# [API] 관리: 결과 캐시 flush (컬렉션 재구축 후 호출)
+# -------------------------------------------------------------------------
+@app.post("/admin/cache/flush")
+def flush_caches(engine: RagEngine = Depends(get_engine)):
+    flushed = engine.flush_caches()
+    print(f"🧹 캐시 flush: {flushed}")
+    return {"flushed": flushed}
+
+
+# -------------------------------------------------------------------------
+# [API] 관리: 인덱스 스냅샷 전환 (ingest.py가 CURRENT를 교체한 뒤 호출, 자동 감지보다 즉시)
+# -------------------------------------------------------------------------
+@app.post("/admin/index/reload")
+async def reload_index(force: bool = False, engine: RagEngine = Depends(get_engine)):
+    try:
+        return await engine.areload_index(force=force)
+    except Exception as e:
+        # 전환 실패 시에도 기존 스냅샷으로 계속 서비스
+        raise HTTPException(status_code=500, detail=f"인덱스 전환 실패: {e}")
+
+
 # -------------------------------------------------------------------------
 # 실행:
 #   uv run uvicorn main:app --reload
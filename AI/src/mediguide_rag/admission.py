@@ -0,0 +1,120 @@
+# admission.py (모델 id별 동시 LLM 호출 상한 + 포화 시 빠른 거절)
+import asyncio
+import json
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+class AdmissionRejected(Exception):
+    """모델 슬롯이 포화되어 대기 시간 안에 자리를 얻지 못함 (HTTP 429로 변환)"""
+
+    def __init__(self, model_id: str, retry_after: int) -> None:
+        super().__init__(f"{model_id} 동시 호출 한도 초과 (retry after {retry_after}s)")
+        self.model_id = model_id
+        self.retry_after = retry_after
+
+
+class _ModelSlots:
+    __slots__ = ("limit", "sem", "active", "waiting", "avg_sec")
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.sem = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.avg_sec = 0.0  # 호출 시간 EWMA (Retry-After 추정용)
+
+
+class AdmissionController:
+    """
+    watsonx 모델 id별 동시 호출 수를 제한하는 전역 admission controller.
+    - 자리가 없으면 max_wait_sec까지만 기다리고, 그래도 없으면 AdmissionRejected
+    - Retry-After = 평균 호출 시간 × (대기열 / 한도) 로 대략 추정 (최소 1초)
+    - limit <= 0 이면 해당 모델은 제한 없음
+    """
+
+    def __init__(
+        self,
+        default_limit: int = 8,
+        limits: Optional[Dict[str, int]] = None,
+        max_wait_sec: float = 2.0,
+    ) -> None:
+        self.default_limit = default_limit
+        self.limits = dict(limits or {})
+        self.max_wait_sec = max_wait_sec
+        self._models: Dict[str, _ModelSlots] = {}
+
+    @classmethod
+    def from_env(cls, default_limit: int, limits_json: str, max_wait_sec: float) -> "AdmissionController":
+        try:
+            limits = {str(k): int(v) for k, v in json.loads(limits_json or "{}").items()}
+        except (ValueError, AttributeError) as e:
+            raise ValueError(f"LLM_CONCURRENCY_LIMITS는 {{model_id: int}} JSON이어야 합니다: {e}")
+        return cls(default_limit=default_limit, limits=limits, max_wait_sec=max_wait_sec)
+
+    def _slots(self, model_id: str) -> Optional[_ModelSlots]:
+        slots = self._models.get(model_id)
+        if slots is None:
+            limit = self.limits.get(model_id, self.default_limit)
+            if limit <= 0:
+                return None
+            slots = self._models[model_id] = _ModelSlots(limit)
+        return slots
+
+    def _retry_after(self, slots: _ModelSlots) -> int:
+        per_call = slots.avg_sec or 1.0
+        return max(1, math.ceil(per_call * (slots.waiting + 1) / slots.limit))
+
+    @asynccontextmanager
+    async def slot(self, model_id: str, max_wait_sec: Optional[float] = None) -> AsyncIterator[None]:
+        slots = self._slots(model_id)
+        if slots is None:
+            yield
+            return
+
+        wait = self.max_wait_sec if max_wait_sec is None else max_wait_sec
+        slots.waiting += 1
+        try:
+            if wait <= 0:
+                if slots.sem.locked():
+                    raise asyncio.TimeoutError
+                await slots.sem.acquire()
+            else:
+                await asyncio.wait_for(slots.sem.acquire(), timeout=wait)
+        except asyncio.TimeoutError:
+            metrics.inc("llm_admission_total", model=model_id, result="rejected")
+            raise AdmissionRejected(model_id, self._retry_after(slots)) from None
+        finally:
+            slots.waiting -= 1
+
+        metrics.inc("llm_admission_total", model=model_id, result="admitted")
+        slots.active += 1
+        metrics.set_gauge("llm_inflight", slots.active, model=model_id)
+        t0 = time.perf_counter()
+        try:
+            yield
+            # 정상 완료된 호출만 평균에 반영 (취소된 호출은 짧게 끝나 추정을 왜곡)
+            elapsed = time.perf_counter() - t0
+            slots.avg_sec = elapsed if not slots.avg_sec else 0.8 * slots.avg_sec + 0.2 * elapsed
+        finally:
+            slots.active -= 1
+            slots.sem.release()
+            metrics.set_gauge("llm_inflight", slots.active, model=model_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            model_id: {
+                "limit": s.limit,
+                "active": s.active,
+                "waiting": s.waiting,
+                "avg_call_ms": int(s.avg_sec * 1000),
+            }
+            for model_id, s in self._models.items()
+        }
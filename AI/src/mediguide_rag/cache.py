@@ -0,0 +1,372 @@
+# cache.py (프로세스 내 LRU/TTL 캐시 + 쿼리 임베딩 캐시)
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+def normalize_query(text: str) -> str:
+    """
+    캐시 키용 정규화: 유니코드 NFKC + 공백 정리 + 소문자.
+    ("백내장  수술 부작용 " == "백내장 수술 부작용")
+    """
+    t = unicodedata.normalize("NFKC", text or "")
+    t = re.sub(r"\s+", " ", t).strip()
+    return t.lower()
+
+
+# ---------------------------------------------------------------------
+# Generic LRU + TTL
+# ---------------------------------------------------------------------
+class LRUCache:
+    """
+    크기 상한 + (선택) TTL을 갖는 스레드 안전 LRU.
+    - hit/miss/eviction은 metrics에 cache=<name> 라벨로 집계
+    """
+
+    def __init__(self, name: str, max_size: int, ttl_sec: Optional[float] = None) -> None:
+        self.name = name
+        self.max_size = max(0, int(max_size))
+        self.ttl_sec = ttl_sec if ttl_sec and ttl_sec > 0 else None
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl_sec is not None and now - item[1] > self.ttl_sec:
+                del self._data[key]
+                self.evictions += 1
+                metrics.inc("cache_evictions_total", cache=self.name, reason="ttl")
+                item = None
+
+            if item is None:
+                self.misses += 1
+                metrics.inc("cache_requests_total", cache=self.name, result="miss")
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            metrics.inc("cache_requests_total", cache=self.name, result="hit")
+            return item[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_size == 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+                metrics.inc("cache_evictions_total", cache=self.name, reason="size")
+            metrics.set_gauge("cache_entries", len(self._data), cache=self.name)
+
+    def clear(self) -> int:
+        with self._lock:
+            n = len(self._data)
+            self._data.clear()
+            metrics.set_gauge("cache_entries", 0, cache=self.name)
+            return n
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+# ---------------------------------------------------------------------
+# Query embedding cache (memory LRU → optional SQLite disk tier → remote)
+# ---------------------------------------------------------------------
+class _EmbeddingDiskCache:
+    """
+    SQLite 기반 디스크 티어. 임베딩 모델 id가 바뀌면 전체 무효화.
+    벡터는 float32 바이트로 저장.
+    """
+
+    def __init__(self, path: str, model_id: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB, created REAL)"
+        )
+        row = self._conn.execute("SELECT v FROM meta WHERE k='model_id'").fetchone()
+        if row is None or row[0] != model_id:
+            # 모델이 바뀌면 이전 벡터는 다른 공간 → 전부 폐기
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('model_id', ?)", (model_id,))
+        self._conn.commit()
+
+    def get(self, key: str, ttl_sec: Optional[float]) -> Optional[List[float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vec, created FROM embeddings WHERE key=?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        if ttl_sec is not None and time.time() - row[1] > ttl_sec:
+            return None
+        vec = array("f")
+        vec.frombytes(row[0])
+        return vec.tolist()
+
+    def put(self, key: str, vec: List[float]) -> None:
+        blob = array("f", vec).tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", (key, blob, time.time())
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    embed_query()만 캐시하는 Embeddings 래퍼. (embed_documents는 ingest용이라 그대로 통과)
+    - 키: (임베딩 모델 id, 정규화된 질의)
+    - memory LRU(size/TTL) → (선택) SQLite 디스크 티어 → 원격 임베딩 호출
+    """
+
+    def __init__(
+        self,
+        inner: Embeddings,
+        model_id: str,
+        max_size: int = 2048,
+        ttl_sec: Optional[float] = None,
+        disk_path: Optional[str] = None,
+    ) -> None:
+        self.inner = inner
+        self.model_id = model_id
+        self.ttl_sec = ttl_sec if ttl_sec and ttl_sec > 0 else None
+        self.memory = LRUCache("query_embedding", max_size, ttl_sec=self.ttl_sec)
+        self.disk = _EmbeddingDiskCache(disk_path, model_id) if disk_path else None
+        self.disk_hits = 0
+
+    def _key(self, text: str) -> str:
+        return f"{self.model_id}\x1f{normalize_query(text)}"
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vec = self.memory.get(key)
+        if vec is not None:
+            return vec
+
+        if self.disk is not None:
+            vec = self.disk.get(key, self.ttl_sec)
+            if vec is not None:
+                self.disk_hits += 1
+                metrics.inc("cache_requests_total", cache="query_embedding_disk", result="hit")
+                self.memory.put(key, vec)
+                return vec
+
+        vec = self.inner.embed_query(text)
+        self.memory.put(key, vec)
+        if self.disk is not None:
+            self.disk.put(key, vec)
+        return vec
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def close(self) -> None:
+        if self.disk is not None:
+            self.disk.close()
+            self.disk = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.memory.stats(), "disk_enabled": self.disk is not None, "disk_hits": self.disk_hits}
+
+
+# ---------------------------------------------------------------------
+# Semantic answer cache (질의 임베딩 코사인 유사도 기반)
+# ---------------------------------------------------------------------
+class SemanticAnswerCache:
+    """
+    첫 턴(대화 맥락 없는) 질문의 최종 답변 캐시.
+    - 키: 정규화된 질의 임베딩. 코사인 유사도 >= threshold 인 가장 가까운 항목을 hit로 봄
+    - 크기 상한(LRU) + TTL
+    - index_version이 바뀌면(컬렉션 재구축) 전체 무효화
+    """
+
+    def __init__(
+        self, max_size: int, threshold: float, ttl_sec: Optional[float] = None
+    ) -> None:
+        self.name = "answer"
+        self.max_size = max(0, int(max_size))
+        self.threshold = threshold
+        self.ttl_sec = ttl_sec if ttl_sec and ttl_sec > 0 else None
+        self.index_version: Optional[str] = None
+        self._lock = threading.Lock()
+        # key(정규화 질의) -> (행 번호, payload, created). 순서 = LRU
+        self._entries: "OrderedDict[str, Tuple[int, Dict[str, Any], float]]" = OrderedDict()
+        # (max_size, dim) 행렬을 첫 put에서 한 번 할당, 이후 행 단위로 제자리 기록 (insert마다 np.stack 하지 않음)
+        self._matrix: Optional[np.ndarray] = None
+        self._created = np.zeros(self.max_size, dtype=np.float64)
+        self._live = np.zeros(self.max_size, dtype=bool)
+        self._row_keys: List[Optional[str]] = [None] * self.max_size
+        self._used = 0  # 한 번이라도 쓴 행 수 (검색은 [:_used] 만)
+        self._free: List[int] = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _unit(vec: List[float]) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        return v / n if n > 0 else v
+
+    def _reset(self) -> None:
+        self._entries.clear()
+        self._live[:] = False
+        self._used = 0
+        self._free = []
+
+    def _drop(self, key: str, reason: str) -> None:
+        row = self._entries.pop(key)[0]
+        self._live[row] = False
+        self._free.append(row)
+        self.evictions += 1
+        metrics.inc("cache_evictions_total", cache=self.name, reason=reason)
+
+    def _alloc_row(self) -> int:
+        if not self._free and self._used >= self.max_size:
+            self._drop(next(iter(self._entries)), "size")
+        if self._free:
+            return self._free.pop()
+        self._used += 1
+        return self._used - 1
+
+    def set_index_version(self, version: str) -> None:
+        with self._lock:
+            if self.index_version is not None and version != self.index_version:
+                self._reset()
+                metrics.inc("cache_invalidations_total", cache=self.name, reason="index_changed")
+            self.index_version = version
+
+    def lookup(self, vec: List[float]) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        q = self._unit(vec)
+        with self._lock:
+            n = self._used
+            if self._matrix is None or not self._entries or q.shape[0] != self._matrix.shape[1]:
+                self.misses += 1
+                metrics.inc("cache_requests_total", cache=self.name, result="miss")
+                return None
+
+            # 빈 행/TTL 지난 행은 argmax 전에 제외 → 만료된 최근접 때문에 살아 있는 차순위를 놓치지 않음
+            valid = self._live[:n].copy()
+            if self.ttl_sec is not None:
+                valid &= now - self._created[:n] <= self.ttl_sec
+            sims = self._matrix[:n] @ q
+            sims[~valid] = -np.inf
+            best = int(np.argmax(sims))
+            best_sim = float(sims[best])
+
+            if not valid[best] or best_sim < self.threshold:
+                self.misses += 1
+                metrics.inc("cache_requests_total", cache=self.name, result="miss")
+                return None
+
+            key = self._row_keys[best]
+            _, payload, _ = self._entries[key]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.inc("cache_requests_total", cache=self.name, result="hit")
+            return {**payload, "similarity": best_sim}
+
+    def contains(self, text: str) -> bool:
+        """정확히 같은(정규화) 질의가 만료 전 상태로 있는지 (통계에 반영하지 않음)"""
+        with self._lock:
+            item = self._entries.get(normalize_query(text))
+            if item is None:
+                return False
+            return self.ttl_sec is None or time.monotonic() - item[2] <= self.ttl_sec
+
+    def put(self, text: str, vec: List[float], payload: Dict[str, Any]) -> None:
+        if self.max_size == 0:
+            return
+        key = normalize_query(text)
+        unit = self._unit(vec)
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != unit.shape[0]:
+                # 첫 put 또는 임베딩 차원 변경(모델 교체) → 새로 할당
+                self._reset()
+                self._matrix = np.zeros((self.max_size, unit.shape[0]), dtype=np.float32)
+            item = self._entries.get(key)
+            row = item[0] if item is not None else self._alloc_row()
+            now = time.monotonic()
+            self._matrix[row] = unit
+            self._created[row] = now
+            self._live[row] = True
+            self._row_keys[row] = key
+            self._entries[key] = (row, payload, now)
+            self._entries.move_to_end(key)
+            metrics.set_gauge("cache_entries", len(self._entries), cache=self.name)
+
+    def clear(self) -> int:
+        with self._lock:
+            n = len(self._entries)
+            self._reset()
+            metrics.set_gauge("cache_entries", 0, cache=self.name)
+            return n
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "index_version": self.index_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
@@ -0,0 +1,138 @@
+# chunking.py (임베딩 모델 토큰 예산 기준 chunking: 헤더 포함 max_tokens 이하로 채워서 분할)
+import hashlib
+import os
+from typing import Callable, Dict, List
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from tokenizers import Tokenizer
+
+try:
+    from .tokens import estimate_tokens
+except ImportError:
+    from tokens import estimate_tokens
+
+# EMBED_TOKENIZER 에 이 값을 주면 tokenizer 없이 estimate_tokens로 셈 (명시적으로 고른 경우에만)
+HEURISTIC = "heuristic"
+
+# 임베딩 입력의 특수 토큰(<s>, </s>) 몫. 휴리스틱 카운터에서만 더함 (tokenizer는 encode 결과에 포함)
+_SPECIAL_TOKENS = 2
+
+_SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+
+class TokenCounter:
+    """
+    임베딩 모델 tokenizer로 토큰 수를 셈 (특수 토큰 포함 = 모델이 실제로 받는 길이).
+    - name: HF Hub 모델 id 또는 tokenizer.json 경로, HEURISTIC 이면 estimate_tokens
+    - 로드 실패 시 예외: 조용히 휴리스틱으로 바뀌면 chunk 경계가 달라져 전체 재임베딩이 일어나므로
+      (휴리스틱은 한글 1글자 = 1토큰이라 chunk가 훨씬 잘게 쪼개짐)
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._tok = None
+        if name == HEURISTIC:
+            return
+        try:
+            if os.path.isfile(name):
+                self._tok = Tokenizer.from_file(name)
+            else:
+                self._tok = Tokenizer.from_pretrained(name)
+        except Exception as e:
+            raise RuntimeError(
+                f"tokenizer 로드 실패: {name} ({type(e).__name__}: {e}). "
+                f"EMBED_TOKENIZER에 tokenizer.json 경로를 지정하거나, 추정치로 chunking하려면 '{HEURISTIC}'"
+            ) from e
+
+    @property
+    def exact(self) -> bool:
+        return self._tok is not None
+
+    @property
+    def fingerprint(self) -> str:
+        """tokenizer 내용 기준 식별자 (Hub id / 로컬 파일 등 불러온 경로가 달라도 같은 tokenizer면 같은 값)"""
+        if self._tok is None:
+            return HEURISTIC
+        return hashlib.sha256(self._tok.to_str().encode("utf-8")).hexdigest()[:16]
+
+    def __call__(self, text: str) -> int:
+        if self._tok is None:
+            return estimate_tokens(text) + _SPECIAL_TOKENS
+        return len(self._tok.encode(text).ids)
+
+    def body(self, text: str) -> int:
+        """특수 토큰을 뺀 길이 (splitter가 조각 길이를 더해가며 쓰는 값)"""
+        if self._tok is None:
+            return estimate_tokens(text)
+        return len(self._tok.encode(text, add_special_tokens=False).ids)
+
+
+class TokenChunker:
+    """
+    header + chunk 가 max_tokens를 넘지 않도록 본문을 분할.
+    RecursiveCharacterTextSplitter의 길이 함수를 토큰 수로 바꾸고, 헤더 몫만큼 예산을 줄여 채움(packing).
+    조각 토큰 수의 합은 이어 붙인 텍스트의 토큰 수와 조금 다를 수 있어 결과를 다시 세고, 넘치면 그 chunk만 더 작게 쪼갬.
+    """
+
+    def __init__(self, counter: TokenCounter, max_tokens: int, overlap_tokens: int) -> None:
+        self.counter = counter
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def _splitter(self, budget: int) -> RecursiveCharacterTextSplitter:
+        return RecursiveCharacterTextSplitter(
+            chunk_size=budget,
+            chunk_overlap=min(self.overlap_tokens, budget // 4),
+            length_function=self.counter.body,
+            separators=_SEPARATORS,
+        )
+
+    def split(self, header: str, text: str) -> List[str]:
+        budget = self.max_tokens - self.counter(header)
+        if budget <= 0:
+            raise ValueError(f"헤더만으로 토큰 예산 초과: {self.counter(header)} > {self.max_tokens}")
+        if self.counter(header + text) <= self.max_tokens:
+            return [text]
+
+        out: List[str] = []
+        for ch in self._splitter(budget).split_text(text):
+            over = self.counter(header + ch) - self.max_tokens
+            if over > 0 and budget - over > 0:
+                out.extend(self._splitter(budget - over).split_text(ch))
+            else:
+                out.append(ch)
+        return out
+
+
+class ChunkStats:
+    """ingest 리포트: chunk 토큰 분포 + 임베딩 시 잘리는(truncate) chunk 수"""
+
+    def __init__(self, count: Callable[[str], int], max_tokens: int) -> None:
+        self.count = count
+        self.max_tokens = max_tokens
+        self.chunks = 0
+        self.tokens = 0
+        self.max_seen = 0
+        self.truncated = 0
+        self.truncated_tokens = 0
+
+    def add(self, text: str) -> int:
+        n = self.count(text)
+        self.chunks += 1
+        self.tokens += n
+        self.max_seen = max(self.max_seen, n)
+        if n > self.max_tokens:
+            self.truncated += 1
+            self.truncated_tokens += n - self.max_tokens
+        return n
+
+    def report(self) -> Dict[str, float]:
+        return {
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "mean_tokens": round(self.tokens / self.chunks, 1) if self.chunks else 0.0,
+            "max_tokens": self.max_seen,
+            "fill_ratio": round(self.tokens / (self.chunks * self.max_tokens), 3) if self.chunks else 0.0,
+            "truncated": self.truncated,
+            "truncated_tokens": self.truncated_tokens,
+        }
@@ -0,0 +1,168 @@
+# doc_sections.py (작성된 청구/조정 신청 문서를 섹션 단위로 분해 → 수정 요청 시 해당 섹션만 재작성)
+import re
+from typing import List, Optional, Tuple
+
+# ---------------------------------------------------------------------
+# 섹션 구조: LEGAL_TEMPLATE의 "N. 제목" 블록 + 제목줄(title) + 작성일/서명(footer)
+# ---------------------------------------------------------------------
+# 템플릿 번호는 1~7 한 자리. 숫자 뒤에 다시 숫자가 오는 줄("5. 3. 수술", "2023. 5. 3.")은 날짜 → 본문
+_HEADING_RE = re.compile(r"^\s*([1-7])\.\s*(?!\d)(.+?)\s*$")
+_FOOTER_RE = re.compile(r"^\s*\[?\s*작성일")
+
+# heading 텍스트 → 섹션 key
+_HEADING_KEYS = [
+    ("parties", "당사자"),
+    ("claim", "신청 취지"),
+    ("claim", "청구 취지"),
+    ("facts", "사건 개요"),
+    ("facts", "사실관계"),
+    ("argument", "주장"),
+    ("damages", "손해"),
+    ("evidence", "증거"),
+    ("requests", "요청"),
+]
+
+# 수정 요청 문구 → 영향받는 섹션 key (금액은 신청 취지/손해 내역 양쪽에 있음)
+_SECTION_CUES = [
+    ("title", r"제목"),
+    ("parties", r"당사자|신청인|피신청인|이름|성명|병원\s*명|의료\s*기관|주소"),
+    ("claim", r"금액|청구액|\d[\d,]*\s*(만|억)?\s*원|지급\s*기한|기한"),
+    ("facts", r"경위|사실\s*관계|개요|시술|수술|증상|경과|일시|날짜"),
+    ("argument", r"주장|과실|주의\s*의무|설명\s*의무|인과\s*관계|책임"),
+    ("damages", r"손해|치료비|위자료|합계|금액|\d[\d,]*\s*(만|억)?\s*원"),
+    ("evidence", r"증거|진료\s*기록|영수증|사진|녹취|소견서"),
+    ("requests", r"요청\s*사항|회신"),
+    ("footer", r"작성일|서명"),
+]
+
+# 금액/날짜 표현 (수정 대상이 구체적인 값인 경우)
+_VALUE_RE = re.compile(r"\d[\d,]*\s*(만|억)?\s*원|\d{4}\s*[.\-/년]\s*\d{1,2}|\d{1,2}\s*월\s*\d{1,2}\s*일")
+
+# 정보 요청(질문) 표현: "사례 추가로 알려줘" 같은 상담 follow-up은 문서 수정이 아님
+_QUESTION_RE = re.compile(r"알려\s*(줘|주세요|줄래)|설명해\s*(줘|주세요)|뭐야|무엇|어떻게|어떤|있(어|나요|을까)\s*\??\s*$|\?\s*$")
+
+# 부분 수정 요청으로 볼 동사 (새로 작성/톤 전체 변경은 전체 재생성)
+_EDIT_RE = re.compile(
+    r"바꿔|바꾸|수정|변경|고쳐|고치|추가|넣어|빼\s*줘|빼고|삭제|제외|올려|내려|늘려|줄여|대신|(으)?로\s*해"
+)
+_FULL_REWRITE_RE = re.compile(r"다시\s*(써|작성)|새로\s*(써|작성)|처음부터|전체|톤|어조|말투|정중하게|강하게|부드럽게")
+
+MAX_PATCH_SECTIONS = 3
+
+
+class DocSection:
+    """text: 섹션 본문(끝 공백 제외), tail: 원문의 섹션 뒤 공백/빈 줄 (재조립 시 그대로 복원)"""
+
+    __slots__ = ("key", "text", "tail")
+
+    def __init__(self, key: str, text: str, tail: str = "") -> None:
+        self.key = key
+        self.text = text
+        self.tail = tail
+
+
+def _heading_key(title: str) -> Optional[str]:
+    """템플릿 섹션 제목이면 key, 아니면 None (번호 목록 등 본문)"""
+    for key, cue in _HEADING_KEYS:
+        if cue in title:
+            return key
+    return None
+
+
+def _section(key: str, buf: List[str]) -> DocSection:
+    raw = "\n".join(buf)
+    text = raw.rstrip()
+    return DocSection(key, text, raw[len(text):])
+
+
+def parse_document(text: str, min_sections: int = 4) -> Optional[List[DocSection]]:
+    """
+    문서 본문 → [DocSection(title), DocSection(parties), ..., DocSection(footer)].
+    번호 섹션이 min_sections개 미만이면(추가 정보 질문 등) None.
+    """
+    lines = (text or "").strip().splitlines()
+    sections: List[DocSection] = []
+    buf: List[str] = []
+    key = "title"
+    numbered = 0
+    last_n = 0
+    for line in lines:
+        m = _HEADING_RE.match(line)
+        heading = _heading_key(m.group(2)) if m and key != "footer" and int(m.group(1)) > last_n else None
+        if heading is not None:
+            sections.append(_section(key, buf))
+            key, buf = heading, [line]
+            last_n = int(m.group(1))
+            numbered += 1
+            continue
+        if _FOOTER_RE.match(line) and key != "footer":
+            sections.append(_section(key, buf))
+            key, buf = "footer", [line]
+            continue
+        buf.append(line)
+    sections.append(_section(key, buf))
+
+    if numbered < min_sections:
+        return None
+    # 문서가 heading으로 시작하면 빈 title은 버림 (재조립 시 앞에 빈 줄이 생기지 않도록)
+    return [s for s in sections if s.text or s.tail or s.key != "title"]
+
+
+def render_document(sections: List[DocSection]) -> str:
+    """섹션 사이 원래 공백/빈 줄을 그대로 두고 재조립 (수정 안 한 부분은 원문과 같게)"""
+    return "\n".join(s.text + s.tail for s in sections)
+
+
+def is_edit_request(request: str) -> bool:
+    t = request or ""
+    return bool(_EDIT_RE.search(t)) and not _FULL_REWRITE_RE.search(t)
+
+
+def is_targeted_edit(request: str) -> bool:
+    """
+    수정 동사 + 수정 대상(섹션 cue 또는 금액/날짜 값)이 함께 있는 요청만.
+    질문 형태("…사례 추가로 알려줘")는 제외 → 라우터가 상담/문서를 판단
+    """
+    t = re.sub(r"\s+", " ", request or "")
+    if not is_edit_request(t) or _QUESTION_RE.search(t):
+        return False
+    return bool(_VALUE_RE.search(t)) or any(re.search(pattern, t) for _, pattern in _SECTION_CUES)
+
+
+def affected_sections(request: str, sections: List[DocSection]) -> List[str]:
+    """
+    수정 요청이 건드리는 섹션 key 목록 (문서에 있는 것만, 문서 순서).
+    빈 리스트 = 특정 불가 → 전체 재생성.
+    """
+    t = re.sub(r"\s+", " ", request or "")
+    hit = {key for key, pattern in _SECTION_CUES if re.search(pattern, t)}
+    keys = [s.key for s in sections if s.key in hit]
+    return list(dict.fromkeys(keys))
+
+
+def plan_revision(request: str, document: str) -> Optional[Tuple[List[DocSection], List[str]]]:
+    """
+    부분 수정이 가능하면 (섹션들, 수정할 key 목록), 아니면 None(전체 재생성).
+    """
+    if not is_targeted_edit(request):
+        return None
+    sections = parse_document(document)
+    if sections is None:
+        return None
+    keys = affected_sections(request, sections)
+    if not keys or len(keys) > MAX_PATCH_SECTIONS:
+        return None
+    return sections, keys
+
+
+def clean_patch(original: str, patched: str) -> str:
+    """
+    LLM이 돌려준 섹션 정리: 코드펜스 제거, 번호 heading이 빠졌으면 원래 heading 복원.
+    """
+    t = re.sub(r"^```[a-z]*\s*|\s*```$", "", (patched or "").strip())
+    if not t:
+        return original
+    head = original.splitlines()[0] if original else ""
+    if _HEADING_RE.match(head) and not _HEADING_RE.match(t.splitlines()[0]):
+        t = f"{head}\n{t}"
+    return t
@@ -0,0 +1,147 @@
+# embed_pipeline.py (ingest용 임베딩 단계: 배치 + 제한된 병렬 + token bucket rate limit + 재시도)
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from .tokens import estimate_tokens
+except ImportError:
+    from tokens import estimate_tokens
+
+Batch = Tuple[List[str], List[str], List[Dict[str, Any]]]  # (ids, texts, metadatas)
+
+
+class TokenBucket:
+    """
+    초당 rate개 요청 허용, 최대 capacity개까지 몰아서 허용 (thread-safe).
+    rate <= 0 이면 제한 없음.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n: float = 1.0) -> float:
+        """토큰 n개를 얻을 때까지 대기. return: 대기한 시간(초)"""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return waited
+                delay = (n - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class EmbedStats:
+    def __init__(self, count_tokens: Callable[[str], int] = estimate_tokens) -> None:
+        self.count_tokens = count_tokens
+        self.chunks = 0
+        self.tokens = 0
+        self.batches = 0
+        self.retries = 0
+        self.throttled_sec = 0.0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, texts: Sequence[str], retries: int, throttled_sec: float) -> None:
+        with self._lock:
+            self.chunks += len(texts)
+            self.tokens += sum(self.count_tokens(t) for t in texts)
+            self.batches += 1
+            self.retries += retries
+            self.throttled_sec += throttled_sec
+
+    def report(self) -> Dict[str, float]:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "chunks": self.chunks,
+            "batches": self.batches,
+            "est_tokens": self.tokens,
+            "elapsed_sec": round(elapsed, 2),
+            "chunks_per_sec": round(self.chunks / elapsed, 1),
+            "tokens_per_sec": round(self.tokens / elapsed, 1),
+            "retries": self.retries,
+            "throttled_sec": round(self.throttled_sec, 2),
+        }
+
+
+def _embed_with_retry(
+    embed_fn: Callable[[List[str]], List[List[float]]],
+    texts: List[str],
+    bucket: TokenBucket,
+    max_retries: int,
+    backoff_sec: float,
+) -> Tuple[List[List[float]], int, float]:
+    attempt = 0
+    throttled = 0.0
+    while True:
+        throttled += bucket.acquire()
+        try:
+            vectors = embed_fn(texts)
+            if len(vectors) != len(texts):
+                raise ValueError(f"임베딩 개수 불일치: {len(vectors)} != {len(texts)}")
+            return vectors, attempt, throttled
+        except Exception as e:
+            if attempt >= max_retries:
+                raise
+            # 지수 backoff + jitter (429/일시 오류가 여러 worker에서 동시에 재발하지 않도록)
+            delay = min(30.0, backoff_sec * (2 ** attempt)) * (0.5 + random.random())
+            print(f"⚠️ 임베딩 실패 ({type(e).__name__}: {e}) → {delay:.1f}s 후 재시도 {attempt + 1}/{max_retries}")
+            time.sleep(delay)
+            attempt += 1
+
+
+def embed_batches(
+    embed_fn: Callable[[List[str]], List[List[float]]],
+    batches: Iterable[Batch],
+    concurrency: int = 4,
+    rate_per_sec: float = 8.0,
+    max_retries: int = 5,
+    backoff_sec: float = 1.0,
+    stats: Optional[EmbedStats] = None,
+) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]], List[List[float]]]]:
+    """
+    batches를 concurrency개 worker로 임베딩하고 끝난 순서대로 (ids, texts, metadatas, vectors)를 yield.
+    - 동시에 들고 있는 배치는 concurrency*2개까지 (입력이 generator여도 메모리 일정)
+    - 호출자는 yield된 배치를 바로 저장(checkpoint)하면 중단 후 재실행 시 이어서 진행 가능
+    - 재시도를 모두 소진한 배치가 있으면 예외를 그대로 올림 (이미 yield된 배치는 유효)
+    """
+    bucket = TokenBucket(rate_per_sec)
+    stats = stats if stats is not None else EmbedStats()
+    pending: Dict[Future, Batch] = {}
+    source = iter(batches)
+    exhausted = False
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="embed") as pool:
+        try:
+            while True:
+                while not exhausted and len(pending) < max(1, concurrency) * 2:
+                    batch = next(source, None)
+                    if batch is None:
+                        exhausted = True
+                        break
+                    fut = pool.submit(_embed_with_retry, embed_fn, batch[1], bucket, max_retries, backoff_sec)
+                    pending[fut] = batch
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    ids, texts, metadatas = pending.pop(fut)
+                    vectors, retries, throttled = fut.result()
+                    stats.add(texts, retries, throttled)
+                    yield ids, texts, metadatas, vectors
+        finally:
+            for fut in pending:
+                fut.cancel()
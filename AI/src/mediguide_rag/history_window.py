@@ -0,0 +1,173 @@
+# history_window.py (생성 프롬프트용 대화 내역 창: 토큰 예산 + 오래된 턴 요약)
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage
+
+try:
+    from .tokens import estimate_tokens
+except ImportError:
+    from tokens import estimate_tokens
+
+# ---------------------------------------------------------------------
+# 문서(DOC) 결과 판별 (writer/RAG 프롬프트 모두에서 제외)
+# ---------------------------------------------------------------------
+_DOC_LIKE_PATTERNS = [
+    r"^제목:\s*의료과실",
+    r"\b신청인\b",
+    r"\b피신청인\b",
+    r"\b의료분쟁\s*조정신청서\b",
+    r"\b손해배상\s*청구\b",
+    r"\b증거\s*자료\b",
+    r"\b요청\s*사항\b",
+    r"\[작성일\]",
+    r"문서 작성을 위해 아래 정보가 추가로 필요합니다",
+]
+# 패턴별 re.search 대신 한 번의 search로 판별
+_DOC_LIKE_RE = re.compile(
+    "|".join(f"(?:{p})" for p in _DOC_LIKE_PATTERNS), flags=re.IGNORECASE | re.MULTILINE
+)
+
+# 메시지 additional_kwargs에 저장하는 판별 결과 키 (append 시 1회 계산, SQLite에도 함께 저장됨)
+DOC_LIKE_KEY = "mediguide_doc_like"
+
+
+def is_doc_like_ai_message(text: str) -> bool:
+    """
+    Writer가 만든 '문서 본문'이 히스토리에 누적되면,
+    다음 문서 요청에서 반복/증식 문제가 생김 → Writer 입력에서 제외.
+    """
+    t = (text or "").strip()
+    if len(t) < 200:
+        return False
+    if _DOC_LIKE_RE.search(t):
+        return True
+    # 너무 긴 텍스트는 문서일 확률 높음
+    if len(t) > 2500:
+        return True
+    return False
+
+
+def tag_message(msg: BaseMessage) -> BaseMessage:
+    """history append 시점에 DOC-like 여부를 메시지 메타데이터에 기록"""
+    if DOC_LIKE_KEY not in msg.additional_kwargs:
+        content = msg.content if isinstance(msg.content, str) else str(msg.content)
+        msg.additional_kwargs[DOC_LIKE_KEY] = msg.type != "human" and is_doc_like_ai_message(content)
+    return msg
+
+
+def is_doc_message(msg: BaseMessage) -> bool:
+    # 태그 없는 메시지(이전 버전에서 저장된 내역 등)는 이 시점에 태깅
+    return bool(tag_message(msg).additional_kwargs[DOC_LIKE_KEY])
+
+
+# ---------------------------------------------------------------------
+# 토큰 추정 (estimate_tokens: tokens.py)
+# ---------------------------------------------------------------------
+def message_tokens(msg: BaseMessage) -> int:
+    content = msg.content if isinstance(msg.content, str) else str(msg.content)
+    return estimate_tokens(content) + 4  # role/구분자 오버헤드
+
+
+# ---------------------------------------------------------------------
+# 창 계산
+# ---------------------------------------------------------------------
+def split_history(
+    messages: Sequence[BaseMessage],
+    budget_tokens: int,
+    min_messages: int = 2,
+    summarized_upto: int = 0,
+) -> Tuple[int, List[BaseMessage], List[BaseMessage]]:
+    """
+    messages(원본 순서)를 세 구간으로 나눔:
+      [0, summarized_upto)           : 이미 요약에 반영됨 → 요약 텍스트로 대체
+      [summarized_upto, start)       : 예산 밖인데 아직 요약 안 됨 (pending)
+      [start, len)                   : 최근 창 (예산 안, 최소 min_messages개 보장)
+    DOC-like AI 메시지는 어느 구간에서도 제외.
+    return: (start, pending, window)
+    """
+    n = len(messages)
+    summarized_upto = min(max(0, summarized_upto), n)
+
+    used = 0
+    kept = 0
+    start = n
+    for i in range(n - 1, summarized_upto - 1, -1):
+        msg = messages[i]
+        if is_doc_message(msg):
+            start = i
+            continue
+        cost = message_tokens(msg)
+        if kept >= min_messages and used + cost > budget_tokens:
+            break
+        used += cost
+        kept += 1
+        start = i
+
+    pending = [m for m in messages[summarized_upto:start] if not is_doc_message(m)]
+    window = [m for m in messages[start:] if not is_doc_message(m)]
+    return start, pending, window
+
+
+def format_for_summary(messages: Sequence[BaseMessage], max_chars_per_message: int = 1200) -> str:
+    lines = []
+    for m in messages:
+        role = "의뢰인" if m.type == "human" else "상담사"
+        content = m.content if isinstance(m.content, str) else str(m.content)
+        if len(content) > max_chars_per_message:
+            content = content[:max_chars_per_message] + " …"
+        lines.append(f"{role}: {content}")
+    return "\n".join(lines)
+
+
+def summary_message_text(summary: Optional[str]) -> str:
+    return f"[이전 상담 요약]\n{summary.strip()}" if summary and summary.strip() else ""
+
+
+# ---------------------------------------------------------------------
+# Writer 입력용 대화 내역 (세션별 증분 캐시)
+# ---------------------------------------------------------------------
+class WriterTranscript:
+    """
+    메시지마다 writer 블록("(의뢰인)\n내용")을 한 번만 만들어 두고,
+    요청 시에는 최근 max_turns개 메시지 범위의 블록만 번호를 붙여 이어 붙임.
+    DOC-like AI 메시지(작성된 문서)는 블록을 만들지 않음.
+    keep_turns보다 오래된 블록은 버림 (세션 메모리에 메시지 전체 사본을 두지 않도록, render의 max_turns <= keep_turns)
+    """
+
+    def __init__(self, keep_turns: int = 14) -> None:
+        self.keep_turns = keep_turns
+        self.seen = 0
+        self.blocks: List[Tuple[int, str]] = []  # (원본 메시지 index, 블록 본문)
+        self.bytes = 0  # 보관 중인 블록 본문 byte 합 (세션 저장소 byte 상한에 포함)
+
+    def update(self, messages: Sequence[BaseMessage]) -> None:
+        if self.seen > len(messages):
+            # 내역이 비워짐(clear) → 처음부터
+            self.seen, self.blocks, self.bytes = 0, [], 0
+        cutoff = len(messages) - self.keep_turns
+        for i in range(max(self.seen, cutoff), len(messages)):
+            msg = messages[i]
+            if is_doc_message(msg):
+                continue
+            role = "의뢰인" if msg.type == "human" else "변호사"
+            body = f"({role})\n{msg.content}\n"
+            self.blocks.append((i, body))
+            self.bytes += len(body.encode("utf-8"))
+        self.seen = len(messages)
+        drop = 0
+        while drop < len(self.blocks) and self.blocks[drop][0] < cutoff:
+            self.bytes -= len(self.blocks[drop][1].encode("utf-8"))
+            drop += 1
+        if drop:
+            del self.blocks[:drop]
+
+    def render(self, max_turns: int) -> str:
+        cutoff = self.seen - max_turns
+        recent: List[str] = []
+        for i, body in reversed(self.blocks):
+            if i < cutoff:
+                break
+            recent.append(body)
+        recent.reverse()
+        return "\n".join(f"### Turn {k} {body}" for k, body in enumerate(recent, 1))
@@ -0,0 +1,203 @@
+# index_snapshot.py (버전별 인덱스 스냅샷 디렉터리 + CURRENT 포인터 원자적 교체)
+import json
+import os
+import shutil
+import socket
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+# ---------------------------------------------------------------------
+# 레이아웃 (INDEX_ROOT/)
+#   CURRENT                 : 서버가 열 스냅샷 이름 한 줄 (임시 파일 → os.replace 로 교체)
+#   v20260101-120000-ab12cd/
+#     manifest.json         : status(building|ready), base, embed_model, chunk_params, doc_count, chunks{chunk_id: hash}
+#     checkpoint.jsonl      : building 중 배치마다 추가하는 {chunk_id: hash} (매니페스트 전체를 매번 다시 쓰지 않음)
+#     chroma/               : Chroma persist_directory
+#     bm25/                 : BM25 역색인 (lexical_index)
+#     numpy/                : VECTOR_BACKEND=numpy export (서버가 필요 시 생성)
+#     LEASE.<host>.<pid>    : 이 스냅샷을 열어 둔 서버 프로세스 표시 (prune 대상에서 제외)
+# 게시된(ready) 스냅샷은 수정하지 않음 → 이전 스냅샷을 읽는 진행 중 요청과 충돌 없음
+# ---------------------------------------------------------------------
+# CWD와 무관하게 AI/index (AI/chroma_db_fixed 와 src/mediguide_rag/chroma_db_fixed 가 갈리던 문제)
+DEFAULT_INDEX_ROOT = str(Path(__file__).resolve().parents[2] / "index")
+
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+CHECKPOINT_FILE = "checkpoint.jsonl"
+LEASE_PREFIX = "LEASE."
+
+
+class SnapshotPaths:
+    __slots__ = ("version", "dir", "chroma_dir", "bm25_dir", "numpy_dir", "manifest_path", "checkpoint_path")
+
+    def __init__(self, root: str, version: str) -> None:
+        self.version = version
+        self.dir = os.path.join(root, version)
+        self.chroma_dir = os.path.join(self.dir, "chroma")
+        self.bm25_dir = os.path.join(self.dir, "bm25")
+        self.numpy_dir = os.path.join(self.dir, "numpy")
+        self.manifest_path = os.path.join(self.dir, MANIFEST_FILE)
+        self.checkpoint_path = os.path.join(self.dir, CHECKPOINT_FILE)
+
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_current(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+    if not version or not os.path.isdir(os.path.join(root, version)):
+        return None
+    return version
+
+
+def read_manifest(root: str, version: str) -> Dict[str, Any]:
+    try:
+        with open(SnapshotPaths(root, version).manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(root: str, version: str, manifest: Dict[str, Any]) -> None:
+    _write_atomic(SnapshotPaths(root, version).manifest_path, json.dumps(manifest, ensure_ascii=False))
+
+
+def append_checkpoint(root: str, version: str, chunks: Dict[str, str]) -> None:
+    """배치 하나가 저장될 때마다 한 줄 추가 (O(배치 크기) I/O)"""
+    with open(SnapshotPaths(root, version).checkpoint_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(chunks, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_checkpoint(root: str, version: str) -> Dict[str, str]:
+    chunks: Dict[str, str] = {}
+    try:
+        with open(SnapshotPaths(root, version).checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    chunks.update(json.loads(line))
+                except ValueError:
+                    break  # 중단 시점에 잘린 마지막 줄
+    except OSError:
+        pass
+    return chunks
+
+
+def clear_checkpoint(root: str, version: str) -> None:
+    try:
+        os.remove(SnapshotPaths(root, version).checkpoint_path)
+    except OSError:
+        pass
+
+
+def new_version() -> str:
+    return time.strftime("v%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+
+
+def list_versions(root: str) -> List[str]:
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return []
+    return sorted(n for n in names if n.startswith("v") and os.path.isdir(os.path.join(root, n)))
+
+
+def find_resumable(root: str, base: Optional[str], embed_model: Optional[str] = None) -> Optional[str]:
+    """같은 base(+ 같은 임베딩 모델)에서 시작했다가 중단된(building) 스냅샷 → 이어서 진행"""
+    for version in reversed(list_versions(root)):
+        m = read_manifest(root, version)
+        if m.get("status") != "building" or m.get("base") != base:
+            continue
+        if embed_model is not None and m.get("embed_model") != embed_model:
+            continue
+        return version
+    return None
+
+
+def create_snapshot(root: str, base_chroma_dir: Optional[str]) -> SnapshotPaths:
+    """
+    새 스냅샷 디렉터리. base Chroma가 있으면 복사해서 시작 (증분 ingest: 바뀐 chunk만 임베딩).
+    base_chroma_dir=None 이면 빈 컬렉션에서 시작 (임베딩 모델 변경/전체 재구축)
+    """
+    paths = SnapshotPaths(root, new_version())
+    os.makedirs(paths.dir)
+    if base_chroma_dir and os.path.isdir(base_chroma_dir):
+        shutil.copytree(base_chroma_dir, paths.chroma_dir)
+    return paths
+
+
+def publish(root: str, version: str) -> None:
+    """CURRENT 포인터 교체 (서버는 reload 시점에 새 스냅샷을 열고, 진행 중 요청은 이전 스냅샷으로 마무리)"""
+    _write_atomic(os.path.join(root, CURRENT_FILE), version + "\n")
+
+
+def acquire_lease(root: str, version: str) -> str:
+    """서버가 스냅샷을 열 때 표시. return: lease 파일 경로 (release_lease로 해제)"""
+    path = os.path.join(root, version, f"{LEASE_PREFIX}{socket.gethostname()}.{os.getpid()}")
+    _write_atomic(path, json.dumps({"pid": os.getpid(), "acquired_at": time.time()}))
+    return path
+
+
+def release_lease(path: Optional[str]) -> None:
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _lease_alive(name: str) -> bool:
+    # 같은 호스트면 pid 생존 확인 (비정상 종료한 서버의 lease는 무시), 다른 호스트는 살아 있다고 봄
+    host, _, pid = name[len(LEASE_PREFIX):].rpartition(".")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (ValueError, PermissionError):
+        return True
+    return True
+
+
+def leased_versions(root: str) -> Set[str]:
+    """살아 있는 서버가 열어 둔 스냅샷"""
+    leased = set()
+    for version in list_versions(root):
+        try:
+            names = os.listdir(os.path.join(root, version))
+        except OSError:
+            continue
+        if any(n.startswith(LEASE_PREFIX) and _lease_alive(n) for n in names):
+            leased.add(version)
+    return leased
+
+
+def prune(root: str, keep: int, protect: Iterable[Optional[str]] = ()) -> List[str]:
+    """
+    최근 keep개를 넘는 ready 스냅샷 삭제. return: 삭제한 버전
+    제외: CURRENT, protect(예: 직전 CURRENT), 서버가 lease를 잡고 있는 스냅샷
+      (자동 전환이 꺼져 있거나 전환에 실패한 서버는 이전 스냅샷의 chroma/bm25 mmap을 계속 쓰고 있음)
+    """
+    keep_set = {read_current(root), *protect} | leased_versions(root)
+    ready = [v for v in list_versions(root) if read_manifest(root, v).get("status") == "ready"]
+    removed = []
+    for version in ready[: max(0, len(ready) - keep)]:
+        if version in keep_set:
+            continue
+        shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+        removed.append(version)
+    return removed
@@ -1,20 +1,63 @@
-import os, re, shutil
-import pandas as pd
+import os, re, json, time, hashlib, argparse
+from typing import Iterable, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 from langchain_core.documents import Document
 from langchain_ibm import WatsonxEmbeddings
 from langchain_chroma import Chroma
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from ibm_watsonx_ai.metanames import EmbedTextParamsMetaNames
 
+try:
+    from .chunking import ChunkStats, TokenChunker, TokenCounter
+    from .embed_pipeline import EmbedStats, embed_batches
+    from .index_snapshot import (
+        DEFAULT_INDEX_ROOT, SnapshotPaths, append_checkpoint, clear_checkpoint, create_snapshot,
+        find_resumable, prune, publish, read_checkpoint, read_current, read_manifest, write_manifest,
+    )
+    from .lexical_index import build_lexical_index
+    from .sheet_loader import iter_sheet_rows
+except ImportError:
+    from chunking import ChunkStats, TokenChunker, TokenCounter
+    from embed_pipeline import EmbedStats, embed_batches
+    from index_snapshot import (
+        DEFAULT_INDEX_ROOT, SnapshotPaths, append_checkpoint, clear_checkpoint, create_snapshot,
+        find_resumable, prune, publish, read_checkpoint, read_current, read_manifest, write_manifest,
+    )
+    from lexical_index import build_lexical_index
+    from sheet_loader import iter_sheet_rows
+
 load_dotenv()
 
 IBM_URL = os.getenv("IBM_CLOUD_URL")
 PROJECT_ID = os.getenv("PROJECT_ID")
 WATSONX_API = os.getenv("API_KEY")
-PERSIST_DIR = "./chroma_db_fixed"
 COLLECTION_NAME = "mediguide_cases"
 
+# 버전별 스냅샷: INDEX_ROOT/<version>/{chroma,bm25,manifest.json} + CURRENT 포인터 (rag_pipeline과 같은 위치)
+INDEX_ROOT = os.getenv("INDEX_ROOT", DEFAULT_INDEX_ROOT)
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "3"))
+
+# 스냅샷 도입 이전 경로 (첫 스냅샷을 만들 때 여기서 벡터를 이어받음)
+PERSIST_DIR = "./chroma_db_fixed"
+LEGACY_MANIFEST_PATH = os.path.join(PERSIST_DIR, "ingest_manifest.json")
+
+EMBED_MODEL_ID = "ibm/granite-embedding-278m-multilingual"
+# 임베딩 API가 이 길이에서 입력을 자름 → chunk는 헤더 포함 이 예산 안에 채움 (잘리는 꼬리/과한 overlap 없음)
+EMBED_MAX_TOKENS = 512
+CHUNK_MAX_TOKENS = min(EMBED_MAX_TOKENS, int(os.getenv("CHUNK_MAX_TOKENS", str(EMBED_MAX_TOKENS))))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+# 토큰 수를 셀 tokenizer (HF Hub id 또는 tokenizer.json 경로, "heuristic" = 추정치). 로드 실패 시 ingest 중단
+EMBED_TOKENIZER = os.getenv("EMBED_TOKENIZER", "ibm-granite/granite-embedding-278m-multilingual")
+
+# 파싱된 시트의 Parquet 캐시 (엑셀 파일 해시 기준, 빈 값 = 끔 / pyarrow 없으면 자동으로 끔)
+SHEET_CACHE_DIR = os.getenv("SHEET_CACHE_DIR", "./sheet_cache")
+
+# 임베딩 단계: 배치 크기 / 동시 요청 수 / 초당 요청 상한(token bucket, 0 = 제한 없음) / 재시도
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_RATE_PER_SEC = float(os.getenv("EMBED_RATE_PER_SEC", "8"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_BACKOFF_SEC = float(os.getenv("EMBED_BACKOFF_SEC", "1.0"))
+
 def normalize_text(x: str) -> str:
     if x is None:
         return ""
@@ -23,41 +66,78 @@ def normalize_text(x: str) -> str:
     x = re.sub(r"\n{3,}", "\n\n", x)
     return x.strip()
 
-def ingest_data():
-    print("📂 데이터 로딩 및 DB 구축 시작...")
+def content_hash(doc: Document) -> str:
+    # 본문 + 메타데이터(제목/seq 변경도 반영)
+    payload = json.dumps(
+        {"text": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
-    file_path = "test-data2.xlsx"
-    try:
-        df = pd.read_excel(file_path)
-    except FileNotFoundError:
-        print(f"❌ 파일을 찾을 수 없습니다: {file_path}")
-        return
+def known_chunks(manifest: dict) -> dict:
+    # 임베딩 모델이 바뀌면 기존 벡터는 모두 무효
+    if manifest.get("embed_model") != EMBED_MODEL_ID:
+        return {}
+    return manifest.get("chunks", {})
 
-    # 불필요 컬럼 제거
-    df = df.drop(columns=[c for c in df.columns if c.startswith("Unnamed")], errors="ignore")
+def resolve_base() -> Tuple[Optional[str], Optional[str], dict]:
+    """(base 스냅샷, base Chroma 경로, base 매니페스트). 스냅샷이 없으면 기존 PERSIST_DIR 을 base로."""
+    base = read_current(INDEX_ROOT)
+    if base:
+        return base, SnapshotPaths(INDEX_ROOT, base).chroma_dir, read_manifest(INDEX_ROOT, base)
+    if os.path.isdir(PERSIST_DIR):
+        try:
+            with open(LEGACY_MANIFEST_PATH, encoding="utf-8") as f:
+                return None, PERSIST_DIR, json.load(f)
+        except (OSError, ValueError):
+            return None, PERSIST_DIR, {}
+    return None, None, {}
 
-    # 텍스트 splitter (대략적인 길이 기준, 상황에 맞게 조절 가능)
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=900,      # 임베딩 512 토큰 truncate를 고려해 넉넉히 쪼갬
-        chunk_overlap=150,
-        separators=["\n\n", "\n", ". ", " "]
-    )
+def chunk_params(counter: TokenCounter) -> dict:
+    # chunk 경계를 결정하는 값 (하나라도 바뀌면 사실상 전체 chunk가 바뀜)
+    return {
+        "unit": "tokens",
+        "tokenizer": counter.fingerprint,
+        "max_tokens": CHUNK_MAX_TOKENS,
+        "overlap_tokens": CHUNK_OVERLAP_TOKENS,
+    }
 
-    docs = []
-    print(f"🔹 총 {len(df)}개의 데이터를 처리합니다.")
+def snapshot_manifest(
+    status: str, base: Optional[str], started: float, chunks: dict, counter: TokenCounter
+) -> dict:
+    return {
+        "status": status,
+        "base": base,
+        "created_at": started,
+        "embed_model": EMBED_MODEL_ID,
+        "tokenizer_source": counter.name,
+        "chunk_params": chunk_params(counter),
+        "doc_count": len(chunks),
+        "chunks": chunks,
+    }
+
+def collection_ids(chroma_dir: Optional[str]) -> set:
+    if not chroma_dir or not os.path.isdir(chroma_dir):
+        return set()
+    store = Chroma(persist_directory=chroma_dir, collection_name=COLLECTION_NAME)
+    return set(store._collection.get(include=[])["ids"])
+
+def _field(row: dict, key: str, default: str) -> str:
+    v = row.get(key)
+    return default if v is None else str(v)
 
-    for _, row in df.iterrows():
-        case_id = str(row.get("case_id", "unknown"))
-        dept = str(row.get("medical_dept", "unknown"))
-        title = str(row.get("title", "N/A"))
-        seq = str(row.get("seq", ""))
+def build_documents(rows: Iterable[dict], chunker: TokenChunker) -> Iterator[Document]:
+    for row in rows:
+        case_id = _field(row, "case_id", "unknown")
+        dept = _field(row, "medical_dept", "unknown")
+        title = _field(row, "title", "N/A")
+        seq = _field(row, "seq", "")
 
         sections = {
-            "overview": row.get("case_overview", ""),
-            "issues": row.get("issues", ""),
-            "solution": row.get("solution", ""),
-            "result": row.get("result", ""),
-            "final_result": row.get("final_result", ""),
+            "overview": row.get("case_overview"),
+            "issues": row.get("issues"),
+            "solution": row.get("solution"),
+            "result": row.get("result"),
+            "final_result": row.get("final_result"),
         }
 
         for section_name, section_text in sections.items():
@@ -65,15 +145,16 @@ def ingest_data():
             if not section_text:
                 continue
 
-            # 섹션별 chunking
-            chunks = splitter.split_text(section_text)
+            header = (
+                f"[사건명]: {title}\n"
+                f"[진료과목]: {dept}\n"
+                f"[섹션]: {section_name}\n\n"
+            )
+
+            # 섹션별 chunking (헤더 포함 토큰 예산 기준)
+            chunks = chunker.split(header, section_text)
             for i, ch in enumerate(chunks):
-                content = (
-                    f"[사건명]: {title}\n"
-                    f"[진료과목]: {dept}\n"
-                    f"[섹션]: {section_name}\n\n"
-                    f"{ch}"
-                )
+                content = header + ch
 
                 metadata = {
                     "case_id": case_id,
@@ -84,35 +165,190 @@ def ingest_data():
                     "chunk_id": f"{case_id}:{section_name}:{i}",
                 }
 
-                docs.append(Document(page_content=content, metadata=metadata))
+                yield Document(page_content=content, metadata=metadata)
+
+def dedupe_chunk_ids(docs: Iterable[Document]) -> Iterator[Document]:
+    # chunk_id가 Chroma id가 되므로 유일해야 함 (case_id 누락 행 등은 #n 접미사)
+    seen = {}
+    for d in docs:
+        cid = d.metadata["chunk_id"]
+        n = seen.get(cid, 0)
+        seen[cid] = n + 1
+        if n:
+            d.metadata["chunk_id"] = f"{cid}#{n}"
+            if n == 1:
+                print(f"⚠️ 중복 chunk_id '{cid}' → '#n' 접미사로 구분 (case_id 확인 필요)")
+        yield d
+
+def load_documents(file_path: str, chunker: TokenChunker) -> Iterator[Document]:
+    # 행 → chunk Document 를 하나씩 생성 (시트/청크 전체를 메모리에 올리지 않음)
+    return dedupe_chunk_ids(build_documents(iter_sheet_rows(file_path, SHEET_CACHE_DIR), chunker))
+
+def changed_batches(
+    docs: Iterable[Document], changed: set, size: int
+) -> Iterator[Tuple[List[str], List[str], List[dict]]]:
+    # 변경/신규 chunk만 골라 (ids, texts, metadatas) 배치로 (Document를 모아 두지 않고 스트리밍)
+    batch = ([], [], [])
+    for d in docs:
+        cid = d.metadata["chunk_id"]
+        if cid not in changed:
+            continue
+        batch[0].append(cid)
+        batch[1].append(d.page_content)
+        batch[2].append(d.metadata)
+        if len(batch[0]) >= size:
+            yield batch
+            batch = ([], [], [])
+    if batch[0]:
+        yield batch
+
+def ingest_data(full: bool = False, rechunk: bool = False):
+    print("📂 데이터 로딩 및 DB 구축 시작...")
+
+    file_path = "test-data2.xlsx"
+    if not os.path.exists(file_path):
+        print(f"❌ 파일을 찾을 수 없습니다: {file_path}")
+        return
 
     # 임베딩 설정
     embed_params = {
-        EmbedTextParamsMetaNames.TRUNCATE_INPUT_TOKENS: 512,
+        EmbedTextParamsMetaNames.TRUNCATE_INPUT_TOKENS: EMBED_MAX_TOKENS,
         EmbedTextParamsMetaNames.RETURN_OPTIONS: {"input_text": True},
     }
 
     embeddings = WatsonxEmbeddings(
-        model_id="ibm/granite-embedding-278m-multilingual",
+        model_id=EMBED_MODEL_ID,
         url=IBM_URL,
         project_id=PROJECT_ID,
         params=embed_params,
         apikey=WATSONX_API,
     )
 
-    # DB 재생성
-    if os.path.exists(PERSIST_DIR):
-        print("⚠️ 기존 DB 폴더가 존재합니다. 덮어쓰기를 진행합니다.")
-        shutil.rmtree(PERSIST_DIR)
+    counter = TokenCounter(EMBED_TOKENIZER)
+    chunker = TokenChunker(counter, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS)
+    chunk_stats = ChunkStats(counter, EMBED_MAX_TOKENS)
+
+    # 새 스냅샷에 증분 반영: 현재(CURRENT) 스냅샷을 복사해 바뀐 chunk만 임베딩
+    #  → 서버는 ingest 중에도 기존 스냅샷으로 응답하고, 게시(publish) 후 전환
+    base, base_chroma, base_manifest = resolve_base()
+    resume = None if full else find_resumable(INDEX_ROOT, base, EMBED_MODEL_ID)
+    if resume:
+        target = SnapshotPaths(INDEX_ROOT, resume)
+        manifest = read_manifest(INDEX_ROOT, resume)
+        # 중단 전 끝난 배치 (building 매니페스트 + 배치별 checkpoint 로그)
+        manifest["chunks"] = {**manifest.get("chunks", {}), **read_checkpoint(INDEX_ROOT, resume)}
+        print(f"↩️ 중단된 스냅샷 이어서 진행: {resume}")
+        existing_ids = collection_ids(target.chroma_dir)
+    else:
+        target = None
+        manifest = base_manifest
+        # 임베딩 모델이 바뀌었거나 --full 이면 base를 복사하지 않고 빈 컬렉션에서 시작
+        #  (차원이 다르면 upsert가 Chroma 차원 검사에서 실패, 같아도 이전 모델 벡터가 섞여 남음)
+        if full or manifest.get("embed_model") != EMBED_MODEL_ID:
+            if base_chroma:
+                print(f"🧹 임베딩 모델 변경/전체 재구축: base 복사 없이 새 컬렉션 ({manifest.get('embed_model')} → {EMBED_MODEL_ID})")
+            base_chroma = None
+        existing_ids = collection_ids(base_chroma)
+    known = {} if full else known_chunks(manifest)
+
+    # chunking 설정(tokenizer 포함)이 기존 인덱스와 다르면 모든 chunk가 다시 임베딩됨 → 명시적으로만 허용
+    old_params = manifest.get("chunk_params")
+    if known and old_params != chunk_params(counter) and not rechunk:
+        print(f"❌ chunking 설정이 기존 인덱스와 다름: {old_params} → {chunk_params(counter)}")
+        print("   전체 재chunking/재임베딩이 의도한 것이면 --rechunk 로 다시 실행하세요.")
+        return
+    started = manifest.get("created_at") if resume else time.time()
+
+    # 1st pass: chunk_id → 해시와 변경/신규 id만 모음 (Document 본문은 보관하지 않음)
+    hashes = {}
+    changed = set()
+    for d in load_documents(file_path, chunker):
+        chunk_stats.add(d.page_content)
+        cid = d.metadata["chunk_id"]
+        h = hashes[cid] = content_hash(d)
+        if cid not in existing_ids or known.get(cid) != h:
+            changed.add(cid)
+
+    # 매니페스트 이전(from_documents, uuid id)에 만든 레코드도 여기서 정리됨
+    stale = sorted(existing_ids - hashes.keys())
+    print(f"🔹 chunks={len(hashes)} 변경/신규={len(changed)} 삭제={len(stale)} 유지={len(hashes) - len(changed)}")
+    c = chunk_stats.report()
+    print(
+        f"📏 chunk 토큰 ({counter.name}{'' if counter.exact else ', 추정'}): 합계 {c['tokens']} "
+        f"평균 {c['mean_tokens']} 최대 {c['max_tokens']} / 한도 {EMBED_MAX_TOKENS} (채움률 {c['fill_ratio']}) "
+        f"→ {EMBED_MAX_TOKENS} 초과로 잘리는 chunk {c['truncated']}개 (버려지는 토큰 {c['truncated_tokens']})"
+    )
+
+    if base and not resume and not changed and not stale:
+        print(f"✅ 변경 없음: 현재 스냅샷 유지 ({base})")
+        return
+
+    if target is None:
+        target = create_snapshot(INDEX_ROOT, base_chroma)
+        print(f"🆕 스냅샷 생성: {target.version} (base={base or base_chroma or '없음'})")
 
-    Chroma.from_documents(
-        documents=docs,
-        embedding=embeddings,
-        persist_directory=PERSIST_DIR,
-        collection_name=COLLECTION_NAME
+    # 이미 반영된 chunk만 매니페스트에 남기고, 배치가 끝날 때마다 checkpoint 로그에 추가
+    #  → 중단되더라도 재실행 시 같은 스냅샷에서 끝난 배치는 건너뜀
+    done = {cid: h for cid, h in hashes.items() if cid not in changed}
+    write_manifest(INDEX_ROOT, target.version, snapshot_manifest("building", base, started, done, counter))
+    clear_checkpoint(INDEX_ROOT, target.version)
+
+    vectorstore = Chroma(
+        persist_directory=target.chroma_dir,
+        embedding_function=embeddings,
+        collection_name=COLLECTION_NAME,
     )
 
-    print(f"✅ DB 구축 완료! docs={len(docs)} 저장 경로: {PERSIST_DIR}")
+    # 2nd pass: 시트 캐시에서 다시 스트리밍하며 변경 chunk만 임베딩
+    batches = changed_batches(load_documents(file_path, chunker), changed, EMBED_BATCH_SIZE)
+    stats = EmbedStats(counter)
+    for ids, texts, metadatas, vectors in embed_batches(
+        embeddings.embed_documents,
+        batches,
+        concurrency=EMBED_CONCURRENCY,
+        rate_per_sec=EMBED_RATE_PER_SEC,
+        max_retries=EMBED_MAX_RETRIES,
+        backoff_sec=EMBED_BACKOFF_SEC,
+        stats=stats,
+    ):
+        # 같은 chunk_id는 교체
+        vectorstore._collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            documents=texts,
+            metadatas=metadatas,
+        )
+        batch_done = {cid: hashes[cid] for cid in ids}
+        done.update(batch_done)
+        append_checkpoint(INDEX_ROOT, target.version, batch_done)
+        print(f"   ↳ upsert {stats.chunks}/{len(changed)}")
+
+    if stale:
+        vectorstore.delete(ids=stale)
+
+    print(f"✅ DB 구축 완료! docs={len(hashes)} 저장 경로: {target.chroma_dir}")
+    if changed:
+        r = stats.report()
+        print(
+            f"📈 임베딩 {r['chunks']} chunks / {r['batches']} batches in {r['elapsed_sec']}s "
+            f"→ {r['chunks_per_sec']} chunks/s, ~{r['tokens_per_sec']} tokens/s "
+            f"(토큰 {r['est_tokens']}, 재시도 {r['retries']}, rate limit 대기 {r['throttled_sec']}s)"
+        )
+
+    # 3rd pass: BM25 (역시 시트 캐시에서 스트리밍)
+    lex_meta = build_lexical_index(load_documents(file_path, chunker), target.bm25_dir)
+    print(f"✅ BM25 인덱스 구축 완료! terms={lex_meta['n_terms']} 저장 경로: {target.bm25_dir}")
+
+    write_manifest(INDEX_ROOT, target.version, snapshot_manifest("ready", base, started, done, counter))
+    clear_checkpoint(INDEX_ROOT, target.version)
+    publish(INDEX_ROOT, target.version)
+    removed = prune(INDEX_ROOT, SNAPSHOT_KEEP, protect=[base])
+    print(f"🚀 스냅샷 게시: {target.version} (CURRENT 교체{', 정리: ' + ', '.join(removed) if removed else ''})")
+    print("   서버는 INDEX_VERSION_CHECK_SEC 안에 자동 전환하거나 POST /admin/index/reload 로 즉시 전환")
 
 if __name__ == "__main__":
-    ingest_data()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--full", action="store_true", help="매니페스트를 무시하고 전체 재임베딩")
+    ap.add_argument("--rechunk", action="store_true", help="chunking 설정(tokenizer/토큰 예산) 변경을 허용")
+    args = ap.parse_args()
+    ingest_data(full=args.full, rechunk=args.rechunk)
@@ -0,0 +1,96 @@
+# intent_rules.py (DOC/CHAT 로컬 규칙 분류기: LLM 라우터 앞단 fast path)
+import re
+from typing import Dict, List, Pattern, Tuple
+
+# ---------------------------------------------------------------------
+# Cue patterns (공백 제거한 문장에 매칭) - (pattern, weight)
+# ---------------------------------------------------------------------
+# 문서 종류 명사
+_DOC_NOUN_CUES: List[Tuple[str, float]] = [
+    (r"내용증명", 2.0),
+    (r"(손해배상)?청구서", 2.0),
+    (r"조정신청서|신청서", 2.0),
+    (r"합의서|각서|공문|통지서|진정서", 2.0),
+    # "소장"은 장기(small intestine)와 겹침 → 소송 문서 의미로 쓰인 경우만
+    (r"고소장|소송소장|소장(을|를)?(작성|초안|써|제출|접수)", 2.0),
+    (r"이메일|메일|서면|문서|초안|양식|서식", 1.5),
+]
+
+# 작성 요청 동사 (명령/요청형)
+_DOC_WRITE_CUES: List[Tuple[str, float]] = [
+    (r"(써|작성해|만들어|적어|뽑아)(줘|주세요|주실래|줄래|주라|봐)", 2.0),
+    (r"작성(부탁|요청|해야)", 1.5),
+]
+
+# 기존 문서 수정 요청 (금액/날짜/이름/항목/톤)
+_DOC_EDIT_CUES: List[Tuple[str, float]] = [
+    (r"(바꿔|고쳐|수정해|변경해|추가해|넣어|빼|삭제해|지워)(줘|주세요|줄래|주라)", 2.0),
+    (r"(으)?로해(줘|주세요|줄래|주라)?|넣어|항목", 1.5),
+    (r"\d+(만)?원으로", 1.0),
+    # 직전 문서의 금액/날짜 값만 던지는 경우 ("청구금액 300만원", "날짜를 2024-03-01로")
+    (r"\d+(만|천|억)?원|\d{4}[-./년]\d{1,2}[-./월]\d{1,2}", 1.0),
+    (r"톤(을|으로)?|말투|더정중하게|공손하게", 1.0),
+]
+
+# 상담/검색/설명 요청
+_CHAT_CUES: List[Tuple[str, float]] = [
+    (r"판례|사례|판결", 1.5),
+    (r"알려(줘|주세요|줄래)|설명해(줘|주세요)", 1.5),
+    (r"뭐야|뭔가요|무엇|어떻게|어떡|왜|방법|절차|가능(해|한가|할까|성)", 1.5),
+    (r"(있어|있나요|있을까|되나요|될까|맞나요|인가요)\??$", 1.0),
+    (r"\?$", 0.5),
+]
+
+# 의료 맥락 (문서 명사와 겹치는 장기/증상 표현) → CHAT 쪽 점수
+_MEDICAL_CONTEXT_CUES: List[Tuple[str, float]] = [
+    (r"소장(에|이|의|염|암|내시경|절제|폐색|출혈|천공|질환|통증|검사|수술)", 2.0),
+    (r"통증|아파|아프|증상|부작용|출혈|염증", 1.0),
+]
+
+
+def _compile(cues: List[Tuple[str, float]]) -> List[Tuple[Pattern[str], float]]:
+    return [(re.compile(p), w) for p, w in cues]
+
+
+_DOC_RULES = _compile(_DOC_NOUN_CUES + _DOC_WRITE_CUES + _DOC_EDIT_CUES)
+_CHAT_RULES = _compile(_CHAT_CUES + _MEDICAL_CONTEXT_CUES)
+
+
+def _score(text: str, rules: List[Tuple[Pattern[str], float]]) -> float:
+    return sum(w for rx, w in rules if rx.search(text))
+
+
+def classify_intent(question: str) -> Dict[str, float]:
+    """
+    DOC/CHAT 키워드 점수 기반 분류.
+    - DOC 신호가 없고 CHAT 신호가 있으면 CHAT
+    - 둘 다 없으면 (예: "청구인은 홍길동") 규칙으로 단정하지 않고 LLM 라우터로 넘김
+    - DOC 신호만 충분히 강하면 DOC
+    - 둘이 섞이거나 약하면 confidence를 낮춰 LLM 라우터로 넘김
+
+    return: {"intent": "DOC"|"CHAT", "confidence": 0~1, "doc_score", "chat_score"}
+    """
+    compact = re.sub(r"\s+", "", question or "")
+    doc_score = _score(compact, _DOC_RULES)
+    chat_score = _score(compact, _CHAT_RULES)
+
+    if doc_score == 0:
+        confidence = 0.95 if chat_score > 0 else 0.6
+        intent = "CHAT"
+    elif chat_score == 0 and doc_score >= 3.5:
+        intent, confidence = "DOC", 0.95
+    elif chat_score == 0 and doc_score >= 2.0:
+        intent, confidence = "DOC", 0.85
+    elif doc_score - chat_score >= 3.0:
+        intent, confidence = "DOC", 0.8
+    else:
+        # 신호 혼재 (예: "내용증명은 어떻게 보내?") → LLM 판단 필요
+        intent = "DOC" if doc_score > chat_score else "CHAT"
+        confidence = 0.5
+
+    return {
+        "intent": intent,
+        "confidence": confidence,
+        "doc_score": doc_score,
+        "chat_score": chat_score,
+    }
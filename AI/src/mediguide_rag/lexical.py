@@ -0,0 +1,75 @@
+# lexical.py (한국어 문자 n-gram 토크나이저 + BM25 점수)
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Iterable, List, Sequence, Tuple
+
+# 한글/영문/숫자만 남기고 나머지는 구분자로 취급
+_NON_WORD = re.compile(r"[^0-9a-z가-힣]+")
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def char_ngrams(text: str, ns: Tuple[int, ...] = (2, 3)) -> List[str]:
+    """
+    교착어(조사/어미)에 강한 어절 내부 문자 n-gram.
+    - "백내장수술을" → 백내, 내장, 장수, ..., 백내장, 내장수, ...
+    - n보다 짧은 어절은 어절 자체를 토큰으로 사용
+    """
+    t = unicodedata.normalize("NFKC", text or "").lower()
+    tokens: List[str] = []
+    for word in _NON_WORD.split(t):
+        if not word:
+            continue
+        if len(word) < min(ns):
+            tokens.append(word)
+            continue
+        for n in ns:
+            tokens.extend(word[i : i + n] for i in range(len(word) - n + 1))
+    return tokens
+
+
+def bm25_scores(
+    query_tokens: Sequence[str],
+    docs_tokens: Sequence[Sequence[str]],
+    k1: float = BM25_K1,
+    b: float = BM25_B,
+) -> List[float]:
+    """
+    작은 문서 집합(예: rerank 후보 25개) 안에서 바로 계산하는 BM25.
+    (전체 코퍼스 인덱스가 아니므로 IDF도 이 집합 기준)
+    """
+    n_docs = len(docs_tokens)
+    if n_docs == 0:
+        return []
+
+    tfs = [Counter(toks) for toks in docs_tokens]
+    lengths = [len(toks) for toks in docs_tokens]
+    avgdl = (sum(lengths) / n_docs) or 1.0
+
+    q_terms = set(query_tokens)
+    df = {term: sum(1 for tf in tfs if term in tf) for term in q_terms}
+
+    scores: List[float] = []
+    for tf, dl in zip(tfs, lengths):
+        s = 0.0
+        for term in q_terms:
+            f = tf.get(term, 0)
+            if not f:
+                continue
+            idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+            s += idf * f * (k1 + 1) / (f + k1 * (1 - b + b * dl / avgdl))
+        scores.append(s)
+    return scores
+
+
+def minmax(values: Iterable[float]) -> List[float]:
+    vals = list(values)
+    if not vals:
+        return []
+    lo, hi = min(vals), max(vals)
+    if hi - lo <= 1e-12:
+        return [1.0 if hi > 0 else 0.0 for _ in vals]
+    return [(v - lo) / (hi - lo) for v in vals]
@@ -0,0 +1,211 @@
+# lexical_index.py (코퍼스 전체 BM25 역색인: ingest 시 구축 → 디스크(mmap postings) → 서버에서 lazy 로드)
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+try:
+    from .lexical import BM25_B, BM25_K1, char_ngrams
+except ImportError:
+    from lexical import BM25_B, BM25_K1, char_ngrams
+
+# ---------------------------------------------------------------------
+# 디스크 포맷 (index_dir/)
+#   vocab.json      : {term: term_id}
+#   offsets.npy     : int64[n_terms+1]  term_id의 postings = [offsets[t], offsets[t+1])
+#   post_docs.npy   : int32[nnz]        문서 번호 (term별 오름차순)
+#   post_tfs.npy    : uint16[nnz]       term frequency
+#   doc_len.npy     : float32[n_docs]   문서 토큰 수
+#   docs.jsonl      : 문서 번호 순서의 {"text", "metadata"} (lexical 단독 hit를 Document로 복원)
+#   meta.json       : n_docs / avgdl / k1 / b / built_at
+# ---------------------------------------------------------------------
+_META_FILE = "meta.json"
+_TF_MAX = np.iinfo(np.uint16).max
+
+
+def build_lexical_index(docs: Iterable[Document], index_dir: str) -> Dict[str, float]:
+    """
+    docs → BM25 역색인. 임시 디렉터리에 다 쓴 뒤 교체 (서버가 반쯤 쓴 인덱스를 읽지 않도록).
+    """
+    vocab: Dict[str, int] = {}
+    postings: List[List[Tuple[int, int]]] = []
+    doc_len: List[int] = []
+
+    tmp_dir = index_dir.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    with open(os.path.join(tmp_dir, "docs.jsonl"), "w", encoding="utf-8") as f:
+        for doc_id, d in enumerate(docs):
+            tokens = char_ngrams(d.page_content or "")
+            doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                tid = vocab.get(term)
+                if tid is None:
+                    tid = vocab[term] = len(postings)
+                    postings.append([])
+                postings[tid].append((doc_id, min(tf, _TF_MAX)))
+            f.write(json.dumps({"text": d.page_content, "metadata": d.metadata}, ensure_ascii=False) + "\n")
+
+    offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in postings], out=offsets[1:])
+    post_docs = np.fromiter((doc for p in postings for doc, _ in p), dtype=np.int32, count=int(offsets[-1]))
+    post_tfs = np.fromiter((tf for p in postings for _, tf in p), dtype=np.uint16, count=int(offsets[-1]))
+
+    np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(tmp_dir, "post_docs.npy"), post_docs)
+    np.save(os.path.join(tmp_dir, "post_tfs.npy"), post_tfs)
+    np.save(os.path.join(tmp_dir, "doc_len.npy"), np.asarray(doc_len, dtype=np.float32))
+    with open(os.path.join(tmp_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+
+    meta = {
+        "n_docs": len(doc_len),
+        "n_terms": len(vocab),
+        "avgdl": (sum(doc_len) / len(doc_len)) if doc_len else 1.0,
+        "k1": BM25_K1,
+        "b": BM25_B,
+        "built_at": time.time(),
+    }
+    with open(os.path.join(tmp_dir, _META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    old_dir = index_dir.rstrip("/\\") + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return meta
+
+
+class LexicalHit:
+    __slots__ = ("doc", "score", "coverage", "rare_terms")
+
+    def __init__(self, doc: Document, score: float, coverage: float, rare_terms: int = 0) -> None:
+        self.doc = doc
+        self.score = score
+        # 질의 term(코퍼스에 있는 것) IDF 중 이 문서가 포함한 비율 (0~1)
+        self.coverage = coverage
+        # 문서가 포함한 질의의 희소 다문자 term 수 (길이 >= rare_min_len, IDF >= rare_min_idf)
+        #  → "병원 진료" 같은 흔한 2글자 term만으로는 0
+        self.rare_terms = rare_terms
+
+
+class LexicalIndex:
+    """
+    build_lexical_index()가 만든 역색인을 첫 검색 때 로드 (postings는 mmap).
+    - 인덱스가 없으면 빈 결과 (하이브리드 검색이 꺼진 것과 동일)
+    - meta.json 수정 시각이 바뀌면(ingest 재실행) 다음 검색에서 다시 로드
+    """
+
+    def __init__(self, index_dir: str) -> None:
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self._loaded_mtime: Optional[float] = None
+        self._state: Optional[Tuple] = None
+        self._missing_logged = False
+
+    def _meta_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(os.path.join(self.index_dir, _META_FILE))
+        except OSError:
+            return None
+
+    def _ensure_loaded(self) -> Optional[Tuple]:
+        mtime = self._meta_mtime()
+        with self._lock:
+            if mtime == self._loaded_mtime:
+                return self._state
+            if mtime is None:
+                if not self._missing_logged:
+                    print(f"⚠️ BM25 인덱스 없음({self.index_dir}): ingest.py 실행 전까지 벡터 검색만 사용")
+                    self._missing_logged = True
+                self._state = None
+                self._loaded_mtime = None
+                return None
+
+            d = self.index_dir
+            with open(os.path.join(d, _META_FILE), encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(os.path.join(d, "vocab.json"), encoding="utf-8") as f:
+                vocab = json.load(f)
+            docs: List[Document] = []
+            with open(os.path.join(d, "docs.jsonl"), encoding="utf-8") as f:
+                for line in f:
+                    rec = json.loads(line)
+                    docs.append(Document(page_content=rec["text"], metadata=rec["metadata"] or {}))
+            self._state = (
+                meta,
+                vocab,
+                np.load(os.path.join(d, "offsets.npy"), mmap_mode="r"),
+                np.load(os.path.join(d, "post_docs.npy"), mmap_mode="r"),
+                np.load(os.path.join(d, "post_tfs.npy"), mmap_mode="r"),
+                np.load(os.path.join(d, "doc_len.npy")),
+                docs,
+            )
+            self._loaded_mtime = mtime
+            self._missing_logged = False
+            return self._state
+
+    def search(
+        self, query: str, k: int, rare_min_idf: float = 2.0, rare_min_len: int = 3
+    ) -> List[LexicalHit]:
+        state = self._ensure_loaded()
+        if state is None or k <= 0:
+            return []
+        meta, vocab, offsets, post_docs, post_tfs, doc_len, docs = state
+        n_docs = int(meta["n_docs"])
+        if n_docs == 0:
+            return []
+
+        k1, b = float(meta["k1"]), float(meta["b"])
+        norm = k1 * (1 - b + b * doc_len / float(meta["avgdl"] or 1.0))
+        scores = np.zeros(n_docs, dtype=np.float32)
+        covered = np.zeros(n_docs, dtype=np.float32)
+        rare = np.zeros(n_docs, dtype=np.int32)
+        idf_total = 0.0
+
+        for term in set(char_ngrams(query)):
+            tid = vocab.get(term)
+            if tid is None:
+                continue
+            lo, hi = int(offsets[tid]), int(offsets[tid + 1])
+            ids = np.asarray(post_docs[lo:hi])
+            tf = np.asarray(post_tfs[lo:hi], dtype=np.float32)
+            df = hi - lo
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            idf_total += idf
+            scores[ids] += idf * tf * (k1 + 1) / (tf + norm[ids])
+            covered[ids] += idf
+            if len(term) >= rare_min_len and idf >= rare_min_idf:
+                rare[ids] += 1
+
+        if idf_total <= 0:
+            return []
+        nz = np.flatnonzero(scores)
+        if nz.size == 0:
+            return []
+        k = min(k, nz.size)
+        top = nz[np.argpartition(-scores[nz], k - 1)[:k]] if k < nz.size else nz
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            LexicalHit(docs[i], float(scores[i]), float(covered[i] / idf_total), int(rare[i]))
+            for i in top.tolist()
+        ]
+
+
+def rrf_fuse(rankings: List[List[str]], k: int = 60) -> Dict[str, float]:
+    """reciprocal rank fusion: key → Σ 1/(k + rank)"""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return fused
@@ -0,0 +1,44 @@
+# metrics.py (프로세스 내 카운터/게이지: /metrics 엔드포인트 및 로그용)
+import threading
+from collections import defaultdict
+from typing import Any, Dict
+
+
+def _key(name: str, labels: Dict[str, Any]) -> str:
+    if not labels:
+        return name
+    inner = ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+    return f"{name}{{{inner}}}"
+
+
+class Metrics:
+    """
+    가벼운 스레드 안전 카운터/게이지 모음.
+    - inc("chat_cancelled_total", reason="disconnect") → "chat_cancelled_total{reason=disconnect}"
+    - 외부 의존성(prometheus 등) 없이 snapshot()을 JSON으로 노출
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        with self._lock:
+            self._counters[_key(name, labels)] += value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def get(self, name: str, **labels: Any) -> float:
+        key = _key(name, labels)
+        with self._lock:
+            return self._counters.get(key, self._gauges.get(key, 0))
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {"counters": dict(self._counters), "gauges": dict(self._gauges)}
+
+
+metrics = Metrics()
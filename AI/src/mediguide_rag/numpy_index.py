@@ -0,0 +1,260 @@
+# numpy_index.py (Chroma 컬렉션을 float32/float16 행렬로 내보내 brute-force 정확 검색)
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+_VECTORS_FILE = "vectors.npy"
+_SQNORMS_FILE = "sqnorms.npy"
+_DOCS_FILE = "docs.jsonl"
+_META_FILE = "meta.json"
+
+# 수천 개 청크 규모면 HNSW보다 행렬곱 한 번이 빠르고 결과도 정확(exact)
+_EXPORT_BATCH = 1000
+# float16 저장 시 이 행 수만큼씩 float32로 올려 행렬곱 (float16 matmul은 BLAS를 못 타고 반정밀도로 누적됨)
+_SEARCH_BLOCK = 4096
+
+
+def _dots(vectors: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """vectors @ q 를 항상 float32로 계산/누적"""
+    if vectors.dtype == np.float32:
+        return vectors @ q
+    out = np.empty(vectors.shape[0], dtype=np.float32)
+    for i in range(0, vectors.shape[0], _SEARCH_BLOCK):
+        j = i + _SEARCH_BLOCK
+        out[i:j] = vectors[i:j].astype(np.float32) @ q
+    return out
+
+
+def _distances(space: str, dots: np.ndarray, sqnorms: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """Chroma와 같은 거리 정의 (MAX_DISTANCE_THRESHOLD를 그대로 쓰기 위함)"""
+    if space == "cosine":
+        denom = np.sqrt(sqnorms) * float(np.linalg.norm(q))
+        return 1.0 - dots / np.maximum(denom, 1e-12)
+    if space == "ip":
+        return 1.0 - dots
+    # l2 (Chroma 기본): squared L2 = |d|^2 - 2 d·q + |q|^2
+    return np.maximum(sqnorms - 2.0 * dots + float(q @ q), 0.0)
+
+
+def _collection_space(collection: Any) -> str:
+    # chromadb 1.x: configuration_json["hnsw"]["space"], 이전 버전: metadata["hnsw:space"]
+    config = getattr(collection, "configuration_json", None) or {}
+    space = (config.get("hnsw") or {}).get("space")
+    return space or (getattr(collection, "metadata", None) or {}).get("hnsw:space", "l2")
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    읽기 전용 exact vector index.
+    - index_dir/vectors.npy 를 mmap으로 열어 top-k = argpartition(거리)
+    - 원본은 Chroma 컬렉션: 지문(source_version)이 바뀌면 refresh()로 다시 내보냄
+    - 쓰기(add_texts)는 지원하지 않음 (ingest는 계속 Chroma로)
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        embedding: Embeddings,
+        source: Any = None,
+        source_version: Optional[Callable[[], str]] = None,
+        dtype: str = "float32",
+    ) -> None:
+        self.index_dir = index_dir
+        self._embedding = embedding
+        self.source = source
+        self._source_version = source_version
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        # (vectors(mmap), sqnorms, docs, space): refresh 시 통째로 교체 → 검색 중 교체돼도 일관된 스냅샷
+        self._state: Optional[Tuple[np.ndarray, np.ndarray, List[Document], str]] = None
+        self.meta: Dict[str, Any] = {}
+        self.refresh()
+
+    # -----------------------------------------------------------------
+    # Build / load
+    # -----------------------------------------------------------------
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    @property
+    def _client(self) -> Any:
+        # RagEngine.shutdown()이 원본 Chroma 클라이언트 캐시를 정리할 수 있도록
+        return getattr(self.source, "_client", None)
+
+    def count(self) -> int:
+        return int(self.meta.get("count", 0))
+
+    def refresh(self) -> bool:
+        """
+        디스크 인덱스가 원본(Chroma)과 다르면 다시 내보내고 로드.
+        return: 다시 로드했으면 True
+        """
+        version = self._source_version() if self._source_version else None
+        meta = self._read_meta()
+        stale = (
+            meta is None
+            or meta.get("dtype") != self.dtype
+            or (version is not None and meta.get("source_version") != version)
+        )
+        if stale:
+            if self.source is None:
+                raise FileNotFoundError(f"numpy 인덱스가 없거나 오래됨: {self.index_dir}")
+            export_chroma(self.source, self.index_dir, dtype=self.dtype, source_version=version)
+        elif self._state is not None and meta == self.meta:
+            return False
+        self._load()
+        return True
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.index_dir, _META_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _load(self) -> None:
+        meta = self._read_meta() or {}
+        vectors = np.load(os.path.join(self.index_dir, _VECTORS_FILE), mmap_mode="r")
+        sqnorms = np.load(os.path.join(self.index_dir, _SQNORMS_FILE))
+        docs: List[Document] = []
+        with open(os.path.join(self.index_dir, _DOCS_FILE), encoding="utf-8") as f:
+            for line in f:
+                rec = json.loads(line)
+                docs.append(Document(id=rec["id"], page_content=rec["text"], metadata=rec["metadata"] or {}))
+        with self._lock:
+            self._state = (vectors, sqnorms, docs, meta.get("space", "l2"))
+            self.meta = meta
+
+    # -----------------------------------------------------------------
+    # Search
+    # -----------------------------------------------------------------
+    def _search_vector(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray, Any]:
+        with self._lock:
+            state = self._state
+        n = 0 if state is None else state[0].shape[0]
+        if n == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), state
+        vectors, sqnorms, _, space = state
+        dist = _distances(space, _dots(vectors, q), sqnorms, q)
+        k = min(k, n)
+        top = np.argpartition(dist, k - 1)[:k] if k < n else np.arange(n)
+        top = top[np.argsort(dist[top], kind="stable")]
+        return top, dist[top], state
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        q = np.asarray(self._embedding.embed_query(query), dtype=np.float32)
+        return self.similarity_search_with_score_by_vector(q, k=k)
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: Any, k: int = 4
+    ) -> List[Tuple[Document, float]]:
+        idx, dist, state = self._search_vector(np.asarray(embedding, dtype=np.float32), k)
+        if idx.size == 0:
+            return []
+        docs = state[2]
+        return [(docs[i], float(d)) for i, d in zip(idx.tolist(), dist.tolist())]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [d for d, _ in self.similarity_search_with_score(query, k=k)]
+
+    def max_marginal_relevance_search(
+        self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, **kwargs: Any
+    ) -> List[Document]:
+        q = np.asarray(self._embedding.embed_query(query), dtype=np.float32)
+        idx, _, state = self._search_vector(q, fetch_k)
+        if idx.size == 0:
+            return []
+        vectors, _, docs, _ = state
+        cand = np.asarray(vectors[idx], dtype=np.float32)
+        cand /= np.maximum(np.linalg.norm(cand, axis=1, keepdims=True), 1e-12)
+        qn = q / max(float(np.linalg.norm(q)), 1e-12)
+        rel = cand @ qn
+        picked: List[int] = []
+        remaining = list(range(len(idx)))
+        while remaining and len(picked) < k:
+            if picked:
+                red = (cand[remaining] @ cand[picked].T).max(axis=1)
+            else:
+                red = np.zeros(len(remaining), dtype=np.float32)
+            score = lambda_mult * rel[remaining] - (1 - lambda_mult) * red
+            best = remaining[int(np.argmax(score))]
+            picked.append(best)
+            remaining.remove(best)
+        return [docs[int(idx[i])] for i in picked]
+
+    # -----------------------------------------------------------------
+    # VectorStore 추상 메서드 (읽기 전용)
+    # -----------------------------------------------------------------
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("NumpyVectorStore는 읽기 전용입니다. ingest는 Chroma로 하세요.")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, **kwargs: Any):
+        raise NotImplementedError("NumpyVectorStore는 export_chroma()로 만든 인덱스만 엽니다.")
+
+
+def export_chroma(
+    chroma: Any,
+    index_dir: str,
+    dtype: str = "float32",
+    source_version: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Chroma 컬렉션(임베딩/문서/메타데이터) → index_dir/{vectors.npy, sqnorms.npy, docs.jsonl, meta.json}.
+    임시 파일에 쓴 뒤 os.replace로 교체 (읽는 쪽이 반쯤 쓴 파일을 보지 않도록).
+    """
+    collection = chroma._collection
+    space = _collection_space(collection)
+    total = collection.count()
+
+    os.makedirs(index_dir, exist_ok=True)
+    ids: List[str] = []
+    chunks: List[np.ndarray] = []
+    docs_tmp = os.path.join(index_dir, _DOCS_FILE + ".tmp")
+    with open(docs_tmp, "w", encoding="utf-8") as f:
+        for offset in range(0, total, _EXPORT_BATCH):
+            got = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=_EXPORT_BATCH,
+                offset=offset,
+            )
+            chunks.append(np.asarray(got["embeddings"], dtype=np.float32))
+            for i, text, md in zip(got["ids"], got["documents"], got["metadatas"]):
+                ids.append(i)
+                f.write(json.dumps({"id": i, "text": text or "", "metadata": md}, ensure_ascii=False) + "\n")
+
+    vectors = np.concatenate(chunks) if chunks else np.zeros((0, 0), dtype=np.float32)
+    stored = vectors.astype(np.float16 if dtype == "float16" else np.float32)
+    # 저장된(반올림된) 벡터 기준 norm → l2 거리가 저장 벡터와의 정확한 거리가 됨
+    upcast = stored.astype(np.float32, copy=False)
+    sqnorms = np.einsum("ij,ij->i", upcast, upcast).astype(np.float32)
+
+    for name, arr in ((_VECTORS_FILE, stored), (_SQNORMS_FILE, sqnorms)):
+        tmp = os.path.join(index_dir, name + ".tmp")
+        with open(tmp, "wb") as fh:
+            np.save(fh, arr)
+        os.replace(tmp, os.path.join(index_dir, name))
+    os.replace(docs_tmp, os.path.join(index_dir, _DOCS_FILE))
+
+    meta = {
+        "count": len(ids),
+        "dim": int(vectors.shape[1]) if vectors.size else 0,
+        "dtype": dtype,
+        "space": space,
+        "source_version": source_version,
+    }
+    meta_tmp = os.path.join(index_dir, _META_FILE + ".tmp")
+    with open(meta_tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(meta_tmp, os.path.join(index_dir, _META_FILE))
+    print(f"📦 numpy 인덱스 export: {len(ids)}개 ({dtype}, {space}) → {index_dir}")
+    return meta
@@ -1,8 +1,14 @@
 # rag_pipeline.py (Production-grade patch: Anti-hallucination + Anti-infinite-interview + Safe fallback + A/B/C)
 import os
+import asyncio
+import hashlib
 import json
+import random
 import re
-from typing import List, Tuple, Dict, Any, Optional
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Tuple, Dict, Any, Optional
 
 from dotenv import load_dotenv
 
@@ -10,24 +16,47 @@ from langchain_ibm import WatsonxLLM, WatsonxEmbeddings
 from langchain_chroma import Chroma
 
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableLambda, RunnableMap
-from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.runnables import Runnable, RunnableLambda, RunnableMap
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
 
 from ibm_watsonx_ai.metanames import EmbedTextParamsMetaNames
 
-load_dotenv()
-
-# ---------------------------------------------------------------------
-# Global memory store (session -> chat history)
-# ---------------------------------------------------------------------
-store: Dict[str, ChatMessageHistory] = {}
+try:
+    from .admission import AdmissionController, AdmissionRejected
+    from .doc_sections import clean_patch, is_edit_request, is_targeted_edit, plan_revision, render_document
+    from .index_snapshot import (
+        DEFAULT_INDEX_ROOT, SnapshotPaths, acquire_lease, read_current, read_manifest, release_lease,
+    )
+    from .history_window import format_for_summary, is_doc_message, split_history, summary_message_text
+    from .cache import CachedQueryEmbeddings, LRUCache, SemanticAnswerCache, normalize_query
+    from .intent_rules import classify_intent
+    from .lexical import bm25_scores, char_ngrams, minmax
+    from .lexical_index import LexicalHit, LexicalIndex, rrf_fuse
+    from .metrics import metrics
+    from .numpy_index import NumpyVectorStore
+    from .session_store import SessionStore, SQLiteSessionBackend
+except ImportError:
+    from admission import AdmissionController, AdmissionRejected
+    from doc_sections import clean_patch, is_edit_request, is_targeted_edit, plan_revision, render_document
+    from index_snapshot import (
+        DEFAULT_INDEX_ROOT, SnapshotPaths, acquire_lease, read_current, read_manifest, release_lease,
+    )
+    from history_window import format_for_summary, is_doc_message, split_history, summary_message_text
+    from cache import CachedQueryEmbeddings, LRUCache, SemanticAnswerCache, normalize_query
+    from intent_rules import classify_intent
+    from lexical import bm25_scores, char_ngrams, minmax
+    from lexical_index import LexicalHit, LexicalIndex, rrf_fuse
+    from metrics import metrics
+    from numpy_index import NumpyVectorStore
+    from session_store import SessionStore, SQLiteSessionBackend
 
-# (문진 무한 루프 방지용) session -> interview turn count
-_interview_turns: Dict[str, int] = {}
+load_dotenv()
 
 # ---------------------------------------------------------------------
 # Env
@@ -39,11 +68,49 @@ WATSONX_API = os.getenv("API_KEY")
 PERSIST_DIR = "./chroma_db_fixed"
 COLLECTION_NAME = os.getenv("CHROMA_COLLECTION", "mediguide_cases")
 
+# ingest.py가 만드는 버전별 스냅샷 (INDEX_ROOT/CURRENT 가 가리키는 것을 사용, 없으면 PERSIST_DIR)
+#  - CURRENT 교체는 INDEX_VERSION_CHECK_SEC 간격으로 감지해 자동 전환 (INDEX_AUTO_RELOAD=0 이면 /admin/index/reload 로만)
+INDEX_ROOT = os.getenv("INDEX_ROOT", DEFAULT_INDEX_ROOT)
+INDEX_AUTO_RELOAD = os.getenv("INDEX_AUTO_RELOAD", "1") == "1"
+# 전환 후 이전 스냅샷 lease를 유지하는 시간 (그 사이 끝나는 진행 중 요청이 쓰는 파일을 ingest prune이 지우지 않도록)
+INDEX_LEASE_GRACE_SEC = float(os.getenv("INDEX_LEASE_GRACE_SEC", "60"))
+
+# 벡터 검색 백엔드: chroma(HNSW) | numpy(Chroma 임베딩을 mmap 행렬로 내보내 brute-force 정확 검색)
+#  - numpy는 읽기 전용: ingest는 계속 Chroma로 하고, 컬렉션 지문이 바뀌면 다시 내보냄
+#    (스냅샷 사용 시 <snapshot>/numpy, 아니면 VECTOR_INDEX_DIR)
+#  - VECTOR_DTYPE=float16 이면 행렬 메모리 절반 (블록 단위로 float32로 올려 계산)
+#    대신 변환 비용만큼 검색은 느려짐 → benchmarks/vector_bench.py 로 정밀도/지연시간 비교
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").strip().lower()
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "./vector_index")
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32").strip().lower()
+
 # Model IDs (env로 교체 가능)
+EMBED_MODEL_ID = os.getenv("EMBED_MODEL_ID", "ibm/granite-embedding-278m-multilingual")
 MAIN_LLM_ID = os.getenv("MAIN_LLM_ID", "meta-llama/llama-3-405b-instruct")
 RERANK_LLM_ID = os.getenv("RERANK_LLM_ID", "ibm/granite-3-8b-instruct")
+# rerank 방식: llm(RERANK_LLM_ID로 재정렬) | lexical(로컬 BM25 + distance 혼합, LLM 호출 없음)
+RERANKER = os.getenv("RERANKER", "llm").strip().lower()
+LEXICAL_RERANK_WEIGHT = float(os.getenv("LEXICAL_RERANK_WEIGHT", "0.5"))
 ROUTER_LLM_ID = os.getenv("ROUTER_LLM_ID", "ibm/granite-3-8b-instruct")
 WRITER_LLM_ID = os.getenv("WRITER_LLM_ID", "meta-llama/llama-3-405b-instruct")
+SUMMARY_LLM_ID = os.getenv("SUMMARY_LLM_ID", "ibm/granite-3-8b-instruct")
+
+# 모델 id별 동시 LLM 호출 상한 (포화 시 LLM_ADMISSION_WAIT_SEC까지만 대기 후 429)
+#  - LLM_CONCURRENCY_LIMITS='{"meta-llama/llama-3-405b-instruct": 4}' 처럼 모델별 override (0 = 제한 없음)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_CONCURRENCY_LIMITS = os.getenv("LLM_CONCURRENCY_LIMITS", "{}")
+LLM_ADMISSION_WAIT_SEC = float(os.getenv("LLM_ADMISSION_WAIT_SEC", "2.0"))
+
+# ---------------------------------------------------------------------
+# Router knobs (규칙 기반 fast path → 애매할 때만 LLM)
+# ---------------------------------------------------------------------
+ROUTER_RULE_MIN_CONFIDENCE = float(os.getenv("ROUTER_RULE_MIN_CONFIDENCE", "0.8"))
+
+# 규칙으로 결정한 요청 중 일부를 LLM 라우터로 백그라운드 재분류 → 규칙/LLM 일치율 측정 (0이면 끔)
+ROUTER_SHADOW_RATE = float(os.getenv("ROUTER_SHADOW_RATE", "0.05"))
+
+# 라우터 호출과 후보 검색(임베딩+Chroma)을 동시에 시작 (DOC이면 폐기)
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "1") == "1"
 
 # ---------------------------------------------------------------------
 # Retrieval knobs (A: score gate / B: rerank)
@@ -54,45 +121,185 @@ FINAL_K = 5
 # distance(낮을수록 유사) 가정. 환경에 따라 튜닝 필요.
 MAX_DISTANCE_THRESHOLD = float(os.getenv("MAX_DISTANCE_THRESHOLD", "0.45"))
 
+# 하이브리드 후보 검색: 벡터 top-k + BM25 역색인 top-k 를 RRF로 합침 (ingest.py가 인덱스 생성)
+#  - 시술명/약품명처럼 임베딩이 약한 질의에서 게이트 실패 → 불필요한 문진 전환을 줄임
+#  - 게이트는 항상 실제 벡터 distance 기준. 별도 조건(lexical rescue)으로만 통과시킴:
+#    BM25 hit이 희소 다문자 term(길이 3+, IDF >= LEXICAL_RESCUE_MIN_IDF)을 LEXICAL_RESCUE_MIN_TERMS개 이상 포함하고
+#    질의 term 커버리지(IDF 가중)가 LEXICAL_GATE_COVERAGE 이상
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", f"{PERSIST_DIR}_bm25")  # 스냅샷이 없을 때만
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+LEXICAL_GATE_COVERAGE = float(os.getenv("LEXICAL_GATE_COVERAGE", "0.8"))
+LEXICAL_RESCUE_MIN_IDF = float(os.getenv("LEXICAL_RESCUE_MIN_IDF", "2.0"))
+LEXICAL_RESCUE_MIN_TERMS = int(os.getenv("LEXICAL_RESCUE_MIN_TERMS", "2"))
+
 MAX_CONTEXT_CHARS_PER_DOC = 1400
 
+# 질의 임베딩 캐시 (memory LRU + 선택적 SQLite 디스크 티어, 경로가 비어 있으면 디스크 끔)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+EMBED_CACHE_TTL_SEC = float(os.getenv("EMBED_CACHE_TTL_SEC", "86400"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "")
+
+# rerank 결과 캐시 (TTL 0 = 만료 없음, 인덱스 재구축 시 flush)
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "1024"))
+RERANK_CACHE_TTL_SEC = float(os.getenv("RERANK_CACHE_TTL_SEC", "0"))
+
+# 첫 턴 질문 의미 기반 답변 캐시 (SIZE 0 = 끔)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_TTL_SEC = float(os.getenv("ANSWER_CACHE_TTL_SEC", "21600"))
+
+# LLM 라우터 결과 캐시 크기
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", "4096"))
+
+# warmer: 추천 질문 + 상위 질의 답변 갱신 주기 (0 = startup 1회만)
+WARM_REFRESH_SEC = float(os.getenv("WARM_REFRESH_SEC", "3600"))
+
+# 컬렉션 변경(재구축) 감지 주기 → 결과 캐시 자동 무효화
+INDEX_VERSION_CHECK_SEC = float(os.getenv("INDEX_VERSION_CHECK_SEC", "30"))
+
+# Chroma 질의용 스레드 풀 크기 (동시 벡터 검색 상한)
+VECTOR_MAX_WORKERS = int(os.getenv("VECTOR_MAX_WORKERS", "4"))
+
 # 문진 최대 턴(세션 당)
 MAX_INTERVIEW_TURNS = int(os.getenv("MAX_INTERVIEW_TURNS", "2"))
 
+# 솔루션/문진/fallback 프롬프트에 넣을 대화 내역 창 (추정 토큰 기준)
+#  - 예산 밖의 오래된 턴은 SUMMARY_LLM_ID로 rolling 요약 (세션별 캐시, 백그라운드 갱신)
+#  - 요약 전이라도 pending이 HISTORY_SUMMARY_MIN_PENDING개 미만이면 원문 그대로 포함
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_MIN_MESSAGES = int(os.getenv("HISTORY_MIN_MESSAGES", "2"))
+HISTORY_SUMMARY_MIN_PENDING = int(os.getenv("HISTORY_SUMMARY_MIN_PENDING", "4"))
+
+# 세션 저장소 상한 (0 = 해당 조건 끔). byte 상한은 메시지 본문 + rolling 요약 + writer transcript 블록
+SESSION_MAX = int(os.getenv("SESSION_MAX", "5000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))
+SESSION_IDLE_TTL_SEC = float(os.getenv("SESSION_IDLE_TTL_SEC", "7200"))
+
+# 세션 영속화: memory(프로세스 내) | sqlite(여러 worker/재시작 간 공유)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").strip().lower()
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "./session_db/sessions.sqlite3")
+SESSION_DB_TTL_SEC = float(os.getenv("SESSION_DB_TTL_SEC", str(7 * 24 * 3600)))
+
 # ---------------------------------------------------------------------
-# Session history
+# Global memory store (session -> chat history + 문진 턴 카운터)
+#  - LRU + idle TTL + 세션 수/byte 상한으로 오래된 세션부터 제거
+#  - sqlite backend면 메모리는 read-through 캐시, 원본은 SESSION_DB_PATH
 # ---------------------------------------------------------------------
+def _build_session_store() -> SessionStore:
+    backend = None
+    if SESSION_BACKEND == "sqlite":
+        backend = SQLiteSessionBackend(SESSION_DB_PATH)
+    elif SESSION_BACKEND != "memory":
+        raise ValueError(f"알 수 없는 SESSION_BACKEND={SESSION_BACKEND} (memory|sqlite)")
+    return SessionStore(
+        max_sessions=SESSION_MAX,
+        max_bytes=SESSION_MAX_BYTES,
+        idle_ttl_sec=SESSION_IDLE_TTL_SEC,
+        backend=backend,
+        backend_ttl_sec=SESSION_DB_TTL_SEC,
+    )
+
+
+store = _build_session_store()
+
+
 def get_session_history(session_id: str) -> BaseChatMessageHistory:
-    if session_id not in store:
-        store[session_id] = ChatMessageHistory()
-    if session_id not in _interview_turns:
-        _interview_turns[session_id] = 0
-    return store[session_id]
+    return store.history(session_id)
+
+
+def drop_session(session_id: str) -> None:
+    store.pop(session_id, None)
+
+
+async def adrop_session(session_id: str) -> None:
+    await store.apop(session_id, None)
 
 
 # ---------------------------------------------------------------------
 # Embeddings + VectorStore
 # ---------------------------------------------------------------------
-def _build_embeddings() -> WatsonxEmbeddings:
+def _build_embeddings() -> CachedQueryEmbeddings:
     embed_params = {
         EmbedTextParamsMetaNames.TRUNCATE_INPUT_TOKENS: 512,
         EmbedTextParamsMetaNames.RETURN_OPTIONS: {"input_text": True},
     }
-    return WatsonxEmbeddings(
-        model_id="ibm/granite-embedding-278m-multilingual",
+    inner = WatsonxEmbeddings(
+        model_id=EMBED_MODEL_ID,
         url=IBM_URL,
         project_id=PROJECT_ID,
         params=embed_params,
         apikey=WATSONX_API,
     )
+    # 질의 임베딩 캐시 (같은 질문/추천 칩을 매번 원격 임베딩하지 않도록)
+    return CachedQueryEmbeddings(
+        inner,
+        model_id=EMBED_MODEL_ID,
+        max_size=EMBED_CACHE_SIZE,
+        ttl_sec=EMBED_CACHE_TTL_SEC,
+        disk_path=EMBED_CACHE_PATH or None,
+    )
 
 
-def _build_vectorstore(embeddings: WatsonxEmbeddings) -> Chroma:
-    return Chroma(
-        persist_directory=PERSIST_DIR,
+def _chroma_fingerprint(chroma: Chroma) -> str:
+    """컬렉션 변경 감지용 지문: 문서 수 + Chroma sqlite 수정 시각"""
+    try:
+        count = chroma._collection.count()
+    except Exception:
+        count = -1
+    try:
+        persist_dir = chroma._client.get_settings().persist_directory or PERSIST_DIR
+    except Exception:
+        persist_dir = PERSIST_DIR
+    try:
+        mtime = int(os.path.getmtime(os.path.join(persist_dir, "chroma.sqlite3")))
+    except OSError:
+        mtime = 0
+    return f"{count}:{mtime}"
+
+
+def _index_dirs(snapshot: Optional[str]) -> Tuple[str, str, str]:
+    """(Chroma, BM25, numpy export) 경로. snapshot이 None이면 스냅샷 도입 이전 경로."""
+    if snapshot is None:
+        return PERSIST_DIR, LEXICAL_INDEX_DIR, VECTOR_INDEX_DIR
+    paths = SnapshotPaths(INDEX_ROOT, snapshot)
+    return paths.chroma_dir, paths.bm25_dir, paths.numpy_dir
+
+
+def _build_vectorstore(
+    embeddings: Embeddings,
+    persist_dir: str = PERSIST_DIR,
+    vector_index_dir: str = VECTOR_INDEX_DIR,
+) -> VectorStore:
+    chroma = Chroma(
+        persist_directory=persist_dir,
         embedding_function=embeddings,
         collection_name=COLLECTION_NAME,
     )
+    if VECTOR_BACKEND == "chroma":
+        return chroma
+    if VECTOR_BACKEND != "numpy":
+        raise ValueError(f"VECTOR_BACKEND는 chroma|numpy 중 하나여야 합니다: {VECTOR_BACKEND}")
+    if VECTOR_DTYPE not in ("float32", "float16"):
+        raise ValueError(f"VECTOR_DTYPE는 float32|float16 중 하나여야 합니다: {VECTOR_DTYPE}")
+    return NumpyVectorStore(
+        vector_index_dir,
+        embeddings,
+        source=chroma,
+        source_version=lambda: _chroma_fingerprint(chroma),
+        dtype=VECTOR_DTYPE,
+    )
+
+
+def _close_llm(llm: Any) -> None:
+    """WatsonxLLM의 HTTP 클라이언트 정리 (없거나 실패해도 무시)"""
+    client = getattr(llm, "watsonx_client", None)
+    close = getattr(client, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception:
+            pass
 
 
 # ---------------------------------------------------------------------
@@ -114,57 +321,6 @@ def _build_rerank_llm() -> WatsonxLLM:
     )
 
 
-def answer_with_sources(question: str, session_id: str = "default_user") -> Dict[str, Any]:
-    """
-    main.py에서 '근거 불일치'를 없애기 위한 단일 진실 소스.
-    - rag_chain이 만든 최종 답변과,
-    - 그 답변에 사용된 최종 rerank docs를 함께 반환.
-
-    return:
-      {
-        "answer": str,
-        "mode": "SOLUTION"|"INTERVIEW",
-        "docs": List[Document]
-      }
-    """
-    # ✅ 세션 히스토리 확보
-    history = get_session_history(session_id)
-
-    # ✅ 여기서 get_rag_chain()을 매번 새로 만들면 느려질 수 있으니
-    #    기존 main.py에서 생성한 rag_chain을 쓰는 게 이상적이지만,
-    #    구조상 여기서는 체인을 한 번 생성해서 사용.
-    chain = get_rag_chain()
-
-    # chain은 내부적으로 retrieval_step에서 mode/docs/context를 만들고,
-    # route_and_answer에서 문자열을 반환한다.
-    #
-    # BUT: 현재 get_rag_chain() 구현은 최종적으로 "문자열"만 반환하고 있어 docs를 밖으로 못 꺼냄.
-    # 그래서 아래 방식으로 "동일 로직"을 한 번 더 수행해서 docs를 만들고, 답변은 chain을 사용한다.
-    #
-    # (최고 완성형은 get_rag_chain 내부에서 docs를 함께 반환하도록 구조를 바꾸는 것)
-    embeddings = _build_embeddings()
-    vectorstore = _build_vectorstore(embeddings)
-    rerank_llm = _build_rerank_llm()
-
-    # 1) 후보 검색 + 게이트
-    pairs = _retrieve_candidates_with_scores(vectorstore, question, k=CANDIDATE_K)
-    docs = [d for d, _ in pairs]
-    scores = [s for _, s in pairs]
-
-    if not _passes_gate(scores):
-        mode = "INTERVIEW"
-        final_docs: List[Document] = []
-    else:
-        mode = "SOLUTION"
-        final_docs = _rerank_docs(rerank_llm, question, docs, top_n=FINAL_K)
-
-    # 2) 답변 생성(세션 메모리 업데이트는 RunnableWithMessageHistory가 수행)
-    answer = chain.invoke(
-        {"question": question},
-        config={"configurable": {"session_id": session_id}},
-    )
-
-    return {"answer": answer, "mode": mode, "docs": final_docs}
 # ---------------------------------------------------------------------
 # Main answer LLM
 # ---------------------------------------------------------------------
@@ -209,6 +365,51 @@ def _safe_int_list_from_json(text: str) -> List[int]:
     return [int(n) for n in nums][:FINAL_K]
 
 
+def _elapsed_ms(t0: float) -> int:
+    return int((time.perf_counter() - t0) * 1000)
+
+
+def _parse_intent(raw: str) -> str:
+    return "DOC" if "DOC" in (raw or "").strip().upper() else "CHAT"
+
+
+def _update_router_rates() -> None:
+    """규칙 적중률(LLM 호출 생략 비율)과 규칙/LLM 일치율 게이지 갱신"""
+    rules = sum(metrics.get("router_decisions_total", source="rules", intent=i) for i in ("DOC", "CHAT"))
+    llm = sum(metrics.get("router_decisions_total", source="llm", intent=i) for i in ("DOC", "CHAT"))
+    if rules + llm:
+        metrics.set_gauge("router_rule_hit_rate", rules / (rules + llm))
+
+    for path in ("shadow", "fallback"):
+        agree = metrics.get("router_agreement_total", path=path, result="agree")
+        disagree = metrics.get("router_agreement_total", path=path, result="disagree")
+        if agree + disagree:
+            metrics.set_gauge("router_agreement_rate", agree / (agree + disagree), path=path)
+
+
+def _retrieval_result(
+    mode: str, docs: List[Document], scores: List[float], timings: Dict[str, int]
+) -> Dict[str, Any]:
+    return {
+        "mode": mode,
+        "docs": docs,
+        "scores": scores,
+        "context": _format_docs_for_context(docs),
+        "timings": timings,
+    }
+
+
+def _answer_result(inputs: Dict[str, Any], answer: str, generate_ms: int) -> Dict[str, Any]:
+    # ✅ 구조화 출력: 답변과 그 답변에 실제로 쓰인 docs/mode를 함께 반환
+    return {
+        "answer": answer,
+        "mode": inputs.get("mode", "INTERVIEW"),
+        "docs": inputs.get("docs", []),
+        "scores": inputs.get("scores", []),
+        "timings": {**inputs.get("timings", {}), "generate_ms": generate_ms},
+    }
+
+
 def _format_docs_for_context(docs: List[Document]) -> str:
     """
     (C) [근거 n] 포맷 강제. case_id 노출 금지.
@@ -240,9 +441,67 @@ def _format_docs_for_context(docs: List[Document]) -> str:
 # (A) Score-gated retrieval + (B) rerank
 # ---------------------------------------------------------------------
 def _retrieve_candidates_with_scores(
-    vectorstore: Chroma, query: str, k: int = CANDIDATE_K
+    vectorstore: VectorStore,
+    query: str,
+    k: int = CANDIDATE_K,
+    lexical_index: Optional[LexicalIndex] = None,
+) -> List[Tuple[Document, float]]:
+    return _retrieve_candidates(vectorstore, query, k, lexical_index)[0]
+
+
+def _retrieve_candidates(
+    vectorstore: VectorStore,
+    query: str,
+    k: int = CANDIDATE_K,
+    lexical_index: Optional[LexicalIndex] = None,
+) -> Tuple[List[Tuple[Document, float]], bool]:
+    """return: (RRF 순서의 (Document, 벡터 distance), lexical rescue 여부)"""
+    pairs = vectorstore.similarity_search_with_score(query, k=k)
+    if lexical_index is None:
+        return pairs, False
+    hits = lexical_index.search(query, k, rare_min_idf=LEXICAL_RESCUE_MIN_IDF)
+    if not hits:
+        return pairs, False
+    return _fuse_hybrid(pairs, hits, k), _lexical_rescue(hits)
+
+
+def _lexical_rescue(hits: List[LexicalHit]) -> bool:
+    # 임베딩이 약한 시술명/약품명 질의: 희소 term이 정확히 일치하는 문서가 있으면 게이트 통과
+    return any(
+        h.rare_terms >= LEXICAL_RESCUE_MIN_TERMS and h.coverage >= LEXICAL_GATE_COVERAGE for h in hits
+    )
+
+
+def _fuse_hybrid(
+    pairs: List[Tuple[Document, float]], hits: List[LexicalHit], k: int
 ) -> List[Tuple[Document, float]]:
-    return vectorstore.similarity_search_with_score(query, k=k)
+    """
+    RRF 순서로 (Document, distance) 반환. distance는 벡터 검색 값 그대로 (게이트/rerank 입력을 바꾸지 않음)
+    - BM25에서만 나온 문서: 벡터 distance가 없으므로 후보 중 가장 먼 distance (게이트를 통과시키지 않는 값)
+    """
+    docs: Dict[str, Document] = {}
+    dist: Dict[str, float] = {}
+    for d, s in pairs:
+        key = _doc_key(d)
+        docs[key], dist[key] = d, s
+    for h in hits:
+        docs.setdefault(_doc_key(h.doc), h.doc)
+
+    fused = rrf_fuse(
+        [[_doc_key(d) for d, _ in pairs], [_doc_key(h.doc) for h in hits]], k=HYBRID_RRF_K
+    )
+    order = sorted(fused, key=lambda key: -fused[key])[:k]
+    worst = max(dist.values(), default=2 * MAX_DISTANCE_THRESHOLD)
+    return [(docs[key], dist.get(key, worst)) for key in order]
+
+
+def _passes_gate_or_rescue(scores: List[float], lexical_rescue: bool) -> bool:
+    if _passes_gate(scores):
+        return True
+    if lexical_rescue:
+        metrics.inc("hybrid_gate_rescue_total")
+        return True
+    return False
 
 
 def _passes_gate(scores: List[float]) -> bool:
@@ -251,12 +510,7 @@ def _passes_gate(scores: List[float]) -> bool:
     return min(scores) <= MAX_DISTANCE_THRESHOLD
 
 
-def _rerank_docs(
-    rerank_llm: WatsonxLLM, query: str, docs: List[Document], top_n: int = FINAL_K
-) -> List[Document]:
-    if not docs:
-        return []
-
+def _build_rerank_prompt(query: str, docs: List[Document], top_n: int) -> str:
     snippets = []
     for idx, d in enumerate(docs):
         title = d.metadata.get("title", "제목 없음")
@@ -266,7 +520,7 @@ def _rerank_docs(
         text = text[:500] + ("..." if len(text) > 500 else "")
         snippets.append(f"{idx}. (사건명: {title} | 진료과: {dept} | 섹션: {section}) {text}")
 
-    rerank_prompt = f"""
+    return f"""
 당신은 검색 결과 재정렬(rerank) 모델입니다.
 
 사용자 질문과 가장 관련성이 높은 문서 인덱스 {top_n}개를 골라,
@@ -285,49 +539,174 @@ def _rerank_docs(
 {chr(10).join(snippets)}
 """.strip()
 
-    raw = rerank_llm.invoke(rerank_prompt)
+
+def _pick_rerank_indices(raw: str, n_docs: int, top_n: int) -> List[int]:
+    """rerank LLM 출력에서 유효한 인덱스만 (중복 제거, 최대 top_n). 파싱 실패 시 빈 리스트."""
     picks = _safe_int_list_from_json(raw)
 
     seen = set()
     valid = []
     for i in picks:
-        if 0 <= i < len(docs) and i not in seen:
+        if 0 <= i < n_docs and i not in seen:
             valid.append(i)
             seen.add(i)
         if len(valid) >= top_n:
             break
+    return valid
 
-    if not valid:
-        valid = list(range(min(top_n, len(docs))))
 
-    return [docs[i] for i in valid]
+def _doc_key(d: Document) -> str:
+    md = d.metadata or {}
+    return str(md.get("chunk_id") or hashlib.sha1((d.page_content or "").encode("utf-8")).hexdigest())
 
 
 # ---------------------------------------------------------------------
-# Public API: retriever only (main.py sources 카드용)
+# (B) Pluggable rerankers (RERANKER=llm|lexical)
 # ---------------------------------------------------------------------
-def get_retriever():
-    embeddings = _build_embeddings()
-    vectorstore = _build_vectorstore(embeddings)
-    return vectorstore.as_retriever(
-        search_type="mmr",
-        search_kwargs={"k": 5, "fetch_k": 25},
+class BaseReranker:
+    """
+    후보 docs(검색 순서)와 distance scores를 받아 상위 top_n 인덱스를 고르는 인터페이스.
+    - 빈 리스트 반환 = 판단 실패 (호출 측에서 검색 순서로 fallback)
+    - model_id는 rerank 결과 캐시 키에 포함됨
+    """
+
+    model_id: str = "base"
+    # True면 원격 LLM 호출 → admission controller 슬롯 필요
+    uses_llm: bool = False
+
+    def rerank_indices(
+        self, query: str, docs: List[Document], scores: List[float], top_n: int
+    ) -> List[int]:
+        raise NotImplementedError
+
+    async def arerank_indices(
+        self, query: str, docs: List[Document], scores: List[float], top_n: int
+    ) -> List[int]:
+        return self.rerank_indices(query, docs, scores, top_n)
+
+    def close(self) -> None:
+        pass
+
+
+class LLMReranker(BaseReranker):
+    """granite rerank LLM에 후보 스니펫을 주고 JSON 인덱스 배열을 받는 방식 (기존 동작)"""
+
+    uses_llm = True
+
+    def __init__(self, llm: WatsonxLLM, model_id: str = RERANK_LLM_ID) -> None:
+        self.llm = llm
+        self.model_id = model_id
+
+    def rerank_indices(self, query, docs, scores, top_n):
+        raw = self.llm.invoke(_build_rerank_prompt(query, docs, top_n))
+        return _pick_rerank_indices(raw, len(docs), top_n)
+
+    async def arerank_indices(self, query, docs, scores, top_n):
+        raw = await self.llm.ainvoke(_build_rerank_prompt(query, docs, top_n))
+        return _pick_rerank_indices(raw, len(docs), top_n)
+
+    def close(self) -> None:
+        _close_llm(self.llm)
+
+
+class LexicalReranker(BaseReranker):
+    """
+    LLM 호출 없는 로컬 reranker.
+    - 후보 집합 내 BM25(문자 n-gram) 점수와 Chroma distance 기반 유사도를 min-max 정규화 후 가중합
+    - 시술명/약품명처럼 표면형이 중요한 질의에 강하고, 파싱 실패가 없음
+    """
+
+    model_id = "lexical-bm25-v1"
+
+    def __init__(self, weight: float = 0.5) -> None:
+        self.weight = weight
+
+    def rerank_indices(self, query, docs, scores, top_n):
+        if not docs:
+            return []
+        q_tokens = char_ngrams(query)
+        d_tokens = [char_ngrams(d.page_content or "") for d in docs]
+        lexical = minmax(bm25_scores(q_tokens, d_tokens))
+        # distance는 낮을수록 유사 → 부호 반전 후 정규화
+        semantic = minmax([-s for s in scores]) if len(scores) == len(docs) else [0.0] * len(docs)
+
+        blended = [self.weight * l + (1 - self.weight) * v for l, v in zip(lexical, semantic)]
+        order = sorted(range(len(docs)), key=lambda i: (-blended[i], i))
+        return order[:top_n]
+
+
+def _build_reranker() -> BaseReranker:
+    if RERANKER == "lexical":
+        return LexicalReranker(weight=LEXICAL_RERANK_WEIGHT)
+    return LLMReranker(_build_rerank_llm())
+
+
+# ---------------------------------------------------------------------
+# Writer / Router LLM
+# ---------------------------------------------------------------------
+def _build_writer_llm() -> WatsonxLLM:
+    return WatsonxLLM(
+        model_id=WRITER_LLM_ID,
+        url=IBM_URL,
+        apikey=WATSONX_API,
+        project_id=PROJECT_ID,
+        params={
+            "decoding_method": "greedy",
+            "max_new_tokens": 2200,
+            "min_new_tokens": 120,
+            "repetition_penalty": 1.0,
+        },
+    )
+
+
+def _build_router_llm() -> WatsonxLLM:
+    return WatsonxLLM(
+        model_id=ROUTER_LLM_ID,
+        url=IBM_URL,
+        apikey=WATSONX_API,
+        project_id=PROJECT_ID,
+        params={
+            "decoding_method": "greedy",
+            "max_new_tokens": 5,
+            "min_new_tokens": 1,
+        },
+    )
+
+
+def _build_editor_llm() -> WatsonxLLM:
+    """문서 부분 수정용: writer와 같은 모델, 섹션 하나 분량만 생성"""
+    return WatsonxLLM(
+        model_id=WRITER_LLM_ID,
+        url=IBM_URL,
+        apikey=WATSONX_API,
+        project_id=PROJECT_ID,
+        params={
+            "decoding_method": "greedy",
+            "max_new_tokens": 600,
+            "min_new_tokens": 10,
+            "repetition_penalty": 1.0,
+        },
+    )
+
+
+def _build_summary_llm() -> WatsonxLLM:
+    return WatsonxLLM(
+        model_id=SUMMARY_LLM_ID,
+        url=IBM_URL,
+        apikey=WATSONX_API,
+        project_id=PROJECT_ID,
+        params={
+            "decoding_method": "greedy",
+            "max_new_tokens": 400,
+            "min_new_tokens": 20,
+        },
     )
 
 
 # ---------------------------------------------------------------------
-# Chains
+# (C) Prompts (솔루션/문진 + 안전장치) - 모듈 로드 시 1회만 정의
 # ---------------------------------------------------------------------
-def get_rag_chain():
-    embeddings = _build_embeddings()
-    vectorstore = _build_vectorstore(embeddings)
-    rerank_llm = _build_rerank_llm()
-    llm = _build_main_llm()
-
-    # =========================================================
-    # (C) Prompts (솔루션/문진 + 안전장치)
-    # =========================================================
-    system_template = """
+SOLUTION_SYSTEM_TEMPLATE = """
 # Identity
 당신은 '메디가이드(MediGuide)'의 20년 경력 의료소송 전문 변호사 역할입니다.
 사용자는 법·의학 지식이 없는 일반인입니다.
@@ -395,8 +774,8 @@ def get_rag_chain():
 
 """.strip()
 
-    # 문진: "요." 같은 구어체/추임새 방지 + 질문 수 제한 + (왜 필요한지) 포함
-    interview_system = """
+# 문진: "요." 같은 구어체/추임새 방지 + 질문 수 제한 + (왜 필요한지) 포함
+INTERVIEW_SYSTEM_TEMPLATE = """
 # Identity
 당신은 '메디가이드(MediGuide)'의 20년 경력 의료소송 전문 변호사 역할로 상담합니다.
 
@@ -433,8 +812,8 @@ def get_rag_chain():
 
 """.strip()
 
-    # 게이트 실패 후 문진도 끝났는데도 근거가 부족한 경우: "일반 가이드" 안전 출력
-    fallback_system = """
+# 게이트 실패 후 문진도 끝났는데도 근거가 부족한 경우: "일반 가이드" 안전 출력
+FALLBACK_SYSTEM_TEMPLATE = """
 # Identity
 당신은 '메디가이드(MediGuide)'의 20년 경력 의료소송 전문 변호사 역할로 상담합니다.
 
@@ -453,145 +832,8 @@ def get_rag_chain():
 ### 4. 다음 절차(중재원/분쟁 조정) 체크리스트
 """.strip()
 
-    solution_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_template),
-            MessagesPlaceholder("chat_history"),
-            ("human", "질문: {question}\n\n[Context]\n{context}"),
-        ]
-    )
-
-    interview_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", interview_system),
-            MessagesPlaceholder("chat_history"),
-            ("human", "질문: {question}"),
-        ]
-    )
-
-    fallback_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", fallback_system),
-            MessagesPlaceholder("chat_history"),
-            ("human", "질문: {question}"),
-        ]
-    )
-
-    # =========================================================
-    # Retrieval step (A + B) + Interview-turn gate
-    # =========================================================
-    def retrieval_step(inputs: Dict[str, Any]) -> Dict[str, Any]:
-        question = inputs["question"]
-        session_id = inputs.get("session_id", "default_user")
-
-        pairs = _retrieve_candidates_with_scores(vectorstore, question, k=CANDIDATE_K)
-        docs = [d for d, _ in pairs]
-        scores = [s for _, s in pairs]
-
-        has_good_context = _passes_gate(scores)
-
-        if not has_good_context:
-            # 게이트 실패: 우선 문진 모드 (단, 턴 제한)
-            return {
-                **inputs,
-                "mode": "INTERVIEW",
-                "docs": [],
-                "context": "",
-                "scores": scores,
-                "session_id": session_id,
-            }
-
-        # 게이트 통과: rerank 후 context 구성
-        reranked = _rerank_docs(rerank_llm, question, docs, top_n=FINAL_K)
-        context = _format_docs_for_context(reranked)
-
-        return {
-            **inputs,
-            "mode": "SOLUTION",
-            "docs": reranked,
-            "context": context,
-            "scores": scores,
-            "session_id": session_id,
-        }
-
-    def route_and_answer(inputs: Dict[str, Any]) -> str:
-        mode = inputs.get("mode", "INTERVIEW")
-        question = inputs["question"]
-        chat_history = inputs.get("chat_history", [])
-        context = inputs.get("context", "")
-        session_id = inputs.get("session_id", "default_user")
-
-        # 문진 턴 제한
-        if mode == "INTERVIEW":
-            _interview_turns[session_id] = _interview_turns.get(session_id, 0) + 1
-
-            # 1~MAX_INTERVIEW_TURNS 까지는 문진
-            if _interview_turns[session_id] <= MAX_INTERVIEW_TURNS:
-                return (interview_prompt | llm | StrOutputParser()).invoke(
-                    {"question": question, "chat_history": chat_history}
-                )
-
-            # 문진 턴 초과: 더 이상 질문 폭주 금지 → 일반 가이드로 전환
-            return (fallback_prompt | llm | StrOutputParser()).invoke(
-                {"question": question, "chat_history": chat_history}
-            )
-
-        # 솔루션 모드에서는 문진 턴 카운터 리셋(정상적으로 근거를 찾았다는 뜻)
-        _interview_turns[session_id] = 0
-
-        if context.strip():
-            return (solution_prompt | llm | StrOutputParser()).invoke(
-                {"question": question, "context": context, "chat_history": chat_history}
-            )
-
-        # 이론상 여기 오면 안 되지만, 안전장치
-        return (fallback_prompt | llm | StrOutputParser()).invoke(
-            {"question": question, "chat_history": chat_history}
-        )
-
-    base_chain = (
-        RunnableMap(
-            {
-                "question": lambda x: x["question"],
-                "chat_history": lambda x: x.get("chat_history", []),
-                # RunnableWithMessageHistory config에서 세션을 받기 때문에,
-                # 여기서는 안전하게 기본값 처리만.
-                "session_id": lambda x: x.get("session_id", "default_user"),
-            }
-        )
-        | RunnableLambda(retrieval_step)
-        | RunnableLambda(route_and_answer)
-    )
-
-    chain_with_history = RunnableWithMessageHistory(
-        base_chain,
-        get_session_history,
-        input_messages_key="question",
-        history_messages_key="chat_history",
-    )
-
-    return chain_with_history
-
-
-def get_writing_chain():
-    """
-    대화 내역 기반 문서 작성 전용 체인
-    (주의: 문서 반복 출력 이슈는 main.py에서 history 정제/중복 저장을 먼저 잡는 게 핵심)
-    """
-    llm = WatsonxLLM(
-        model_id=WRITER_LLM_ID,
-        url=IBM_URL,
-        apikey=WATSONX_API,
-        project_id=PROJECT_ID,
-        params={
-            "decoding_method": "greedy",
-            "max_new_tokens": 2200,
-            "min_new_tokens": 120,
-            "repetition_penalty": 1.0,
-        },
-    )
-
-    legal_template = """
+# 대화 내역 기반 문서 작성 템플릿
+LEGAL_TEMPLATE = """
 # Identity
 당신은 '메디가이드(MediGuide)'의 의료소송 문서작성 AI입니다.
 
@@ -654,33 +896,26 @@ D. 청구 금액(총액)
 {chat_history}
 """.strip()
 
-    prompt = ChatPromptTemplate.from_template(legal_template)
+# 문서 부분 수정 템플릿 (섹션 하나만 입력/출력)
+SECTION_EDIT_TEMPLATE = """
+# Role
+당신은 '메디가이드(MediGuide)'의 의료소송 문서 편집자입니다.
 
-    return (
-        {"chat_history": lambda x: x["chat_history"]}
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
+# Rules
+- [수정 요청]을 [현재 섹션]에 반영한 결과 섹션만 출력하세요. (섹션 제목 줄 포함)
+- 다른 섹션, 설명, 마크다운, 인사말은 출력하지 마세요.
+- 요청과 무관한 문장은 글자 그대로 유지하세요.
+- 요청에 없는 사실(날짜/병원명/금액/진단명 등)을 지어내지 마세요.
 
+[수정 요청]
+{request}
 
-def get_router_chain():
-    """
-    DOC vs CHAT 분류
-    """
-    llm = WatsonxLLM(
-        model_id=ROUTER_LLM_ID,
-        url=IBM_URL,
-        apikey=WATSONX_API,
-        project_id=PROJECT_ID,
-        params={
-            "decoding_method": "greedy",
-            "max_new_tokens": 5,
-            "min_new_tokens": 1,
-        },
-    )
+[현재 섹션]
+{section}
+""".strip()
 
-    template = """
+# DOC vs CHAT 분류 템플릿
+ROUTER_TEMPLATE = """
 # Role
 당신은 '메디가이드(MediGuide)'의 Intent Classifier입니다.
 
@@ -703,6 +938,1115 @@ def get_router_chain():
 {question}
 """.strip()
 
-    prompt = ChatPromptTemplate.from_template(template)
-    return prompt | llm | StrOutputParser()
+SUMMARY_TEMPLATE = """
+# Role
+당신은 의료분쟁 상담 기록을 정리하는 보조자입니다.
+
+# Task
+[기존 요약]에 [추가 대화]의 내용을 반영해 요약을 갱신하세요.
+- 사실관계 위주: 시술/진료 내용, 날짜, 병원/의료진 대응, 현재 증상, 피해, 의뢰인의 요구
+- 상담사가 이미 안내한 절차/판례 요지는 한 줄로만
+- 추측 금지, 대화에 없는 내용 추가 금지
+- 12줄 이내, 불릿(-)으로만 출력
+
+[기존 요약]
+{summary}
+
+[추가 대화]
+{transcript}
+""".strip()
+
+
+# ---------------------------------------------------------------------
+# RAG Engine (프로세스 당 1회 생성 → 요청마다 재사용)
+# ---------------------------------------------------------------------
+class RagEngine:
+    """
+    embeddings / vectorstore / LLM 클라이언트 / 컴파일된 프롬프트를 한 번만 만들어 보관하는 엔진.
+    - main.py startup에서 생성 후 warmup(), 종료 시 shutdown()
+    - /chat 요청마다 watsonx 클라이언트/Chroma 핸들을 새로 만들지 않음
+    """
+
+    def __init__(self) -> None:
+        self.embeddings = _build_embeddings()
+        # 인덱스(vectorstore + BM25)는 스냅샷 단위로 통째 교체 (areload_index)
+        self.index_snapshot = read_current(INDEX_ROOT)
+        self.vectorstore, self.lexical_index = self._open_index(self.index_snapshot)
+        self._index_lease = acquire_lease(INDEX_ROOT, self.index_snapshot) if self.index_snapshot else None
+        self._retired_leases: set = set()
+        self._reload_lock = asyncio.Lock()
+        self._reload_failed: Optional[str] = None
+        self.reranker = _build_reranker()
+        self.main_llm = _build_main_llm()
+        self.writer_llm = _build_writer_llm()
+        self.router_llm = _build_router_llm()
+        self.summary_llm = _build_summary_llm()
+        self.editor_llm = _build_editor_llm()
+
+        # Chroma 질의(임베딩 호출 포함)는 동기 API → 이벤트 루프를 막지 않도록 전용 스레드 풀에서 실행
+        self._vector_executor = ThreadPoolExecutor(
+            max_workers=VECTOR_MAX_WORKERS, thread_name_prefix="chroma"
+        )
+
+        self.solution_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", SOLUTION_SYSTEM_TEMPLATE),
+                MessagesPlaceholder("chat_history"),
+                ("human", "질문: {question}\n\n[Context]\n{context}"),
+            ]
+        )
+        self.interview_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", INTERVIEW_SYSTEM_TEMPLATE),
+                MessagesPlaceholder("chat_history"),
+                ("human", "질문: {question}"),
+            ]
+        )
+        self.fallback_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", FALLBACK_SYSTEM_TEMPLATE),
+                MessagesPlaceholder("chat_history"),
+                ("human", "질문: {question}"),
+            ]
+        )
+        self.writer_prompt = ChatPromptTemplate.from_template(LEGAL_TEMPLATE)
+        self.router_prompt = ChatPromptTemplate.from_template(ROUTER_TEMPLATE)
+        self.summary_prompt = ChatPromptTemplate.from_template(SUMMARY_TEMPLATE)
+        self.section_edit_prompt = ChatPromptTemplate.from_template(SECTION_EDIT_TEMPLATE)
+
+        # prompt | llm | parser 조합도 한 번만 구성
+        self.solution_chain = self.solution_prompt | self.main_llm | StrOutputParser()
+        self.interview_chain = self.interview_prompt | self.main_llm | StrOutputParser()
+        self.fallback_chain = self.fallback_prompt | self.main_llm | StrOutputParser()
+
+        self.rag_chain = self._compile_rag_chain()
+        self.writing_chain = self._compile_writing_chain()
+        self.router_chain = self.router_prompt | self.router_llm | StrOutputParser()
+        self.summary_chain = self.summary_prompt | self.summary_llm | StrOutputParser()
+        self.section_edit_chain = self.section_edit_prompt | self.editor_llm | StrOutputParser()
+
+        # 모델 id별 동시 LLM 호출 상한 (포화 시 429)
+        self.admission = AdmissionController.from_env(
+            LLM_MAX_CONCURRENCY, LLM_CONCURRENCY_LIMITS, LLM_ADMISSION_WAIT_SEC
+        )
+
+        # rerank 결과 캐시: greedy 디코딩이라 (질문, 후보 순서, 모델)이 같으면 결과도 같음
+        self.rerank_cache = LRUCache("rerank", RERANK_CACHE_SIZE, ttl_sec=RERANK_CACHE_TTL_SEC)
+
+        # 첫 턴 질문의 의미 기반 답변 캐시 (hit 시 router/검색/rerank/생성 LLM 모두 생략)
+        self.answer_cache = SemanticAnswerCache(
+            ANSWER_CACHE_SIZE, ANSWER_CACHE_SIMILARITY, ttl_sec=ANSWER_CACHE_TTL_SEC
+        )
+        self.intent_cache = LRUCache("router_intent", INTENT_CACHE_SIZE)
+        self._index_version: Optional[str] = None
+        self._index_checked_at = 0.0
+
+        # 추천 질문/상위 질의 warmer 대상 (main.py startup에서 start_warmer로 설정)
+        self._warm_questions: List[str] = []
+
+        # shadow 라우팅 등 fire-and-forget task 참조 보관 (GC 방지)
+        self._background: set = set()
+        # 요약 갱신 중인 세션 (중복 요약 호출 방지)
+        self._summarizing: set = set()
+
+        self._closed = False
+
+    # -----------------------------------------------------------------
+    # Lifecycle
+    # -----------------------------------------------------------------
+    def warmup(self) -> None:
+        """
+        첫 요청의 콜드 스타트 비용(Chroma 컬렉션 로드, watsonx 토큰 발급/커넥션)을 startup에서 미리 지불.
+        실패해도 서버 기동은 계속 (첫 요청에서 다시 시도됨).
+        """
+        self.sync_index_version()
+        try:
+            self.vectorstore.similarity_search_with_score("의료분쟁", k=1)
+        except Exception as e:
+            print(f"⚠️ warmup(vectorstore) 실패: {e}")
+        if self.lexical_index is not None:
+            try:
+                self.lexical_index.search("의료분쟁", k=1)
+            except Exception as e:
+                print(f"⚠️ warmup(BM25 인덱스) 실패: {e}")
+
+    def shutdown(self) -> None:
+        """
+        보관 중인 클라이언트/핸들 정리. 여러 번 호출해도 안전.
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        for task in list(self._background):
+            task.cancel()
+        self._vector_executor.shutdown(wait=False, cancel_futures=True)
+        for lease in [self._index_lease, *self._retired_leases]:
+            release_lease(lease)
+        self._index_lease = None
+        self._retired_leases.clear()
+
+        # rerank LLM은 reranker가 소유 → reranker.close()가 정리
+        self.reranker.close()
+        for llm in (self.main_llm, self.writer_llm, self.router_llm, self.summary_llm, self.editor_llm):
+            _close_llm(llm)
+
+        self.embeddings.close()
+
+        client = getattr(self.vectorstore, "_client", None)
+        clear = getattr(client, "clear_system_cache", None)
+        if callable(clear):
+            try:
+                clear()
+            except Exception:
+                pass
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {
+            "query_embedding": self.embeddings.stats(),
+            "rerank": self.rerank_cache.stats(),
+            "answer": self.answer_cache.stats(),
+            "router_intent": self.intent_cache.stats(),
+        }
+
+    def flush_caches(self) -> Dict[str, int]:
+        """
+        컬렉션 재구축(ingest) 후 호출: 이전 인덱스 기준으로 계산된 결과 캐시 폐기.
+        (쿼리 임베딩은 모델이 같으면 그대로 유효하므로 유지)
+        """
+        flushed = {
+            "rerank": self.rerank_cache.clear(),
+            "answer": self.answer_cache.clear(),
+        }
+        metrics.inc("cache_flush_total")
+        return flushed
+
+    def _collection_fingerprint(self) -> str:
+        # numpy 백엔드는 원본 Chroma 컬렉션 기준, 스냅샷 이름을 앞에 붙여 버전별로 캐시 분리
+        fingerprint = _chroma_fingerprint(getattr(self.vectorstore, "source", self.vectorstore))
+        return f"{self.index_snapshot}:{fingerprint}" if self.index_snapshot else fingerprint
+
+    def _index_check_due(self, force: bool) -> bool:
+        return (
+            force
+            or self._index_version is None
+            or time.monotonic() - self._index_checked_at >= INDEX_VERSION_CHECK_SEC
+        )
 
+    def _probe_index(self) -> Tuple[Optional[str], str, bool]:
+        """
+        블로킹 I/O 부분: CURRENT 포인터 읽기 + 컬렉션 지문(count/stat),
+        지문이 바뀌었으면 numpy 인덱스 갱신(export)까지. return: (current, version, changed)
+        """
+        current = read_current(INDEX_ROOT) if INDEX_AUTO_RELOAD else None
+        version = self._collection_fingerprint()
+        changed = self._index_version is not None and version != self._index_version
+        if changed and isinstance(self.vectorstore, NumpyVectorStore):
+            try:
+                self.vectorstore.refresh()
+            except Exception as e:
+                print(f"⚠️ numpy 인덱스 갱신 실패: {e}")
+        return current, version, changed
+
+    def sync_index_version(self, force: bool = False) -> str:
+        """
+        INDEX_VERSION_CHECK_SEC 간격으로 컬렉션 지문을 확인하고,
+        바뀌었으면(재구축/스냅샷 전환) 이전 인덱스 기준의 결과 캐시를 자동 무효화.
+        INDEX_AUTO_RELOAD면 CURRENT 포인터 변경도 여기서 감지해 백그라운드로 전환.
+        (startup/스크립트용 sync 버전. 요청 경로에서는 async_index_version)
+        """
+        if not self._index_check_due(force):
+            return self._index_version
+        self._index_checked_at = time.monotonic()
+        return self._apply_index_version(*self._probe_index())
+
+    async def async_index_version(self, force: bool = False) -> str:
+        """sync_index_version()의 async 버전: count/stat/export는 vector executor에서 실행"""
+        if not self._index_check_due(force):
+            return self._index_version
+        # 확인 중 들어온 다른 요청은 기존 버전을 그대로 씀 (동시에 여러 번 probe하지 않도록)
+        self._index_checked_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        probe = await loop.run_in_executor(self._vector_executor, self._probe_index)
+        return self._apply_index_version(*probe)
+
+    def _apply_index_version(self, current: Optional[str], version: str, changed: bool) -> str:
+        if (
+            current
+            and not self._reload_lock.locked()
+            and current != self.index_snapshot
+            and current != self._reload_failed
+        ):
+            try:
+                asyncio.get_running_loop()
+                self._spawn(self._aauto_reload())
+            except RuntimeError:
+                pass
+
+        # probe 도중 다른 경로가 먼저 반영했으면 무효화를 한 번만
+        changed = changed and version != self._index_version
+        if changed:
+            print(f"🔄 컬렉션 변경 감지 ({self._index_version} → {version}): 결과 캐시 무효화")
+            self.flush_caches()
+        self._index_version = version
+        self.answer_cache.set_index_version(version)
+        if changed and self._warm_questions:
+            # 새 인덱스 기준으로 추천 질문 답변 다시 준비
+            try:
+                asyncio.get_running_loop()
+                self._spawn(self.awarm(self._warm_questions))
+            except RuntimeError:
+                pass
+        return version
+
+    # -----------------------------------------------------------------
+    # Index snapshots (CURRENT 포인터 → vectorstore + BM25 통째 교체)
+    # -----------------------------------------------------------------
+    def _open_index(self, snapshot: Optional[str]) -> Tuple[VectorStore, Optional[LexicalIndex]]:
+        chroma_dir, bm25_dir, numpy_dir = _index_dirs(snapshot)
+        vectorstore = _build_vectorstore(self.embeddings, chroma_dir, numpy_dir)
+        return vectorstore, (LexicalIndex(bm25_dir) if HYBRID_RETRIEVAL else None)
+
+    def _preload_index(self, vectorstore: VectorStore, lexical_index: Optional[LexicalIndex]) -> None:
+        # 전환 직후 첫 요청이 콜드 로드를 떠안지 않도록 미리 한 번 검색
+        vectorstore.similarity_search_with_score("의료분쟁", k=1)
+        if lexical_index is not None:
+            lexical_index.search("의료분쟁", k=1)
+
+    async def areload_index(self, force: bool = False) -> Dict[str, Any]:
+        """
+        CURRENT가 가리키는 스냅샷으로 전환.
+        - 새 스냅샷 열기/예열은 스레드 풀에서 (이벤트 루프 안 막음), 교체는 참조 대입 한 번
+        - 진행 중 요청은 이미 잡아 둔 이전 vectorstore/BM25로 끝까지 처리됨
+        - 지문에 스냅샷 이름이 들어가므로 결과 캐시는 async_index_version()이 무효화 + re-warm
+        """
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            target = await loop.run_in_executor(self._vector_executor, read_current, INDEX_ROOT)
+            if target is None:
+                return {"changed": False, "snapshot": self.index_snapshot, "reason": "CURRENT 없음"}
+            if target == self.index_snapshot and not force:
+                return {"changed": False, "snapshot": target}
+
+            manifest = await loop.run_in_executor(self._vector_executor, read_manifest, INDEX_ROOT, target)
+            if manifest.get("status") != "ready":
+                raise RuntimeError(f"스냅샷 {target} 이 준비되지 않았습니다 (status={manifest.get('status')})")
+
+            t0 = time.perf_counter()
+
+            def open_and_preload():
+                vectorstore, lexical_index = self._open_index(target)
+                self._preload_index(vectorstore, lexical_index)
+                return vectorstore, lexical_index, acquire_lease(INDEX_ROOT, target)
+
+            vectorstore, lexical_index, lease = await loop.run_in_executor(
+                self._vector_executor, open_and_preload
+            )
+            previous, previous_lease = self.index_snapshot, self._index_lease
+            self._index_lease = lease
+            self.vectorstore, self.lexical_index, self.index_snapshot = vectorstore, lexical_index, target
+            if previous_lease != self._index_lease:
+                self._spawn(self._arelease_lease_later(previous_lease))
+            self._reload_failed = None
+            index_version = await self.async_index_version(force=True)
+            metrics.inc("index_reload_total", result="ok")
+            print(f"🔁 인덱스 스냅샷 전환: {previous} → {target} ({_elapsed_ms(t0)}ms)")
+            return {
+                "changed": True,
+                "previous": previous,
+                "snapshot": target,
+                "index_version": index_version,
+                "doc_count": manifest.get("doc_count"),
+                "reload_ms": _elapsed_ms(t0),
+            }
+
+    async def _arelease_lease_later(self, lease: Optional[str]) -> None:
+        self._retired_leases.add(lease)
+        try:
+            await asyncio.sleep(INDEX_LEASE_GRACE_SEC)
+        finally:
+            self._retired_leases.discard(lease)
+            release_lease(lease)
+
+    async def _aauto_reload(self) -> None:
+        loop = asyncio.get_running_loop()
+        target = await loop.run_in_executor(self._vector_executor, read_current, INDEX_ROOT)
+        try:
+            await self.areload_index()
+        except Exception as e:
+            # 같은 스냅샷으로 매 주기 재시도하지 않음 (CURRENT가 다시 바뀌면 재시도)
+            self._reload_failed = target
+            metrics.inc("index_reload_total", result="error")
+            print(f"⚠️ 스냅샷 자동 전환 실패 ({target}): {e}")
+
+    def start_index_watcher(self) -> None:
+        """startup에서 호출: 요청이 없어도 주기적으로 CURRENT/컬렉션 변경 확인 (INDEX_AUTO_RELOAD)"""
+        if not INDEX_AUTO_RELOAD:
+            return
+
+        async def loop() -> None:
+            while True:
+                await asyncio.sleep(max(1.0, INDEX_VERSION_CHECK_SEC))
+                await self.async_index_version()
+
+        self._spawn(loop())
+
+    def index_stats(self) -> Dict[str, Any]:
+        return {
+            "snapshot": self.index_snapshot,
+            "index_version": self._index_version,
+            "current": read_current(INDEX_ROOT),
+            "auto_reload": INDEX_AUTO_RELOAD,
+        }
+
+    # -----------------------------------------------------------------
+    # Warmer (추천 질문 칩/상위 질의 답변 미리 계산)
+    # -----------------------------------------------------------------
+    async def awarm(self, questions: List[str], force: bool = False) -> Dict[str, int]:
+        """
+        각 질문에 대해 라우터 intent → 검색 → rerank → 답변을 미리 계산해
+        intent/임베딩/rerank/answer 캐시를 채운다. (DOC 질문은 대화 내역이 필요하므로 intent만)
+        - 이미 답변 캐시에 있으면 건너뜀 (force=True면 다시 계산)
+        - 요청 경로와 같은 코드를 쓰되, 임시 세션을 만들고 끝나면 지움
+        """
+        stats = {"warmed": 0, "skipped": 0, "doc": 0, "error": 0}
+        for q in questions:
+            if not force and self.answer_cache.contains(q):
+                stats["skipped"] += 1
+                continue
+            session_id = f"__warm__:{uuid.uuid4().hex}"
+            try:
+                route = await self.aroute(q)
+                if route["intent"] == "DOC":
+                    stats["doc"] += 1
+                    continue
+                await self.aanswer_with_sources(q, session_id=session_id)
+                stats["warmed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                stats["error"] += 1
+                print(f"⚠️ warm 실패: {q[:40]} ({e})")
+            finally:
+                await adrop_session(session_id)
+
+        for result, n in stats.items():
+            if n:
+                metrics.inc("warm_questions_total", n, result=result)
+        print(f"🔥 warm 완료: {stats}")
+        return stats
+
+    def start_warmer(self, questions: List[str]) -> None:
+        """
+        startup에서 호출: 백그라운드로 즉시 1회 + WARM_REFRESH_SEC 주기로 갱신 (TTL 만료분 재계산).
+        인덱스 변경이 감지되면 async_index_version()이 즉시 다시 warm.
+        """
+        self._warm_questions = list(dict.fromkeys(q.strip() for q in questions if q and q.strip()))
+        if not self._warm_questions:
+            return
+
+        async def loop() -> None:
+            while True:
+                await self.awarm(self._warm_questions)
+                if WARM_REFRESH_SEC <= 0:
+                    return
+                await asyncio.sleep(WARM_REFRESH_SEC)
+
+        self._spawn(loop())
+
+    # -----------------------------------------------------------------
+    # Semantic answer cache (첫 턴 CHAT 전용)
+    # -----------------------------------------------------------------
+    async def _aembed_query(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._vector_executor, self.embeddings.embed_query, text)
+
+    async def acached_answer(self, question: str, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        대화 맥락이 없는 첫 질문이고 의미상 거의 같은 질문의 답이 캐시에 있으면 그대로 반환.
+        실제 실행과 같은 세션 상태(히스토리, 문진 턴)를 남긴다.
+        return: answer_with_sources()와 같은 형태 + {"cached": True, "similarity": float} | None
+        """
+        if ANSWER_CACHE_SIZE <= 0:
+            return None
+
+        history = get_session_history(session_id)
+        if await history.aget_messages():
+            return None
+
+        rule = classify_intent(question)
+        if rule["intent"] == "DOC" and rule["confidence"] >= ROUTER_RULE_MIN_CONFIDENCE:
+            return None
+
+        t0 = time.perf_counter()
+        await self.async_index_version()
+        hit = self.answer_cache.lookup(await self._aembed_query(question))
+        if hit is None:
+            return None
+
+        await store.aset_turns(session_id, 1 if hit["mode"] == "INTERVIEW" else 0)
+        await history.aadd_messages([HumanMessage(content=question), AIMessage(content=hit["answer"])])
+        return {**hit, "cached": True, "timings": {"cache_ms": _elapsed_ms(t0)}}
+
+    async def _aremember_answer(self, question: str, out: Dict[str, Any], index_version: str) -> None:
+        """
+        index_version: 검색 전에 잡아 둔 인덱스 지문. 답변 생성 중 인덱스가 바뀌었으면(reload/재구축)
+        이전 인덱스 기준 답변이 방금 비운 캐시에 들어가지 않도록 저장하지 않음.
+        """
+        if ANSWER_CACHE_SIZE <= 0 or not (out.get("answer") or "").strip():
+            return
+        if await self.async_index_version() != index_version:
+            return
+        vec = await self._aembed_query(question)
+        if self._index_version != index_version:
+            return
+        self.answer_cache.put(
+            question,
+            vec,
+            {
+                "answer": out["answer"],
+                "mode": out.get("mode"),
+                "docs": out.get("docs", []),
+                "scores": out.get("scores", []),
+            },
+        )
+
+    # -----------------------------------------------------------------
+    # Rerank (결과 캐시 → 미스일 때만 rerank LLM)
+    # -----------------------------------------------------------------
+    def _rerank_cache_key(self, question: str, docs: List[Document]) -> Tuple[str, Tuple[str, ...], str]:
+        return (normalize_query(question), tuple(_doc_key(d) for d in docs), self.reranker.model_id)
+
+    def _finish_rerank(self, key, picks: List[int], docs: List[Document]) -> List[int]:
+        if picks:
+            self.rerank_cache.put(key, picks)
+        else:
+            # 판단 실패(JSON 파싱 실패 등) → 검색 순서 그대로 (캐시하지 않음: 다음에 다시 시도)
+            metrics.inc("rerank_parse_fallback_total", reranker=self.reranker.model_id)
+        return picks or list(range(min(FINAL_K, len(docs))))
+
+    def rerank(self, question: str, docs: List[Document], scores: List[float]) -> List[Document]:
+        if not docs:
+            return []
+        key = self._rerank_cache_key(question, docs)
+        picks = self.rerank_cache.get(key)
+        if picks is None:
+            picks = self.reranker.rerank_indices(question, docs, scores, FINAL_K)
+            picks = self._finish_rerank(key, picks, docs)
+        return [docs[i] for i in picks]
+
+    async def arerank(self, question: str, docs: List[Document], scores: List[float]) -> List[Document]:
+        if not docs:
+            return []
+        key = self._rerank_cache_key(question, docs)
+        picks = self.rerank_cache.get(key)
+        if picks is None and self.reranker.uses_llm:
+            try:
+                async with self.admission.slot(self.reranker.model_id):
+                    picks = await self.reranker.arerank_indices(question, docs, scores, FINAL_K)
+            except AdmissionRejected:
+                # rerank LLM 포화: 요청을 거절하지 않고 검색 순서로 응답 (캐시하지 않음)
+                metrics.inc("rerank_degraded_total", reason="admission")
+                return docs[:FINAL_K]
+            picks = self._finish_rerank(key, picks, docs)
+        elif picks is None:
+            picks = await self.reranker.arerank_indices(question, docs, scores, FINAL_K)
+            picks = self._finish_rerank(key, picks, docs)
+        return [docs[i] for i in picks]
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    # -----------------------------------------------------------------
+    # Router (규칙 fast path + LLM fallback)
+    # -----------------------------------------------------------------
+    async def aroute(self, question: str, rule: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        DOC/CHAT 분류. 규칙 분류기 confidence가 충분하면 LLM 왕복 없이 결정.
+        return: {"intent": "DOC"|"CHAT", "source": "rules"|"cache"|"llm", "confidence": float, "router_ms": int}
+        """
+        t0 = time.perf_counter()
+        rule = rule or classify_intent(question)
+
+        if rule["confidence"] >= ROUTER_RULE_MIN_CONFIDENCE:
+            metrics.inc("router_decisions_total", source="rules", intent=rule["intent"])
+            _update_router_rates()
+            if ROUTER_SHADOW_RATE > 0 and random.random() < ROUTER_SHADOW_RATE:
+                self._spawn(self._shadow_route(question, rule["intent"]))
+            return {
+                "intent": rule["intent"],
+                "source": "rules",
+                "confidence": rule["confidence"],
+                "router_ms": _elapsed_ms(t0),
+            }
+
+        # LLM 라우터 결과 캐시 (greedy라 같은 질문이면 같은 결과, 추천 질문은 warmer가 미리 채움)
+        key = normalize_query(question)
+        intent = self.intent_cache.get(key)
+        if intent is not None:
+            metrics.inc("router_decisions_total", source="cache", intent=intent)
+            return {
+                "intent": intent,
+                "source": "cache",
+                "confidence": rule["confidence"],
+                "router_ms": _elapsed_ms(t0),
+            }
+
+        try:
+            async with self.admission.slot(ROUTER_LLM_ID):
+                raw = await self.router_chain.ainvoke({"question": question})
+        except AdmissionRejected:
+            # 라우터 LLM 포화: 규칙 분류기 결과로 진행 (confidence가 낮아도 요청은 살림)
+            metrics.inc("router_decisions_total", source="rules_degraded", intent=rule["intent"])
+            return {
+                "intent": rule["intent"],
+                "source": "rules",
+                "confidence": rule["confidence"],
+                "router_ms": _elapsed_ms(t0),
+            }
+        intent = _parse_intent(raw)
+        self.intent_cache.put(key, intent)
+        metrics.inc("router_decisions_total", source="llm", intent=intent)
+        metrics.inc(
+            "router_agreement_total",
+            path="fallback",
+            result="agree" if intent == rule["intent"] else "disagree",
+        )
+        _update_router_rates()
+        return {
+            "intent": intent,
+            "source": "llm",
+            "confidence": rule["confidence"],
+            "router_ms": _elapsed_ms(t0),
+        }
+
+    async def _aafter_document(self, session_id: str) -> bool:
+        """직전 AI 응답이 작성된 문서인지 (수정 요청 follow-up 판별용)"""
+        messages = await get_session_history(session_id).aget_messages()
+        for msg in reversed(messages):
+            if msg.type != "human":
+                return is_doc_message(msg)
+        return False
+
+    async def aclassify(self, question: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        규칙 분류 + 문서 직후의 수정 요청 보정.
+        "금액은 300만원으로 해줘" 같은 follow-up은 단독으로는 DOC 신호가 약하지만,
+        직전 턴이 문서이고 수정 동사 + 대상(섹션/금액/날짜)이 함께 있으면 DOC로 확정.
+        수정 동사만 있으면("추가로 알려줘" 등) 규칙으로 확정하지 않고 LLM 라우터가 판단.
+        """
+        rule = classify_intent(question)
+        if rule["intent"] == "DOC" and rule["confidence"] >= ROUTER_RULE_MIN_CONFIDENCE:
+            return rule
+        if not (session_id and is_edit_request(question) and await self._aafter_document(session_id)):
+            return rule
+        if is_targeted_edit(question):
+            return {**rule, "intent": "DOC", "confidence": 0.95}
+        return {**rule, "confidence": min(rule["confidence"], ROUTER_RULE_MIN_CONFIDENCE - 0.1)}
+
+    async def aroute_speculative(
+        self, question: str, session_id: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], Optional["asyncio.Task"]]:
+        """
+        라우터와 후보 검색을 동시에 시작 (대부분의 트래픽은 CHAT).
+        - CHAT: 진행 중인 후보 검색 task를 반환 → aanswer_with_sources(prefetched=...)로 이어서 사용
+        - DOC: 후보 검색 폐기
+        - 규칙 분류기가 DOC를 확신하면 애초에 검색을 시작하지 않음
+        """
+        rule = await self.aclassify(question, session_id)
+        prefetch = None
+        if SPECULATIVE_RETRIEVAL and not (
+            rule["intent"] == "DOC" and rule["confidence"] >= ROUTER_RULE_MIN_CONFIDENCE
+        ):
+            prefetch = self.prefetch_candidates(question)
+
+        try:
+            route = await self.aroute(question, rule=rule)
+        except BaseException:
+            if prefetch is not None:
+                prefetch.cancel()
+            raise
+
+        if prefetch is not None and route["intent"] == "DOC":
+            prefetch.cancel()
+            metrics.inc("speculative_retrieval_total", result="discarded")
+            prefetch = None
+        elif prefetch is not None:
+            metrics.inc("speculative_retrieval_total", result="used")
+
+        return route, prefetch
+
+    async def _shadow_route(self, question: str, rule_intent: str) -> None:
+        try:
+            # 측정용 호출이라 자리가 없으면 기다리지 않고 건너뜀
+            async with self.admission.slot(ROUTER_LLM_ID, max_wait_sec=0):
+                intent = _parse_intent(await self.router_chain.ainvoke({"question": question}))
+        except Exception:
+            return
+        metrics.inc(
+            "router_agreement_total",
+            path="shadow",
+            result="agree" if intent == rule_intent else "disagree",
+        )
+        _update_router_rates()
+        if intent != rule_intent:
+            print(f"⚠️ Router 불일치 rules={rule_intent} llm={intent} | {question[:60]}")
+
+    # -----------------------------------------------------------------
+    # Chains
+    # -----------------------------------------------------------------
+    def retrieve(self, question: str) -> Dict[str, Any]:
+        """
+        (A) 후보 검색 + 게이트 → (B) rerank → (C) context 구성. 요청 당 정확히 1회만 수행.
+        return: {"mode", "docs", "scores", "context", "timings"}
+        """
+        timings: Dict[str, int] = {}
+
+        t0 = time.perf_counter()
+        pairs, lexical_rescue = _retrieve_candidates(
+            self.vectorstore, question, k=CANDIDATE_K, lexical_index=self.lexical_index
+        )
+        timings["retrieval_ms"] = _elapsed_ms(t0)
+
+        docs = [d for d, _ in pairs]
+        scores = [s for _, s in pairs]
+
+        if not _passes_gate_or_rescue(scores, lexical_rescue):
+            # 게이트 실패: 우선 문진 모드 (단, 턴 제한)
+            return _retrieval_result("INTERVIEW", [], scores, timings)
+
+        # 게이트 통과: rerank 후 context 구성
+        t1 = time.perf_counter()
+        reranked = self.rerank(question, docs, scores)
+        timings["rerank_ms"] = _elapsed_ms(t1)
+
+        return _retrieval_result("SOLUTION", reranked, scores, timings)
+
+    def prefetch_candidates(self, question: str) -> "asyncio.Task":
+        """
+        후보 검색(쿼리 임베딩 + Chroma, 하이브리드면 BM25 역색인)을 즉시 시작하는 task.
+        결과: (pairs, lexical_rescue, started_at, finished_at)  (perf_counter 기준)
+        """
+        loop = asyncio.get_running_loop()
+
+        async def run() -> Tuple[List[Tuple[Document, float]], bool, float, float]:
+            t0 = time.perf_counter()
+            pairs, lexical_rescue = await loop.run_in_executor(
+                self._vector_executor,
+                _retrieve_candidates,
+                self.vectorstore,
+                question,
+                CANDIDATE_K,
+                self.lexical_index,
+            )
+            return pairs, lexical_rescue, t0, time.perf_counter()
+
+        return asyncio.ensure_future(run())
+
+    async def aretrieve(
+        self, question: str, prefetched: Optional["asyncio.Task"] = None
+    ) -> Dict[str, Any]:
+        """
+        retrieve()의 async 버전.
+        - Chroma 질의: 전용(bounded) 스레드 풀
+        - rerank LLM: ainvoke (네이티브 async)
+        - prefetched: 라우터와 동시에 시작해 둔 후보 검색 task (있으면 재사용)
+        """
+        timings: Dict[str, int] = {}
+
+        t_wait0 = time.perf_counter()
+        task = prefetched if prefetched is not None else self.prefetch_candidates(question)
+        pairs, lexical_rescue, started, finished = await task
+        timings["retrieval_ms"] = int((finished - started) * 1000)
+        if prefetched is not None:
+            # 라우터 대기 중에 이미 진행된 검색 시간 = 임계 경로에서 숨긴 시간
+            overlap_ms = max(0, int((min(finished, t_wait0) - started) * 1000))
+            timings["retrieval_wait_ms"] = _elapsed_ms(t_wait0)
+            timings["overlap_ms"] = overlap_ms
+            metrics.inc("speculative_overlap_ms_total", overlap_ms)
+
+        docs = [d for d, _ in pairs]
+        scores = [s for _, s in pairs]
+
+        if not _passes_gate_or_rescue(scores, lexical_rescue):
+            return _retrieval_result("INTERVIEW", [], scores, timings)
+
+        t1 = time.perf_counter()
+        reranked = await self.arerank(question, docs, scores)
+        timings["rerank_ms"] = _elapsed_ms(t1)
+
+        return _retrieval_result("SOLUTION", reranked, scores, timings)
+
+    # -----------------------------------------------------------------
+    # Chat history window (토큰 예산 + rolling 요약)
+    # -----------------------------------------------------------------
+    def window_history(self, session_id: str, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        프롬프트용 chat_history = [요약 SystemMessage] + 아직 요약 안 된 턴 + 최근 창.
+        - DOC-like AI 메시지(작성된 문서 본문)는 제외
+        - 예산 밖 턴이 HISTORY_SUMMARY_MIN_PENDING개 이상 쌓이면 백그라운드로 요약 갱신
+          (이번 요청은 기다리지 않고 해당 턴을 원문으로 포함)
+        """
+        state = store.state(session_id)
+        if state.summary_upto > len(messages):
+            # 내역이 비워짐(clear) → 요약도 무효
+            state.summary, state.summary_upto = "", 0
+            store.refresh_aux_bytes(session_id)
+
+        start, pending, window = split_history(
+            messages, HISTORY_TOKEN_BUDGET, HISTORY_MIN_MESSAGES, state.summary_upto
+        )
+        if len(pending) >= HISTORY_SUMMARY_MIN_PENDING:
+            self._schedule_summary(session_id, pending, start)
+
+        out: List[BaseMessage] = []
+        summary = summary_message_text(state.summary)
+        if summary:
+            out.append(SystemMessage(content=summary))
+        out.extend(pending)
+        out.extend(window)
+        metrics.inc(
+            "history_window_total",
+            kind="summarized" if summary else ("pending" if pending else "full"),
+        )
+        return out
+
+    def _schedule_summary(self, session_id: str, pending: List[BaseMessage], upto: int) -> None:
+        if session_id in self._summarizing:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return  # sync 경로: 요약 없이 원문 포함
+        self._summarizing.add(session_id)
+        self._spawn(self._asummarize(session_id, pending, upto))
+
+    async def _asummarize(self, session_id: str, pending: List[BaseMessage], upto: int) -> None:
+        state = store.state(session_id)
+        try:
+            # 백그라운드 작업이라 자리가 없으면 다음 턴에 다시 시도
+            async with self.admission.slot(SUMMARY_LLM_ID, max_wait_sec=0):
+                summary = await self.summary_chain.ainvoke(
+                    {"summary": state.summary or "(없음)", "transcript": format_for_summary(pending)}
+                )
+            if state.summary_upto < upto:
+                state.summary, state.summary_upto = summary.strip(), upto
+                store.refresh_aux_bytes(session_id)
+            metrics.inc("history_summaries_total", result="ok")
+        except Exception as e:
+            metrics.inc("history_summaries_total", result="error")
+            print(f"⚠️ 대화 요약 실패 ({session_id}): {e}")
+        finally:
+            self._summarizing.discard(session_id)
+
+    # -----------------------------------------------------------------
+    # Document revision (마지막 문서를 섹션 단위로 부분 수정)
+    # -----------------------------------------------------------------
+    async def alast_document(self, session_id: str) -> Optional[str]:
+        """세션 내역에서 가장 최근 작성된 문서 본문 (없으면 None)"""
+        messages = await get_session_history(session_id).aget_messages()
+        for msg in reversed(messages):
+            if is_doc_message(msg):
+                return msg.content
+        return None
+
+    async def arevise_document(self, session_id: str, request: str) -> Optional[Dict[str, Any]]:
+        """
+        "금액만 500만원으로 바꿔줘" 같은 부분 수정 요청이면 영향받는 섹션만 작은 프롬프트로 다시 써서 재조립.
+        부분 수정으로 처리할 수 없으면 None → 호출 측에서 writer 전체 재생성.
+        return: {"document": str, "sections": [key], "timings": {"revise_ms"}}
+        """
+        document = await self.alast_document(session_id)
+        plan = plan_revision(request, document) if document else None
+        if plan is None:
+            metrics.inc("doc_revisions_total", mode="full")
+            return None
+
+        sections, keys = plan
+        t0 = time.perf_counter()
+
+        async def patch(section) -> None:
+            async with self.admission.slot(WRITER_LLM_ID):
+                out = await self.section_edit_chain.ainvoke(
+                    {"request": request, "section": section.text}
+                )
+            section.text = clean_patch(section.text, out)
+
+        # 한 섹션이 실패(AdmissionRejected 등)하면 나머지 섹션 호출도 취소 (슬롯/LLM 호출 낭비 방지)
+        tasks = [asyncio.ensure_future(patch(sec)) for sec in sections if sec.key in keys]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        metrics.inc("doc_revisions_total", mode="patch")
+        return {
+            "document": render_document(sections),
+            "sections": keys,
+            "timings": {"revise_ms": _elapsed_ms(t0)},
+        }
+
+    def _select_generation(self, inputs: Dict[str, Any]) -> Tuple[Runnable, Dict[str, Any]]:
+        """
+        mode + 문진 턴 제한으로 사용할 생성 체인과 입력을 결정. (sync 경로)
+        문진 모드면 턴 카운터 +1, 솔루션 모드면 0으로 리셋 (정상적으로 근거를 찾았다는 뜻)
+        """
+        session_id = inputs.get("session_id", "default_user")
+        turns = 0
+        if inputs.get("mode", "INTERVIEW") == "INTERVIEW":
+            turns = store.get_turns(session_id) + 1
+        store.set_turns(session_id, turns)
+        return self._generation_for(inputs, turns)
+
+    async def _aselect_generation(self, inputs: Dict[str, Any]) -> Tuple[Runnable, Dict[str, Any]]:
+        """_select_generation()의 async 버전 (SQLite 턴 카운터 I/O를 이벤트 루프 밖에서)"""
+        session_id = inputs.get("session_id", "default_user")
+        turns = 0
+        if inputs.get("mode", "INTERVIEW") == "INTERVIEW":
+            turns = await store.aget_turns(session_id) + 1
+        await store.aset_turns(session_id, turns)
+        return self._generation_for(inputs, turns)
+
+    def _generation_for(self, inputs: Dict[str, Any], turns: int) -> Tuple[Runnable, Dict[str, Any]]:
+        mode = inputs.get("mode", "INTERVIEW")
+        question = inputs["question"]
+        context = inputs.get("context", "")
+        session_id = inputs.get("session_id", "default_user")
+        chat_history = self.window_history(session_id, inputs.get("chat_history", []))
+
+        # 문진 턴 제한
+        if mode == "INTERVIEW":
+            # 1~MAX_INTERVIEW_TURNS 까지는 문진
+            if turns <= MAX_INTERVIEW_TURNS:
+                return self.interview_chain, {"question": question, "chat_history": chat_history}
+
+            # 문진 턴 초과: 더 이상 질문 폭주 금지 → 일반 가이드로 전환
+            return self.fallback_chain, {"question": question, "chat_history": chat_history}
+
+        if context.strip():
+            return self.solution_chain, {
+                "question": question,
+                "context": context,
+                "chat_history": chat_history,
+            }
+
+        # 이론상 여기 오면 안 되지만, 안전장치
+        return self.fallback_chain, {"question": question, "chat_history": chat_history}
+
+    def _compile_rag_chain(self):
+        # =========================================================
+        # Retrieval step (A + B) + Interview-turn gate
+        # =========================================================
+        def retrieval_step(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            session_id = inputs.get("session_id", "default_user")
+            return {**inputs, **self.retrieve(inputs["question"]), "session_id": session_id}
+
+        async def aretrieval_step(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            session_id = inputs.get("session_id", "default_user")
+            retrieved = await self.aretrieve(inputs["question"], prefetched=inputs.get("prefetched"))
+            return {**inputs, **retrieved, "session_id": session_id}
+
+        def route_and_answer(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            t0 = time.perf_counter()
+            chain, payload = self._select_generation(inputs)
+            answer = chain.invoke(payload)
+            return _answer_result(inputs, answer, _elapsed_ms(t0))
+
+        async def aroute_and_answer(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            t0 = time.perf_counter()
+            # 슬롯을 먼저 확보: 429로 거절되면 문진 턴 카운터도 건드리지 않음
+            async with self.admission.slot(MAIN_LLM_ID):
+                chain, payload = await self._aselect_generation(inputs)
+                answer = await chain.ainvoke(payload)
+            return _answer_result(inputs, answer, _elapsed_ms(t0))
+
+        base_chain = (
+            RunnableMap(
+                {
+                    "question": lambda x: x["question"],
+                    "chat_history": lambda x: x.get("chat_history", []),
+                    # RunnableWithMessageHistory config에서 세션을 받기 때문에,
+                    # 여기서는 안전하게 기본값 처리만.
+                    "session_id": lambda x: x.get("session_id", "default_user"),
+                    # 라우터와 동시에 시작된 후보 검색 task (async 경로 전용, 없으면 None)
+                    "prefetched": lambda x: x.get("prefetched"),
+                }
+            )
+            | RunnableLambda(retrieval_step, afunc=aretrieval_step)
+            | RunnableLambda(route_and_answer, afunc=aroute_and_answer)
+        )
+
+        return RunnableWithMessageHistory(
+            base_chain,
+            get_session_history,
+            input_messages_key="question",
+            output_messages_key="answer",
+            history_messages_key="chat_history",
+        )
+
+    def _compile_writing_chain(self):
+        """
+        대화 내역 기반 문서 작성 전용 체인
+        (주의: 문서 반복 출력 이슈는 main.py에서 history 정제/중복 저장을 먼저 잡는 게 핵심)
+        """
+        return (
+            {"chat_history": lambda x: x["chat_history"]}
+            | self.writer_prompt
+            | self.writer_llm
+            | StrOutputParser()
+        )
+
+    # -----------------------------------------------------------------
+    # Public API
+    # -----------------------------------------------------------------
+    def answer_with_sources(self, question: str, session_id: str = "default_user") -> Dict[str, Any]:
+        """
+        main.py에서 '근거 불일치'를 없애기 위한 단일 진실 소스.
+        - 검색/rerank는 rag_chain 내부에서 정확히 1회만 수행되고,
+        - 최종 답변과 그 답변에 사용된 rerank docs가 같은 실행 결과에서 나옴.
+
+        return:
+          {
+            "answer": str,
+            "mode": "SOLUTION"|"INTERVIEW",
+            "docs": List[Document],
+            "scores": List[float],
+            "timings": {"retrieval_ms", "rerank_ms"(SOLUTION), "generate_ms"}
+          }
+        """
+        # ✅ 세션 히스토리 확보
+        get_session_history(session_id)
+
+        # 세션 메모리 업데이트는 RunnableWithMessageHistory가 수행 (output_messages_key="answer")
+        return self.rag_chain.invoke(
+            {"question": question, "session_id": session_id},
+            config={"configurable": {"session_id": session_id}},
+        )
+
+    async def aanswer_with_sources(
+        self,
+        question: str,
+        session_id: str = "default_user",
+        prefetched: Optional["asyncio.Task"] = None,
+    ) -> Dict[str, Any]:
+        """
+        answer_with_sources()의 async 버전. (/chat 이벤트 루프를 막지 않음)
+        - prefetched: aroute_speculative()가 반환한 후보 검색 task
+        - 첫 턴 답변은 semantic answer cache에 저장
+        """
+        first_turn = not await get_session_history(session_id).aget_messages()
+        index_version = await self.async_index_version() if first_turn else None
+        out = await self.rag_chain.ainvoke(
+            {"question": question, "session_id": session_id, "prefetched": prefetched},
+            config={"configurable": {"session_id": session_id}},
+        )
+        if first_turn:
+            await self._aremember_answer(question, out, index_version)
+        return out
+
+    async def astream_answer(
+        self,
+        question: str,
+        session_id: str = "default_user",
+        prefetched: Optional["asyncio.Task"] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        답변을 토큰 단위로 스트리밍. (검색/rerank 1회 → 생성 astream)
+        yield 순서:
+          {"event": "retrieval", "mode", "docs", "scores", "timings"}  # 검색 직후 1회 (sources 카드용)
+          {"event": "token", "delta": str}                            # 생성 토큰
+          {"event": "answer", "answer", "mode", "docs", "scores", "timings"}  # 완료 시 1회
+        세션 메모리 기록은 스트림이 끝까지 완료된 경우에만 수행.
+        """
+        history = get_session_history(session_id)
+        chat_history = await history.aget_messages()
+        index_version = None if chat_history else await self.async_index_version()
+
+        retrieved = await self.aretrieve(question, prefetched=prefetched)
+        yield {"event": "retrieval", **{k: v for k, v in retrieved.items() if k != "context"}}
+
+        inputs = {
+            **retrieved,
+            "question": question,
+            "chat_history": chat_history,
+            "session_id": session_id,
+        }
+
+        t0 = time.perf_counter()
+        parts: List[str] = []
+        async with self.admission.slot(MAIN_LLM_ID):
+            chain, payload = await self._aselect_generation(inputs)
+            async for delta in chain.astream(payload):
+                if not delta:
+                    continue
+                parts.append(delta)
+                yield {"event": "token", "delta": delta}
+
+        answer = "".join(parts)
+        await history.aadd_messages([HumanMessage(content=question), AIMessage(content=answer)])
+
+        out = _answer_result(inputs, answer, _elapsed_ms(t0))
+        if not chat_history:
+            await self._aremember_answer(question, out, index_version)
+        yield {"event": "answer", **out}
+
+    def get_retriever(self):
+        return self.vectorstore.as_retriever(
+            search_type="mmr",
+            search_kwargs={"k": 5, "fetch_k": 25},
+        )
+
+
+# ---------------------------------------------------------------------
+# Process-wide engine (main.py startup에서 set_engine으로 주입)
+# ---------------------------------------------------------------------
+_engine: Optional[RagEngine] = None
+
+
+def set_engine(engine: Optional[RagEngine]) -> None:
+    global _engine
+    _engine = engine
+
+
+def get_engine() -> RagEngine:
+    """
+    주입된 엔진을 반환. (스크립트/노트북 등 main.py 밖에서 쓰면 최초 1회 lazy 생성)
+    """
+    global _engine
+    if _engine is None:
+        _engine = RagEngine()
+    return _engine
+
+
+# ---------------------------------------------------------------------
+# Public API (기존 함수형 API 호환: 모두 공유 엔진을 사용)
+# ---------------------------------------------------------------------
+def answer_with_sources(question: str, session_id: str = "default_user") -> Dict[str, Any]:
+    return get_engine().answer_with_sources(question, session_id=session_id)
+
+
+async def aanswer_with_sources(question: str, session_id: str = "default_user") -> Dict[str, Any]:
+    return await get_engine().aanswer_with_sources(question, session_id=session_id)
+
+
+def get_retriever():
+    return get_engine().get_retriever()
+
+
+def get_rag_chain():
+    return get_engine().rag_chain
+
+
+def get_writing_chain():
+    return get_engine().writing_chain
+
+
+def get_router_chain():
+    """
+    DOC vs CHAT 분류
+    """
+    return get_engine().router_chain
@@ -0,0 +1,521 @@
+# session_store.py (세션별 대화 내역/상태 저장소: LRU + idle TTL + 크기 상한, 선택적 SQLite 영속화)
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Union
+
+from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from pydantic import PrivateAttr
+
+try:
+    from .history_window import WriterTranscript, tag_message
+    from .metrics import metrics
+except ImportError:
+    from history_window import WriterTranscript, tag_message
+    from metrics import metrics
+
+
+# 영속 세션 TTL purge 최소 간격 (요청 경로에서 가끔만 실행)
+_PURGE_INTERVAL_SEC = 600.0
+
+
+def _message_bytes(msg: BaseMessage) -> int:
+    content = msg.content if isinstance(msg.content, str) else str(msg.content)
+    return len(content.encode("utf-8"))
+
+
+class TrackedChatMessageHistory(InMemoryChatMessageHistory):
+    """
+    메시지가 추가/삭제될 때마다 저장소에 byte 변화량을 알려주는 in-memory history.
+    (매 요청마다 전체 메시지를 다시 세지 않기 위함)
+    """
+
+    _on_change: Any = PrivateAttr(default=None)
+
+    def add_message(self, message: BaseMessage) -> None:
+        super().add_message(tag_message(message))
+        if self._on_change is not None:
+            self._on_change(_message_bytes(message))
+
+    def clear(self) -> None:
+        freed = sum(_message_bytes(m) for m in self.messages)
+        super().clear()
+        if self._on_change is not None and freed:
+            self._on_change(-freed)
+
+
+# ---------------------------------------------------------------------
+# SQLite backend (여러 uvicorn worker / 재시작 간 대화 내역 공유)
+# ---------------------------------------------------------------------
+class SQLiteSessionBackend:
+    """
+    세션 메시지 + 문진 턴 카운터를 SQLite(WAL)에 저장.
+    - 같은 파일을 여러 프로세스가 열어도 됨 (WAL + busy_timeout)
+    - 메시지는 (session_id, seq) 순서로 append-only, 한 번의 트랜잭션으로 묶어서 기록
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        # isolation_level=None: 트랜잭션은 BEGIN IMMEDIATE로 직접 관리 (seq 채번 경쟁 방지)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " session_id TEXT NOT NULL, seq INTEGER NOT NULL, payload TEXT NOT NULL,"
+            " PRIMARY KEY (session_id, seq))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, interview_turns INTEGER NOT NULL DEFAULT 0,"
+            " updated REAL NOT NULL)"
+        )
+
+    def last_seq(self, session_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(seq) FROM messages WHERE session_id=?", (session_id,)
+            ).fetchone()
+        return row[0] or 0
+
+    def load(self, session_id: str, after_seq: int = 0) -> List[tuple]:
+        """[(seq, BaseMessage)] (after_seq 이후만)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, payload FROM messages WHERE session_id=? AND seq>? ORDER BY seq",
+                (session_id, after_seq),
+            ).fetchall()
+        msgs = messages_from_dict([json.loads(r[1]) for r in rows])
+        return [(r[0], m) for r, m in zip(rows, msgs)]
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]) -> int:
+        """메시지 묶음을 한 트랜잭션으로 기록. return: 마지막 seq"""
+        payloads = [json.dumps(message_to_dict(m), ensure_ascii=False) for m in messages]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT MAX(seq) FROM messages WHERE session_id=?", (session_id,)
+                ).fetchone()
+                start = (row[0] or 0) + 1
+                self._conn.executemany(
+                    "INSERT INTO messages VALUES (?, ?, ?)",
+                    [(session_id, start + i, p) for i, p in enumerate(payloads)],
+                )
+                self._touch(session_id)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return start + len(payloads) - 1
+
+    def get_turns(self, session_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT interview_turns FROM sessions WHERE session_id=?", (session_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def set_turns(self, session_id: str, turns: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions VALUES (?, ?, ?) ON CONFLICT(session_id) DO UPDATE"
+                " SET interview_turns=excluded.interview_turns, updated=excluded.updated",
+                (session_id, int(turns), time.time()),
+            )
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM messages WHERE session_id=?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE session_id=?", (session_id,))
+            self._conn.execute("COMMIT")
+
+    def purge(self, older_than_sec: float) -> int:
+        """마지막 기록 후 older_than_sec 이상 지난 세션 삭제. return: 삭제한 세션 수"""
+        cutoff = time.time() - older_than_sec
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            ids = [
+                r[0]
+                for r in self._conn.execute(
+                    "SELECT session_id FROM sessions WHERE updated<?", (cutoff,)
+                ).fetchall()
+            ]
+            self._conn.executemany("DELETE FROM messages WHERE session_id=?", [(i,) for i in ids])
+            self._conn.executemany("DELETE FROM sessions WHERE session_id=?", [(i,) for i in ids])
+            self._conn.execute("COMMIT")
+        return len(ids)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _touch(self, session_id: str) -> None:
+        self._conn.execute(
+            "INSERT INTO sessions VALUES (?, 0, ?) ON CONFLICT(session_id) DO UPDATE"
+            " SET updated=excluded.updated",
+            (session_id, time.time()),
+        )
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """
+    SQLiteSessionBackend 위의 BaseChatMessageHistory + 프로세스 내 read-through 캐시.
+    - messages 조회 시 DB의 MAX(seq)만 확인 → 다른 worker가 추가한 메시지만 이어서 로드
+    - add_messages는 한 트랜잭션 (RunnableWithMessageHistory는 질문/답변을 한 번에 기록)
+    - async 메서드는 DB I/O(BEGIN IMMEDIATE 대기 포함)를 스레드에서 실행 → 이벤트 루프를 막지 않음
+    """
+
+    def __init__(self, session_id: str, backend: SQLiteSessionBackend) -> None:
+        self.session_id = session_id
+        self.backend = backend
+        self._cache: List[BaseMessage] = []
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._on_change: Optional[Callable[[int], None]] = None
+
+    def _sync(self) -> None:
+        last = self.backend.last_seq(self.session_id)
+        if last == self._seq:
+            return
+        if last < self._seq:
+            # 다른 worker가 clear() → 처음부터 다시 로드
+            self._report(-sum(_message_bytes(m) for m in self._cache))
+            self._cache, self._seq = [], 0
+        rows = self.backend.load(self.session_id, after_seq=self._seq)
+        if rows:
+            self._cache.extend(m for _, m in rows)
+            self._seq = rows[-1][0]
+            self._report(sum(_message_bytes(m) for _, m in rows))
+
+    def _report(self, delta: int) -> None:
+        if delta and self._on_change is not None:
+            self._on_change(delta)
+
+    @property
+    def messages(self) -> List[BaseMessage]:  # type: ignore[override]
+        with self._lock:
+            self._sync()
+            return list(self._cache)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        if not messages:
+            return
+        messages = [tag_message(m) for m in messages]
+        with self._lock:
+            self._sync()
+            last = self.backend.append(self.session_id, messages)
+            if last == self._seq + len(messages):
+                self._cache.extend(messages)
+                self._seq = last
+                self._report(sum(_message_bytes(m) for m in messages))
+            else:
+                # 사이에 다른 worker가 끼어든 경우: 다음 조회에서 다시 맞춤
+                self._sync()
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.add_messages([message])
+
+    def clear(self) -> None:
+        with self._lock:
+            self.backend.delete(self.session_id)
+            self._report(-sum(_message_bytes(m) for m in self._cache))
+            self._cache, self._seq = [], 0
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        return await asyncio.to_thread(lambda: self.messages)
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        await asyncio.to_thread(self.add_messages, messages)
+
+    async def aclear(self) -> None:
+        await asyncio.to_thread(self.clear)
+
+
+ChatHistory = Union[TrackedChatMessageHistory, SQLiteChatMessageHistory]
+
+
+class SessionState:
+    """
+    세션 한 개의 상태: 대화 내역 + 문진 턴 카운터 + 마지막 접근 시각
+    + 오래된 턴의 rolling 요약 (summary가 history.messages[:summary_upto]를 대체)
+    """
+
+    __slots__ = (
+        "history",
+        "interview_turns",
+        "last_access",
+        "bytes",
+        "aux_bytes",
+        "summary",
+        "summary_upto",
+        "transcript",
+    )
+
+    def __init__(self, history: ChatHistory) -> None:
+        self.history = history
+        self.interview_turns = 0
+        self.last_access = time.monotonic()
+        self.bytes = 0  # 메시지 본문 + aux_bytes
+        self.aux_bytes = 0  # rolling 요약 + writer transcript 블록
+        self.summary = ""
+        self.summary_upto = 0
+        self.transcript = WriterTranscript()
+
+
+class SessionStore:
+    """
+    session_id -> SessionState. 프론트가 채팅마다 새 session_id를 만들기 때문에
+    무한히 쌓이지 않도록 아래 조건에서 오래된(LRU) 세션부터 제거한다.
+    - max_sessions: 세션 수 상한
+    - max_bytes: 전체 byte 합 상한 (메시지 본문 + rolling 요약 + writer transcript 블록)
+    - idle_ttl_sec: 마지막 접근 후 이 시간이 지나면 제거 (접근 시점에 정리)
+    0 이하는 해당 조건 비활성화.
+
+    backend가 있으면 (SQLite) 메모리는 read-through 캐시 역할만 하고,
+    제거는 캐시에서만 일어난다. 영속 데이터는 backend_ttl_sec 지나면 purge.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 0,
+        max_bytes: int = 0,
+        idle_ttl_sec: float = 0,
+        backend: Optional[SQLiteSessionBackend] = None,
+        backend_ttl_sec: float = 0,
+    ) -> None:
+        self.max_sessions = max(0, int(max_sessions))
+        self.max_bytes = max(0, int(max_bytes))
+        self.idle_ttl_sec = idle_ttl_sec if idle_ttl_sec and idle_ttl_sec > 0 else None
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.total_bytes = 0
+        self.evictions = 0
+        self.backend = backend
+        self.backend_ttl_sec = backend_ttl_sec if backend_ttl_sec and backend_ttl_sec > 0 else None
+        self._purged_at = 0.0
+
+    # -----------------------------------------------------------------
+    # dict 호환 (기존 store[session_id] / in / pop 사용처 유지)
+    # -----------------------------------------------------------------
+    def __contains__(self, session_id: object) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def __getitem__(self, session_id: str) -> ChatHistory:
+        with self._lock:
+            return self._sessions[session_id].history
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._sessions.keys())
+
+    def pop(self, session_id: str, default: Any = None) -> Any:
+        with self._lock:
+            if self.backend is not None:
+                self.backend.delete(session_id)
+            state = self._sessions.pop(session_id, None)
+            if state is None:
+                return default
+            self.total_bytes -= state.bytes
+            state.history._on_change = None
+            self._update_gauges()
+            return state.history
+
+    # -----------------------------------------------------------------
+    # 세션 접근
+    # -----------------------------------------------------------------
+    def state(self, session_id: str) -> SessionState:
+        """세션 상태 반환 (없으면 생성). 접근할 때마다 LRU 갱신 + 만료/상한 정리"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is not None and self._expired(state, now):
+                self._evict(session_id, "idle")
+                state = None
+
+            if state is None:
+                state = SessionState(self._new_history(session_id))
+                self._sessions[session_id] = state
+                metrics.inc("sessions_created_total")
+            else:
+                self._sessions.move_to_end(session_id)
+            state.last_access = now
+
+            self._enforce(now, keep=session_id)
+            self._update_gauges()
+
+        if self.backend_ttl_sec is not None and now - self._purged_at > _PURGE_INTERVAL_SEC:
+            # 요청 경로(이벤트 루프)에서 호출되므로 purge(DB 트랜잭션)는 백그라운드 스레드로
+            self._purged_at = now
+            threading.Thread(target=self.sweep, name="session-purge", daemon=True).start()
+        return state
+
+    def history(self, session_id: str) -> ChatHistory:
+        return self.state(session_id).history
+
+    def refresh_aux_bytes(self, session_id: str) -> None:
+        """요약/transcript를 바꾼 뒤 호출: 세션 byte 집계에 반영 (늘었으면 상한 정리)"""
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                return
+            size = len(state.summary.encode("utf-8")) + state.transcript.bytes
+            delta = size - state.aux_bytes
+            if not delta:
+                return
+            state.aux_bytes = size
+            state.bytes += delta
+            self.total_bytes += delta
+            if delta > 0 and self.max_bytes:
+                self._enforce(time.monotonic(), keep=session_id)
+            self._update_gauges()
+
+    def get_turns(self, session_id: str) -> int:
+        if self.backend is not None:
+            return self.backend.get_turns(session_id)
+        with self._lock:
+            state = self._sessions.get(session_id)
+            return state.interview_turns if state is not None else 0
+
+    def set_turns(self, session_id: str, turns: int) -> None:
+        self.state(session_id).interview_turns = turns
+        if self.backend is not None:
+            self.backend.set_turns(session_id, turns)
+
+    async def aexists(self, session_id: str) -> bool:
+        """
+        세션이 있는지 (캐시에 없어도 backend에 메시지가 있으면 True: 재시작/다른 worker/캐시에서 제거된 세션)
+        조회만으로 빈 세션을 만들지 않기 위한 확인용
+        """
+        if session_id in self:
+            return True
+        if self.backend is None:
+            return False
+        return await asyncio.to_thread(self.backend.last_seq, session_id) > 0
+
+    async def aget_turns(self, session_id: str) -> int:
+        if self.backend is None:
+            return self.get_turns(session_id)
+        return await asyncio.to_thread(self.get_turns, session_id)
+
+    async def aset_turns(self, session_id: str, turns: int) -> None:
+        self.state(session_id).interview_turns = turns
+        if self.backend is not None:
+            await asyncio.to_thread(self.backend.set_turns, session_id, turns)
+
+    async def apop(self, session_id: str, default: Any = None) -> Any:
+        """pop()의 async 버전 (backend 삭제 트랜잭션을 스레드에서 실행)"""
+        if self.backend is None:
+            return self.pop(session_id, default)
+        return await asyncio.to_thread(self.pop, session_id, default)
+
+    def sweep(self) -> int:
+        """idle TTL 지난 세션 일괄 정리 (주기적으로 호출해도 되고 안 해도 됨)"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [sid for sid, st in self._sessions.items() if self._expired(st, now)]
+            for sid in expired:
+                self._evict(sid, "idle")
+            self._update_gauges()
+        if self.backend is not None and self.backend_ttl_sec is not None:
+            self._purged_at = now
+            purged = self.backend.purge(self.backend_ttl_sec)
+            if purged:
+                metrics.inc("session_evictions_total", purged, reason="persisted_ttl")
+        return len(expired)
+
+    def close(self) -> None:
+        self.clear()
+        if self.backend is not None:
+            self.backend.close()
+
+    def clear(self) -> None:
+        """프로세스 내 세션(캐시)만 비움. 영속 데이터는 유지"""
+        with self._lock:
+            for state in self._sessions.values():
+                state.history._on_change = None
+            self._sessions.clear()
+            self.total_bytes = 0
+            self._update_gauges()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self.total_bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "idle_ttl_sec": self.idle_ttl_sec,
+                "evictions": self.evictions,
+                "backend": "sqlite" if self.backend is not None else "memory",
+            }
+
+    # -----------------------------------------------------------------
+    # 내부
+    # -----------------------------------------------------------------
+    def _new_history(self, session_id: str) -> ChatHistory:
+        history: ChatHistory
+        if self.backend is not None:
+            history = SQLiteChatMessageHistory(session_id, self.backend)
+        else:
+            history = TrackedChatMessageHistory()
+
+        def on_change(delta: int) -> None:
+            with self._lock:
+                state = self._sessions.get(session_id)
+                if state is None or state.history is not history:
+                    return  # 이미 제거된 세션 (진행 중이던 요청이 뒤늦게 기록)
+                state.bytes += delta
+                self.total_bytes += delta
+                if delta > 0 and self.max_bytes:
+                    self._enforce(time.monotonic(), keep=session_id)
+                self._update_gauges()
+
+        history._on_change = on_change
+        return history
+
+    def _expired(self, state: SessionState, now: float) -> bool:
+        return self.idle_ttl_sec is not None and now - state.last_access > self.idle_ttl_sec
+
+    def _evict(self, session_id: str, reason: str) -> None:
+        state = self._sessions.pop(session_id)
+        state.history._on_change = None
+        self.total_bytes -= state.bytes
+        self.evictions += 1
+        metrics.inc("session_evictions_total", reason=reason)
+
+    def _enforce(self, now: float, keep: Optional[str] = None) -> None:
+        # 가장 오래된 것부터: idle 만료 → 세션 수 → byte 상한 (방금 접근한 세션은 유지)
+        for sid in list(self._sessions.keys()):
+            if sid == keep:
+                continue
+            state = self._sessions[sid]
+            if self._expired(state, now):
+                reason = "idle"
+            elif self.max_sessions and len(self._sessions) > self.max_sessions:
+                reason = "size"
+            elif self.max_bytes and self.total_bytes > self.max_bytes:
+                reason = "bytes"
+            else:
+                break
+            self._evict(sid, reason)
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge("sessions_live", len(self._sessions))
+        metrics.set_gauge("sessions_bytes", self.total_bytes)
@@ -0,0 +1,112 @@
+# sheet_loader.py (ingest용 엑셀 스트리밍 로더 + 파일 해시 기준 Parquet 캐시)
+import hashlib
+import os
+from typing import Any, Dict, Iterator, List, Optional
+
+from openpyxl import load_workbook
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 캐시는 선택 기능 (pip install "mediguide_rag[cache]"): 없으면 매번 엑셀 파싱
+    pa = None
+    pq = None
+
+Row = Dict[str, Optional[str]]
+
+_CACHE_BATCH_ROWS = 256
+
+_warned_no_pyarrow = False
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cell_str(v: Any) -> Optional[str]:
+    # 빈 셀은 None (pandas의 NaN → "nan" 문자열 같은 값이 섞이지 않도록)
+    if v is None:
+        return None
+    s = str(v)
+    return s if s.strip() else None
+
+
+def _iter_excel(path: str) -> Iterator[Row]:
+    """read_only 모드로 행 단위 순회 (시트 전체를 DataFrame으로 올리지 않음)"""
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        # pandas read_excel(sheet_name=0)과 같은 첫 시트 (wb.active는 마지막으로 저장된 활성 시트)
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        # 이름 없는 열(pandas의 "Unnamed: n")은 버림
+        cols = [(i, str(h).strip()) for i, h in enumerate(header) if h is not None and str(h).strip()]
+        for values in rows:
+            if values is None or all(v is None for v in values):
+                continue
+            yield {name: _cell_str(values[i]) if i < len(values) else None for i, name in cols}
+    finally:
+        wb.close()
+
+
+def _iter_parquet(path: str) -> Iterator[Row]:
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=_CACHE_BATCH_ROWS):
+        yield from batch.to_pylist()
+
+
+def _iter_excel_and_cache(path: str, cache_path: str) -> Iterator[Row]:
+    """엑셀을 읽으며 같은 행을 Parquet으로 기록. 끝까지 읽은 경우에만 캐시 확정."""
+    tmp = cache_path + ".tmp"
+    writer = None
+    buf: List[Row] = []
+    schema = None
+    completed = False
+    try:
+        for row in _iter_excel(path):
+            if schema is None:
+                schema = pa.schema([(name, pa.string()) for name in row])
+                writer = pq.ParquetWriter(tmp, schema)
+            buf.append(row)
+            if len(buf) >= _CACHE_BATCH_ROWS:
+                writer.write_table(pa.Table.from_pylist(buf, schema=schema))
+                buf = []
+            yield row
+        if writer is not None and buf:
+            writer.write_table(pa.Table.from_pylist(buf, schema=schema))
+        completed = writer is not None
+    finally:
+        if writer is not None:
+            writer.close()
+        if completed:
+            os.replace(tmp, cache_path)
+        elif os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def iter_sheet_rows(path: str, cache_dir: Optional[str] = None) -> Iterator[Row]:
+    """
+    첫 시트의 행을 {헤더: 문자열|None} dict로 하나씩 yield.
+    - cache_dir가 있고 pyarrow가 설치돼 있으면 <cache_dir>/<파일 sha256>.parquet 를 재사용
+      (엑셀 파일이 바뀌면 해시가 달라져 자동으로 다시 파싱)
+    """
+    global _warned_no_pyarrow
+    if cache_dir and pq is None and not _warned_no_pyarrow:
+        _warned_no_pyarrow = True
+        print("⚠️ pyarrow 미설치 → 시트 캐시 꺼짐 (매번 엑셀 파싱). uv sync --extra cache 로 설치")
+    if not cache_dir or pq is None:
+        yield from _iter_excel(path)
+        return
+
+    cache_path = os.path.join(cache_dir, f"{file_sha256(path)}.parquet")
+    if os.path.exists(cache_path):
+        print(f"⚡ 시트 캐시 사용: {cache_path}")
+        yield from _iter_parquet(cache_path)
+        return
+
+    os.makedirs(cache_dir, exist_ok=True)
+    yield from _iter_excel_and_cache(path, cache_path)
@@ -0,0 +1,10 @@
+# tokens.py (tokenizer 없이 쓰는 토큰 수 추정: 대화 창 예산 / ingest 통계 공용)
+import math
+
+
+def estimate_tokens(text: str) -> int:
+    """영문/숫자 ~4자당 1토큰, 한글 등은 글자당 1토큰 (실제보다 크게 잡는 보수적 추정)"""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
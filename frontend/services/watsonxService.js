@@ -2,6 +2,7 @@
 
 const BACKEND_URL = import.meta.env.VITE_BACKEND_URL || 'http://localhost:8000';
 const CHAT_ENDPOINT = `${BACKEND_URL}/chat`;
+const CHAT_STREAM_ENDPOINT = `${BACKEND_URL}/chat/stream`;
 const SUGGESTIONS_ENDPOINT = `${BACKEND_URL}/suggested_questions`;
 
 export class WatsonxService {
@@ -70,6 +71,103 @@ export class WatsonxService {
     }
   }
 
+  // 메시지 전송 (스트리밍: SSE)
+  // - onMeta({ type, intent, mode, sources, answer }) : 검색 직후 1회
+  // - onToken(delta) : 생성 토큰마다
+  // 완료되면 /chat 과 같은 형태의 응답 객체를 반환 (streamed: true)
+  async sendMessageStream(message, { onMeta, onToken } = {}) {
+    if (!this.activeSessionId) {
+      this.createNewChat();
+    }
+
+    console.log('🚀 [MediGuide] 스트리밍 요청:', CHAT_STREAM_ENDPOINT);
+
+    const response = await fetch(CHAT_STREAM_ENDPOINT, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Accept: 'text/event-stream',
+      },
+      body: JSON.stringify({
+        query: message,
+        session_id: this.activeSessionId,
+      }),
+    });
+
+    if (!response.ok || !response.body) {
+      const errorText = await response.text();
+      console.error('❌ [MediGuide] 에러:', errorText);
+      throw new Error(`백엔드 연결 실패! 상태 코드: ${response.status}`);
+    }
+
+    const result = {
+      type: 'chat',
+      answer: '',
+      document_content: null,
+      mode: null,
+      sources: [],
+      streamed: true,
+    };
+    let text = '';
+
+    const handleEvent = (event, data) => {
+      if (event === 'meta') {
+        Object.assign(result, {
+          request_id: data.request_id,
+          session_id: data.session_id,
+          type: data.type,
+          mode: data.mode,
+          sources: data.sources || [],
+        });
+        if (data.type === 'document') {
+          result.answer = data.answer || '';
+        }
+        onMeta?.(data);
+      } else if (event === 'token') {
+        text += data.delta;
+        onToken?.(data.delta);
+      } else if (event === 'done') {
+        result.latency_ms = data.latency_ms;
+      } else if (event === 'error') {
+        throw new Error(data.detail || '스트리밍 처리 중 오류가 발생했습니다.');
+      }
+    };
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // SSE 이벤트는 빈 줄("\n\n")로 구분
+      let sep;
+      while ((sep = buffer.indexOf('\n\n')) !== -1) {
+        const raw = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+
+        let event = 'message';
+        let data = '';
+        for (const line of raw.split('\n')) {
+          if (line.startsWith('event:')) event = line.slice(6).trim();
+          else if (line.startsWith('data:')) data += line.slice(5).trim();
+        }
+        if (data) handleEvent(event, JSON.parse(data));
+      }
+    }
+
+    if (result.type === 'document') {
+      result.document_content = text;
+    } else {
+      result.answer = text;
+    }
+
+    console.log('✅ [MediGuide] 스트리밍 완료:', result.type, result.latency_ms, 'ms');
+    return result;
+  }
+
   // 추천 질문 가져오기
   async getSuggestedQuestions() {
     try {
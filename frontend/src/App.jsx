@@ -174,8 +174,25 @@ export default function App() {
     try {
       console.log('⏳ [백엔드 호출 중...]');
       
-      // 백엔드 호출 (통합 엔드포인트)
-      const response = await watsonxService.sendMessage(msg);
+      // 백엔드 호출 (스트리밍 엔드포인트: 토큰이 도착하는 대로 점진 렌더링)
+      let streamed = "";
+      const renderStreamed = () =>
+        setMessagesForSession(sid, (prev) =>
+          prev.map((m) => (m.ts === assistantTs ? { ...m, content: streamed, isLoading: false } : m))
+        );
+
+      const response = await watsonxService.sendMessageStream(msg, {
+        onMeta: (meta) => {
+          if (meta.type === "document") {
+            streamed = `${meta.answer || "문서를 작성했습니다."}\n\n---\n\n`;
+            renderStreamed();
+          }
+        },
+        onToken: (delta) => {
+          streamed += delta;
+          renderStreamed();
+        },
+      });
 
       console.log('📥 [백엔드 응답 수신] 전체 응답:', JSON.stringify(response, null, 2));
       console.log('📥 [백엔드 응답] 타입:', response.type);
@@ -189,7 +206,9 @@ export default function App() {
         const docContent = response.document_content || "";
         const fullContent = `${answer}\n\n---\n\n${docContent}`;
         console.log('📝 [문서 내용 길이]:', fullContent.length, '자');
-        await simulateTyping(sid, assistantTs, fullContent);
+        if (!response.streamed) {
+          await simulateTyping(sid, assistantTs, fullContent);
+        }
         
       } else if (response.type === "chat") {
         console.log('💬 [일반 상담 모드]');
@@ -211,8 +230,10 @@ export default function App() {
         console.log('💬 [답변 길이]:', response.answer.length, '자');
         console.log('💬 [답변 내용 미리보기]:', response.answer.substring(0, 100) + '...');
         
-        // 일반 상담 응답
-        await simulateTyping(sid, assistantTs, response.answer);
+        // 일반 상담 응답 (스트리밍이면 이미 렌더링 완료)
+        if (!response.streamed) {
+          await simulateTyping(sid, assistantTs, response.answer);
+        }
         
         // TODO: sources 출처 카드 표시 (나중에 구현)
         